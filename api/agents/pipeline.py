@@ -0,0 +1,93 @@
+"""
+Minimal DAG executor for agent pipelines.
+
+Each step names the steps whose results it needs; those results are passed to
+it as keyword arguments. Steps run as soon as their inputs are ready: inline
+steps on the caller's thread (anything touching the caller's DB session, which
+is not thread-safe) and the rest, typically LLM calls, on a shared thread pool.
+"""
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+PIPELINE_WORKERS = int(os.getenv("AGENT_PIPELINE_WORKERS", "8"))
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    # Dedicated pool: pipeline steps never wait on each other from inside it,
+    # so callers that are themselves on a worker pool cannot deadlock it
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=PIPELINE_WORKERS, thread_name_prefix="agent-step")
+        return _executor
+
+
+@dataclass
+class Step:
+    name: str
+    func: Callable[..., Any]
+    depends_on: Tuple[str, ...] = ()
+    inline: bool = False
+
+
+def run_pipeline(steps: Sequence[Step], results: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Run steps in dependency order with independent steps overlapping; returns
+    results by step name. `results` seeds values computed earlier. The first
+    failing step's exception is raised once in-flight steps have settled.
+    """
+    results = dict(results or {})
+    pending = {step.name: step for step in steps}
+    names = set(pending) | set(results)
+    for step in steps:
+        missing = [dep for dep in step.depends_on if dep not in names]
+        if missing:
+            raise ValueError(f"Step {step.name} depends on unknown steps: {missing}")
+
+    executor = _get_executor()
+    running = {}
+    error = None
+    while True:
+        if error is None:
+            ready = [
+                step for step in pending.values()
+                if all(dep in results for dep in step.depends_on)
+            ]
+            # Start background work first so it overlaps with inline steps
+            for step in ready:
+                if not step.inline:
+                    del pending[step.name]
+                    kwargs = {dep: results[dep] for dep in step.depends_on}
+                    running[executor.submit(step.func, **kwargs)] = step.name
+            inline = [step for step in ready if step.inline]
+            if inline:
+                step = inline[0]
+                del pending[step.name]
+                try:
+                    results[step.name] = step.func(**{dep: results[dep] for dep in step.depends_on})
+                except Exception as e:
+                    error = e
+                # Its result may unblock more steps
+                continue
+
+        if not running:
+            break
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            name = running.pop(future)
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                error = error or e
+
+    if error is not None:
+        raise error
+    if pending:
+        raise ValueError(f"Pipeline cannot make progress; blocked steps: {sorted(pending)}")
+    return results
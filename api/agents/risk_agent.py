@@ -3,14 +3,24 @@ Risk Assessment Agent for clinical risk evaluation
 """
 from typing import Dict, List, Optional, Tuple
 from api.services.ai_service import MedicalAIService
+from api.services.clinical_terms import clinical_terms
+from api.services.context_builder import ChartNote, build_chart_context
+from api.services.registry import get_ai_service
 from api.models.note import Note
 from api.models.patient import Patient
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 
+# Common risk factors, as clinical_terms concepts
+RISK_FACTOR_CONCEPTS = {
+    "hypertension", "diabetes", "infection", "fever", "pain", "shortness of breath",
+    "chest pain", "dizziness", "nausea", "vomiting", "bleeding", "swelling",
+    "confusion", "weakness", "fatigue", "weight loss", "weight gain"
+}
+
 class RiskAssessmentAgent:
-    def __init__(self):
-        self.ai_service = MedicalAIService()
+    def __init__(self, ai_service: Optional[MedicalAIService] = None):
+        self.ai_service = ai_service or get_ai_service()
     
     def generate_patient_risk_report(self, patient_id: int, db: Session) -> Dict[str, any]:
         """
@@ -38,16 +48,16 @@ class RiskAssessmentAgent:
                     "last_assessment": None
                 }
             
-            # Analyze all notes for comprehensive risk assessment
-            all_note_content = "\n\n".join([f"{note.title}: {note.content}" for note in notes])
-            patient_context = self._build_patient_context(patient, notes)
-            
-            # Get AI risk assessment
-            risk_analysis = self.ai_service.assess_risk(
-                note_content=all_note_content,
-                patient_history=[note.content for note in notes[:10]]  # Last 10 notes
+            # Recent and high-risk notes in full, older history summarized, within a token budget
+            chart_context = build_chart_context(
+                [ChartNote.from_note(note) for note in notes],
+                condense=self.ai_service.condense_history,
+                header=self._build_patient_context(patient, notes)
             )
             
+            # Get AI risk assessment; the packed context already carries the history
+            risk_analysis = self.ai_service.assess_risk(note_content=chart_context.text)
+            
             # Analyze trends
             trends = self._analyze_risk_trends(notes)
             
@@ -61,14 +71,15 @@ class RiskAssessmentAgent:
                 "patient_name": f"{patient.first_name} {patient.last_name}",
                 "patient_id": patient.patient_id,
                 "risk_level": risk_analysis["risk_level"],
-                "summary": risk_analysis["risk_analysis"],
-                "risks": self._extract_risk_factors(risk_analysis["risk_analysis"]),
+                "summary": risk_analysis.get("summary", ""),
+                "risks": self._extract_risk_factors(risk_analysis.get("summary", "")),
                 "recommendations": recommendations,
                 "escalation": escalation,
                 "trends": trends,
                 "last_assessment": datetime.now().isoformat(),
-                "monitoring_suggestions": risk_analysis.get("monitoring_suggestions", ""),
-                "escalation_criteria": risk_analysis.get("escalation_criteria", "")
+                "monitoring_suggestions": risk_analysis.get("monitoring_plan", ""),
+                "escalation_criteria": risk_analysis.get("escalation_criteria", ""),
+                "context": {"tokens": chart_context.tokens, **chart_context.stats}
             }
             
         except Exception as e:
@@ -173,21 +184,8 @@ class RiskAssessmentAgent:
     def _extract_risk_factors(self, risk_analysis_text: str) -> List[str]:
         """Extract specific risk factors from AI analysis"""
         # Simple extraction - in production, use more sophisticated NLP
-        risk_factors = []
-        
-        # Common risk factor keywords
-        risk_keywords = [
-            "hypertension", "diabetes", "infection", "fever", "pain", "shortness of breath",
-            "chest pain", "dizziness", "nausea", "vomiting", "bleeding", "swelling",
-            "confusion", "weakness", "fatigue", "weight loss", "weight gain"
-        ]
-        
-        text_lower = risk_analysis_text.lower()
-        for keyword in risk_keywords:
-            if keyword in text_lower:
-                risk_factors.append(keyword.title())
-        
-        return list(set(risk_factors))
+        found = clinical_terms.concepts(risk_analysis_text) & RISK_FACTOR_CONCEPTS
+        return [concept.title() for concept in sorted(found)]
     
     def _determine_escalation(self, risk_analysis: Dict, trends: List[Dict]) -> str:
         """Determine escalation requirements"""
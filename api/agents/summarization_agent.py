@@ -1,92 +1,49 @@
 """
 Summarization Agent for medical notes using LangChain
 """
-from typing import Dict, List, Optional
+import os
+from typing import Dict, List, Optional, Tuple
+from api.agents.pipeline import Step, run_pipeline
 from api.services.ai_service import MedicalAIService
+from api.services.clinical_terms import clinical_terms
+from api.services.registry import get_ai_service
 from api.models.note import Note
 from api.models.patient import Patient
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 
+# "fused" (one LLM call per note, falling back to separate calls) or "multi_call"
+NOTE_ANALYSIS_MODE = os.getenv("NOTE_ANALYSIS_MODE", "fused")
+
+# Conditions tagged on a note when its key findings mention them (clinical_terms concepts)
+TAG_CONCEPTS = {"hypertension", "diabetes", "infection", "pain", "fever", "cough", "shortness of breath"}
+
 class SummarizationAgent:
-    def __init__(self):
-        self.ai_service = MedicalAIService()
+    def __init__(self, ai_service: Optional[MedicalAIService] = None):
+        self.ai_service = ai_service or get_ai_service()
     
-    def process_note(self, note: Note, patient: Patient, db: Session) -> Dict[str, str]:
+    def process_note(self, note: Note, patient: Patient, db: Session,
+                     mode: Optional[str] = None) -> Dict[str, str]:
         """
-        Process a note and generate AI-powered summary and analysis
+        Process a note and generate AI-powered summary and analysis.
+        
+        mode "fused" (default, see NOTE_ANALYSIS_MODE) asks for summary, risk and
+        recommendations in one LLM call and falls back to the separate calls if that
+        response is unusable; "multi_call" always uses the separate calls.
         """
         try:
-            # Get patient context
-            patient_context = self._build_patient_context(patient, db)
-            
-            # Generate summary
-            if hasattr(self.ai_service, "summarize_note"):
-                summary_result = self.ai_service.summarize_note(
-                    note_content=note.content,
-                    note_type=note.note_type.value,
-                    patient_context=patient_context
-                )
-            else:
-                # Defensive fallback for older AI service implementations
-                summary_result = self.ai_service.summarize_medical_note(
-                    note_content=note.content,
-                    note_type=note.note_type.value,
-                    patient_history=None
-                )
-            
-            # Assess risk
-            patient_history = self._get_patient_history(patient.id, db)
-            if hasattr(self.ai_service, "assess_risk"):
-                risk_result = self.ai_service.assess_risk(
-                    note_content=note.content,
-                    patient_history=patient_history
-                )
-            else:
-                risk_result = self.ai_service.assess_patient_risk(
-                    note_content=note.content,
-                    patient_history=patient_history
-                )
-            
-            # Generate nurse recommendations if it's a nurse note
-            nurse_recommendations = {}
-            if note.note_type.value == "nurse_note":
-                if hasattr(self.ai_service, "generate_nurse_recommendations"):
-                    nurse_recommendations = self.ai_service.generate_nurse_recommendations(
-                        note_content=note.content,
-                        patient_context=patient_context
-                    )
-                else:
-                    nurse_recommendations = {}
-            
-            # Update note with AI results
-            note.summary = summary_result["summary"]
-            note.risk_level = _normalize_risk_level(risk_result.get("risk_level"))
-            
-            # Combine recommendations
-            all_recommendations = []
-            if summary_result.get("recommendations"):
-                all_recommendations.append(f"Clinical: {summary_result['recommendations']}")
-            if risk_result.get("recommendations"):
-                all_recommendations.append(f"Risk Management: {risk_result['recommendations']}")
-            if nurse_recommendations.get("nursing_actions"):
-                all_recommendations.append(f"Nursing: {nurse_recommendations['nursing_actions']}")
-            
-            note.recommendations = "\n\n".join(all_recommendations) if all_recommendations else None
-            
-            # Create tags from key findings
-            tags = self._extract_tags(summary_result, risk_result)
-            note.tags = ",".join(tags) if tags else None
+            # Read everything the worker threads need while still on the session's thread
+            note_content = note.content
+            note_type = note.note_type.value
+            patient_id = patient.id
             
+            analysis = self._run_analysis(note_content, note_type, mode, patient_id=patient_id, note_id=note.id, inputs=[
+                Step("patient_context", lambda: self._build_patient_context(patient, db), inline=True),
+                Step("patient_history", lambda: self._get_patient_history(patient_id, db), inline=True),
+            ])
+            result = self.apply_analysis(note, analysis)
             db.commit()
-            
-            return {
-                "success": True,
-                "summary": summary_result["summary"],
-                "risk_level": risk_result["risk_level"],
-                "recommendations": note.recommendations,
-                "tags": tags,
-                "nurse_recommendations": nurse_recommendations
-            }
+            return result
             
         except Exception as e:
             return {
@@ -99,6 +56,184 @@ class SummarizationAgent:
                 "nurse_recommendations": {}
             }
     
+    def analyze_note(self, note_content: str, note_type: str, patient_context: str,
+                     patient_history: List[str], patient_id: Optional[int] = None,
+                     mode: Optional[str] = None, batchable: bool = False,
+                     note_id: Optional[int] = None) -> Dict:
+        """
+        LLM analysis of a note from prefetched inputs. Touches no database session,
+        so batch callers can run many of these on worker threads; they pass
+        `batchable` so short notes may share a fused-analysis request.
+        """
+        return self._run_analysis(note_content, note_type, mode, patient_id=patient_id, note_id=note_id, seeded={
+            "patient_context": patient_context,
+            "patient_history": patient_history,
+        }, batchable=batchable)
+    
+    def apply_analysis(self, note: Note, analysis: Dict) -> Dict:
+        """Copy an analysis onto the note (caller commits) and build the API result."""
+        summary_result = analysis["summary_result"]
+        risk_result = analysis["risk_result"]
+        nurse_recommendations = analysis["nurse_recommendations"]
+        
+        # Update note with AI results
+        note.summary = summary_result["summary"]
+        note.risk_level = _normalize_risk_level(risk_result.get("risk_level"))
+        
+        # Combine recommendations
+        all_recommendations = []
+        if summary_result.get("recommendations"):
+            all_recommendations.append(f"Clinical: {summary_result['recommendations']}")
+        if risk_result.get("recommendations"):
+            all_recommendations.append(f"Risk Management: {risk_result['recommendations']}")
+        if nurse_recommendations.get("nursing_actions"):
+            all_recommendations.append(f"Nursing: {nurse_recommendations['nursing_actions']}")
+        
+        note.recommendations = "\n\n".join(all_recommendations) if all_recommendations else None
+        
+        # Create tags from key findings
+        tags = self._extract_tags(summary_result, risk_result)
+        note.tags = ",".join(tags) if tags else None
+        
+        return {
+            "success": True,
+            "summary": summary_result["summary"],
+            "risk_level": risk_result["risk_level"],
+            "recommendations": note.recommendations,
+            "tags": tags,
+            "nurse_recommendations": nurse_recommendations,
+            "analysis_mode": analysis["mode"]
+        }
+    
+    def _run_analysis(self, note_content: str, note_type: str, mode: Optional[str],
+                      inputs: Optional[List[Step]] = None, seeded: Optional[Dict] = None,
+                      patient_id: Optional[int] = None, batchable: bool = False,
+                      note_id: Optional[int] = None) -> Dict:
+        """
+        Run the analysis DAG. Context and history come either from `inputs` steps
+        or already computed in `seeded`.
+        """
+        mode = mode or NOTE_ANALYSIS_MODE
+        steps = list(inputs or [])
+        use_fused = mode == "fused" and hasattr(self.ai_service, "analyze_note_fused")
+        if use_fused:
+            steps.append(Step(
+                "fused",
+                lambda patient_context, patient_history: self._analyze_fused(
+                    note_content, note_type, patient_context, patient_history, batchable
+                ),
+                depends_on=("patient_context", "patient_history")
+            ))
+        else:
+            steps += self._multi_call_steps(note_content, note_type, patient_id, note_id)
+        results = run_pipeline(steps, seeded)
+        
+        if use_fused and results["fused"] is not None:
+            summary_result, risk_result, nurse_recommendations = results["fused"]
+            used_mode = "fused"
+        else:
+            if use_fused:
+                results = run_pipeline(self._multi_call_steps(note_content, note_type, patient_id, note_id), results)
+            summary_result = results["summary"]
+            risk_result = results["risk"]
+            nurse_recommendations = results.get("nurse_recommendations") or {}
+            used_mode = "multi_call"
+        
+        return {
+            "summary_result": summary_result,
+            "risk_result": risk_result,
+            "nurse_recommendations": nurse_recommendations,
+            "mode": used_mode
+        }
+    
+    def _analyze_fused(self, note_content: str, note_type: str, patient_context: str,
+                       patient_history: List[str], batchable: bool = False) -> Optional[Tuple]:
+        """One structured LLM call, reshaped into the results of the separate calls."""
+        fused = self.ai_service.analyze_note_fused(
+            note_content=note_content,
+            note_type=note_type,
+            patient_context=patient_context,
+            patient_history=patient_history,
+            batchable=batchable
+        )
+        if not fused:
+            return None
+        return self._reshape_fused(fused, note_type)
+    
+    def analysis_from_fused(self, fused: Dict, note_type: str) -> Dict:
+        """Analysis for apply_analysis from a fused result obtained elsewhere, e.g. a streamed response."""
+        summary_result, risk_result, nurse_recommendations = self._reshape_fused(fused, note_type)
+        return {
+            "summary_result": summary_result,
+            "risk_result": risk_result,
+            "nurse_recommendations": nurse_recommendations,
+            "mode": "fused"
+        }
+    
+    @staticmethod
+    def _reshape_fused(fused: Dict, note_type: str) -> Tuple:
+        summary_result = {
+            "summary": fused["summary"],
+            "key_findings": fused["key_findings"],
+            "recommendations": "; ".join(fused["recommendations"]) or None
+        }
+        risk_result = {
+            "risk_level": fused["risk_level"],
+            "risk_factors": fused["risk_factors"]
+        }
+        nurse_recommendations = {}
+        if note_type == "nurse_note" and fused["nursing_actions"]:
+            nurse_recommendations = {
+                "nursing_actions": "; ".join(fused["nursing_actions"]),
+                "ai_generated": True
+            }
+        return summary_result, risk_result, nurse_recommendations
+    
+    def _multi_call_steps(self, note_content: str, note_type: str,
+                          patient_id: Optional[int] = None, note_id: Optional[int] = None) -> List[Step]:
+        """Separate summary, risk and (for nurse notes) nursing calls; each waits only for its own inputs."""
+        def summarize(patient_context):
+            if hasattr(self.ai_service, "summarize_note"):
+                return self.ai_service.summarize_note(
+                    note_content=note_content,
+                    note_type=note_type,
+                    patient_context=patient_context,
+                    patient_id=patient_id,
+                    note_id=note_id
+                )
+            # Defensive fallback for older AI service implementations
+            return self.ai_service.summarize_medical_note(
+                note_content=note_content,
+                note_type=note_type,
+                patient_history=None
+            )
+        
+        def assess(patient_history):
+            if hasattr(self.ai_service, "assess_risk"):
+                return self.ai_service.assess_risk(
+                    note_content=note_content,
+                    patient_history=patient_history
+                )
+            return self.ai_service.assess_patient_risk(
+                note_content=note_content,
+                patient_history=patient_history
+            )
+        
+        steps = [
+            Step("summary", summarize, depends_on=("patient_context",)),
+            Step("risk", assess, depends_on=("patient_history",)),
+        ]
+        if note_type == "nurse_note" and hasattr(self.ai_service, "generate_nurse_recommendations"):
+            steps.append(Step(
+                "nurse_recommendations",
+                lambda patient_context: self.ai_service.generate_nurse_recommendations(
+                    note_content=note_content,
+                    patient_context=patient_context
+                ),
+                depends_on=("patient_context",)
+            ))
+        return steps
+    
     def _build_patient_context(self, patient: Patient, db: Session) -> str:
         """Build comprehensive patient context"""
         context_parts = [
@@ -123,6 +258,52 @@ class SummarizationAgent:
         
         return [f"{note.title}: {note.content[:200]}..." for note in recent_notes]
     
+    def load_batch(self, note_ids: List[int], db: Session) -> Tuple[Dict[int, Note], Dict[int, Tuple]]:
+        """
+        Notes plus analyze_note() arguments for each, loaded with one query for notes,
+        one for patients and one for all patients' histories.
+        """
+        notes = {note.id: note for note in db.query(Note).filter(Note.id.in_(note_ids)).all()}
+        patient_ids = {note.patient_id for note in notes.values()}
+        patients = {
+            patient.id: patient
+            for patient in db.query(Patient).filter(Patient.id.in_(patient_ids)).all()
+        }
+        histories = self.get_patient_histories(list(patients), db)
+        
+        inputs = {}
+        for note_id, note in notes.items():
+            patient = patients.get(note.patient_id)
+            if patient is not None:
+                inputs[note_id] = (
+                    note.content,
+                    note.note_type.value,
+                    self._build_patient_context(patient, db),
+                    histories.get(patient.id, []),
+                    patient.id
+                )
+        return notes, inputs
+    
+    def get_patient_histories(self, patient_ids: List[int], db: Session) -> Dict[int, List[str]]:
+        """Recent history for many patients in one query (five latest notes each)"""
+        if not patient_ids:
+            return {}
+        rank = func.row_number().over(
+            partition_by=Note.patient_id,
+            order_by=(Note.created_at.desc(), Note.id.desc())
+        ).label("rank")
+        ranked = db.query(
+            Note.patient_id, Note.title, Note.content, rank
+        ).filter(Note.patient_id.in_(patient_ids)).subquery()
+        rows = db.query(
+            ranked.c.patient_id, ranked.c.title, ranked.c.content
+        ).filter(ranked.c.rank <= 5).order_by(ranked.c.patient_id, ranked.c.rank).all()
+        
+        histories = {patient_id: [] for patient_id in patient_ids}
+        for patient_id, title, content in rows:
+            histories[patient_id].append(f"{title}: {content[:200]}...")
+        return histories
+    
     def _extract_tags(self, summary_result: Dict, risk_result: Dict) -> List[str]:
         """Extract relevant tags from AI analysis"""
         tags = []
@@ -130,16 +311,15 @@ class SummarizationAgent:
         # Extract from summary
         if summary_result.get("key_findings"):
             # Simple keyword extraction (in production, use more sophisticated NLP)
-            keywords = ["hypertension", "diabetes", "infection", "pain", "fever", "cough", "shortness of breath"]
-            for keyword in keywords:
-                if keyword.lower() in summary_result["key_findings"].lower():
-                    tags.append(keyword.title())
+            found = clinical_terms.concepts(summary_result["key_findings"]) & TAG_CONCEPTS
+            # Sorted: set order varies between processes, and tags are stored on the note
+            tags.extend(concept.title() for concept in sorted(found))
         
         # Add risk level as tag
         if risk_result.get("risk_level"):
             tags.append(f"Risk-{risk_result['risk_level']}")
         
-        return list(set(tags))  # Remove duplicates
+        return list(dict.fromkeys(tags))  # Remove duplicates, keeping order
 def _normalize_risk_level(value: Optional[str]) -> Optional[str]:
     if not value:
         return value
@@ -19,3 +19,7 @@ def get_db():
         yield db
     finally:
         db.close()
+
+def get_session_factory():
+    """Session factory for handlers that open several sessions, e.g. one per concurrent task."""
+    return SessionLocal
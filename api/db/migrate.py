@@ -0,0 +1,195 @@
+"""
+Explicit schema step, run once per deploy instead of on every API start.
+
+    python -m api.db.migrate           # create missing tables, then apply pending migrations
+    python -m api.db.migrate --check   # exit 1 if tables, columns, indexes or migrations are missing
+
+New tables are created whole from the models. Changes to tables that already
+exist (added columns, indexes, constraints) are versioned steps in MIGRATIONS,
+applied in order and recorded in schema_migrations. Each step checks the live
+schema first, so on a new database, where create_all has already built the
+current tables, it only gets recorded.
+"""
+import argparse
+import sys
+from contextlib import nullcontext
+from typing import Callable, List, Set, Tuple
+
+from sqlalchemy import Column, DateTime, MetaData, String, Table, inspect, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.sql import func
+
+from api.db.database import Base, engine
+# Every model module must be imported so its tables are registered on Base.metadata
+from api.models import appointment, audit, note, patient, patient_summary, reminder, user  # noqa: F401
+
+# Kept off Base.metadata: it describes the migration state, not the models
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", String(64), primary_key=True),
+    Column("applied_at", DateTime(timezone=True), server_default=func.now()),
+)
+
+
+def _add_columns(connection: Connection, table_name: str, *column_names: str):
+    """ALTER TABLE ... ADD COLUMN for model columns the table lacks. Added columns must be nullable."""
+    table = Base.metadata.tables[table_name]
+    existing = {column["name"] for column in inspect(connection).get_columns(table_name)}
+    for name in column_names:
+        if name in existing:
+            continue
+        column = table.c[name]
+        column_type = column.type.compile(dialect=connection.dialect)
+        connection.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {name} {column_type}"))
+
+
+def _index_names(bind, table_name: str) -> Set[str]:
+    if bind.dialect.name == "sqlite":
+        # The SQLite inspector skips expression indexes
+        with bind.connect() if isinstance(bind, Engine) else nullcontext(bind) as connection:
+            return set(connection.execute(
+                text("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :table"),
+                {"table": table_name},
+            ).scalars())
+    return {index["name"] for index in inspect(bind).get_indexes(table_name)}
+
+
+def _create_indexes(connection: Connection, table_name: str, *index_names: str):
+    """Create the model's named indexes on an existing table, skipping those already there."""
+    existing = _index_names(connection, table_name)
+    for index in Base.metadata.tables[table_name].indexes:
+        if index.name in index_names and index.name not in existing:
+            index.create(connection)
+
+
+def _appointment_overlap_constraints(connection: Connection):
+    """Postgres only. Fails if existing active bookings already overlap; resolve those first."""
+    if connection.dialect.name != "postgresql":
+        return
+    connection.execute(text("CREATE EXTENSION IF NOT EXISTS btree_gist"))
+    existing = set(connection.execute(
+        text("SELECT conname FROM pg_constraint WHERE conrelid = 'appointments'::regclass")
+    ).scalars())
+    for name, column in (("ex_appointments_location_overlap", "location"),
+                         ("ex_appointments_creator_overlap", "created_by")):
+        if name not in existing:
+            connection.execute(text(
+                f"ALTER TABLE appointments ADD CONSTRAINT {name}"
+                f" EXCLUDE USING gist ({column} WITH =, tstzrange(start_time, end_time, '[)') WITH &&)"
+                " WHERE (status <> 'cancelled')"
+            ))
+
+
+def _appointment_revision_triggers(connection: Connection):
+    """SQLite only. Every write to appointments sets a new random revision, which
+    tells each process's conflict interval trees that they are stale."""
+    if connection.dialect.name != "sqlite":
+        return
+    connection.execute(text(
+        "CREATE TABLE IF NOT EXISTS appointment_revision"
+        " (id INTEGER PRIMARY KEY CHECK (id = 1), revision INTEGER NOT NULL)"
+    ))
+    connection.execute(text("INSERT OR IGNORE INTO appointment_revision (id, revision) VALUES (1, random())"))
+    for operation in ("INSERT", "UPDATE", "DELETE"):
+        connection.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS appointments_revision_{operation.lower()}"
+            f" AFTER {operation} ON appointments"
+            " BEGIN UPDATE appointment_revision SET revision = random() WHERE id = 1; END"
+        ))
+
+
+# (version, step), oldest first. Never edit or reorder an applied step; append a new one.
+MIGRATIONS: List[Tuple[str, Callable[[Connection], None]]] = [
+    ("0001_patient_contact_columns", lambda c: _add_columns(c, "patients", "email", "phone")),
+    ("0002_appointment_window_indexes", lambda c: _create_indexes(
+        c, "appointments",
+        "ix_appointments_start_end", "ix_appointments_location_start", "ix_appointments_creator_start",
+    )),
+    ("0003_appointment_sync_index", lambda c: _create_indexes(c, "appointments", "ix_appointments_creator_changed")),
+    ("0004_appointment_overlap_constraints", _appointment_overlap_constraints),
+    ("0005_appointment_revision_triggers", _appointment_revision_triggers),
+    ("0006_reminder_ledger_claims", lambda c: _add_columns(c, "reminder_ledger", "status", "claimed_at")),
+    ("0007_user_calendar_feed_rotation", lambda c: _add_columns(c, "users", "calendar_feed_rotation")),
+]
+
+
+def missing_tables(bind=engine) -> List[str]:
+    existing = set(inspect(bind).get_table_names())
+    return sorted(name for name in Base.metadata.tables if name not in existing)
+
+
+def applied_migrations(bind=engine) -> List[str]:
+    if not inspect(bind).has_table(schema_migrations.name):
+        return []
+    with bind.connect() as connection:
+        return [row.version for row in connection.execute(schema_migrations.select())]
+
+
+def pending_migrations(bind=engine) -> List[str]:
+    applied = set(applied_migrations(bind))
+    return [version for version, _ in MIGRATIONS if version not in applied]
+
+
+def schema_problems(bind=engine) -> List[str]:
+    """What the live schema lacks compared with the models; empty when up to date."""
+    inspector = inspect(bind)
+    existing_tables = set(inspector.get_table_names())
+    problems = []
+    missing = sorted(name for name in Base.metadata.tables if name not in existing_tables)
+    if missing:
+        problems.append(f"missing tables: {', '.join(missing)}")
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        absent = [column.name for column in table.columns if column.name not in columns]
+        if absent:
+            problems.append(f"missing columns on {table.name}: {', '.join(absent)}")
+        indexes = _index_names(bind, table.name)
+        absent = sorted(index.name for index in table.indexes if index.name and index.name not in indexes)
+        if absent:
+            problems.append(f"missing indexes on {table.name}: {', '.join(absent)}")
+    pending = pending_migrations(bind)
+    if pending:
+        problems.append(f"pending migrations: {', '.join(pending)}")
+    return problems
+
+
+def migrate(bind=engine) -> List[str]:
+    """Create missing tables, then apply pending migrations; returns what was done."""
+    done = [f"created table {name}" for name in missing_tables(bind)]
+    Base.metadata.create_all(bind=bind)
+    schema_migrations.create(bind, checkfirst=True)
+    applied = set(applied_migrations(bind))
+    for version, step in MIGRATIONS:
+        if version in applied:
+            continue
+        # One transaction per step, so a failure leaves earlier steps recorded
+        with bind.begin() as connection:
+            step(connection)
+            connection.execute(schema_migrations.insert().values(version=version))
+        done.append(f"applied {version}")
+    return done
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Create or check the database schema")
+    parser.add_argument("--check", action="store_true", help="only report what the schema lacks")
+    args = parser.parse_args(argv)
+
+    if args.check:
+        problems = schema_problems()
+        if problems:
+            print("\n".join(problems))
+            return 1
+        print("Schema is up to date")
+        return 0
+
+    done = migrate()
+    print("\n".join(done) if done else "Schema is up to date")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,21 +1,20 @@
-from fastapi import FastAPI
+import asyncio
+
+from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
+from sqlalchemy.orm import Session
 
-from api.db.database import engine, Base
+from api.db.database import get_db
 from api.routes import auth, patients, notes, ai, appointments, tasks
-from api.services.cloud_tasks_service import ensure_queue_exists
+from api.services.startup import readiness, start_background_startup, warm_up
 
-# Create database tables
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Create tables
-    Base.metadata.create_all(bind=engine)
-    # Ensure Cloud Tasks queue exists
-    try:
-        ensure_queue_exists()
-    except Exception as e:
-        print(f"Warning: Could not ensure Cloud Tasks queue exists: {e}")
+    # Schema changes run as a deploy step (python -m api.db.migrate); queue
+    # provisioning and warm-up happen in the background so serving starts at once
+    start_background_startup()
     yield
 
 app = FastAPI(
@@ -48,4 +47,16 @@ def healthcheck():
 
 @app.get("/health")
 def health():
+    """Liveness: the process is up; makes no external calls."""
     return {"status": "healthy", "version": "1.0.0"}
+
+@app.get("/ready")
+def ready(db: Session = Depends(get_db)):
+    """Readiness: the database is reachable and migrated."""
+    result = readiness(db)
+    return JSONResponse(result, status_code=200 if result["ready"] else 503)
+
+@app.get("/warmup")
+async def warmup():
+    """Pre-open DB connections and build the shared AI service and caches."""
+    return await asyncio.to_thread(warm_up)
@@ -6,6 +6,7 @@ from sqlalchemy import (
     Text,
     DateTime,
     ForeignKey,
+    Index,
 )
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -15,6 +16,17 @@ from api.db.database import Base
 
 class Appointment(Base):
     __tablename__ = "appointments"
+    __table_args__ = (
+        # Calendar reads are always bounded windows on start_time; the trailing
+        # columns let utilization aggregates run from the index alone
+        Index(
+            "ix_appointments_start_end",
+            "start_time", "end_time", "status", "location", "created_by",
+        ),
+        # Per-room and per-clinician conflict checks
+        Index("ix_appointments_location_start", "location", "start_time"),
+        Index("ix_appointments_creator_start", "created_by", "start_time"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(255), nullable=False)
@@ -32,3 +44,69 @@ class Appointment(Base):
 
     patient = relationship("Patient", backref="appointments")
     creator = relationship("User")
+
+
+# On Postgres, overlapping active bookings for the same room or clinician are
+# rejected by GiST exclusion constraints over tstzrange(start_time, end_time),
+# added by migration 0004 (api/db/migrate.py).
+
+
+class AppointmentSeries(Base):
+    """
+    A recurring appointment stored as a rule. Occurrences are never materialized;
+    they are expanded on read, only inside the requested window.
+    """
+    __tablename__ = "appointment_series"
+    __table_args__ = (
+        Index("ix_appointment_series_window", "start_time", "until"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    title = Column(String(255), nullable=False)
+    patient_name = Column(String(255), nullable=False)
+    patient_id = Column(Integer, ForeignKey("patients.id"), nullable=True)
+    appointment_type = Column(String(50), nullable=False)
+    status = Column(String(50), default="confirmed")
+    location = Column(String(255), nullable=False)
+    notes = Column(Text, nullable=True)
+    # First occurrence; its time of day applies to every occurrence
+    start_time = Column(DateTime(timezone=True), nullable=False)
+    duration_minutes = Column(Integer, nullable=False)
+    frequency = Column(String(20), nullable=False)  # "daily" or "weekly"
+    interval = Column(Integer, nullable=False, default=1)
+    by_weekday = Column(String(20), nullable=True)  # "0,2,4" (Mon=0) for weekly series
+    count = Column(Integer, nullable=True)
+    until = Column(DateTime(timezone=True), nullable=True)
+    created_by = Column(Integer, ForeignKey("users.id"), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    patient = relationship("Patient")
+    creator = relationship("User")
+
+
+# Incremental calendar sync scans each clinician's rows by last change
+Index(
+    "ix_appointments_creator_changed",
+    Appointment.created_by,
+    func.coalesce(Appointment.updated_at, Appointment.created_at),
+)
+Index(
+    "ix_appointment_series_creator_changed",
+    AppointmentSeries.created_by,
+    func.coalesce(AppointmentSeries.updated_at, AppointmentSeries.created_at),
+)
+
+
+class AppointmentTombstone(Base):
+    """Record of a deleted appointment or series, so sync clients can drop their copy."""
+    __tablename__ = "appointment_tombstones"
+    __table_args__ = (
+        Index("ix_appointment_tombstones_creator_deleted", "created_by", "deleted_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(20), nullable=False)  # "appointment" or "series"
+    item_id = Column(Integer, nullable=False)
+    created_by = Column(Integer, ForeignKey("users.id"), nullable=False)
+    deleted_at = Column(DateTime(timezone=True), server_default=func.now())
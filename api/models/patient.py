@@ -16,6 +16,8 @@ class Patient(Base):
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     # Additional patient info
+    email = Column(String, nullable=True)
+    phone = Column(String, nullable=True)
     emergency_contact = Column(Text, nullable=True)
     allergies = Column(Text, nullable=True)
     medical_history = Column(Text, nullable=True)
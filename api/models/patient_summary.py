@@ -0,0 +1,16 @@
+from sqlalchemy import Column, Integer, Text, DateTime, ForeignKey
+from sqlalchemy.sql import func
+from api.db.database import Base
+
+class PatientSummary(Base):
+    """Rolling AI overview of a patient, updated by folding in notes it doesn't cover yet."""
+    __tablename__ = "patient_summaries"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    patient_id = Column(Integer, ForeignKey("patients.id", ondelete="CASCADE"), unique=True, nullable=False)
+    summary = Column(Text, nullable=False)
+    # JSON object of note id -> note version the summary reflects (hash of status and content, see note_versions)
+    covered_notes = Column(Text, nullable=False, default="{}")
+    # Bumped on every write; updates only apply over the version they were computed from
+    version = Column(Integer, nullable=False, default=1)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
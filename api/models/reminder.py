@@ -0,0 +1,25 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Index, UniqueConstraint
+from api.db.database import Base
+
+class ReminderLedger(Base):
+    """
+    One row per reminder, so each appointment is reminded once per channel and start time.
+    A run claims its rows (status "pending") before sending and marks them "sent" or "failed" after.
+    """
+    __tablename__ = "reminder_ledger"
+    __table_args__ = (
+        # A rescheduled appointment has a new start time and is reminded again
+        UniqueConstraint("appointment_id", "channel", "scheduled_start", name="uq_reminder_ledger_delivery"),
+        Index("ix_reminder_ledger_scheduled_start", "scheduled_start"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    appointment_id = Column(Integer, ForeignKey("appointments.id", ondelete="CASCADE"), nullable=False)
+    channel = Column(String(20), nullable=False)  # "email" or "sms"
+    recipient = Column(String, nullable=False)
+    scheduled_start = Column(DateTime(timezone=True), nullable=False)
+    provider_message = Column(Text, nullable=True)
+    # "pending", "sent" or "failed"; rows from before claiming existed have none and count as sent
+    status = Column(String(20), nullable=True)
+    claimed_at = Column(DateTime(timezone=True), nullable=True)
+    sent_at = Column(DateTime(timezone=True), nullable=True)
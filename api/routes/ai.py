@@ -1,24 +1,44 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import asyncio
+import json
+import os
 
-from api.db.database import get_db
+from api.db.database import SessionLocal, get_db
 from api.models.user import User
 from api.models.patient import Patient
 from api.models.note import Note
 from api.deps import get_current_active_user
-from api.agents.summarization_agent import SummarizationAgent
-from api.agents.risk_agent import RiskAssessmentAgent
 from api.services.cloud_tasks_service import create_ai_summarization_task, create_risk_assessment_task
-from api.services.ai_service import MedicalAIService
+from api.services.patient_summary import (
+    refresh_patient_summary,
+    stream_patient_summary_update,
+    summary_state,
+    update_patient_summary,
+)
+from api.services.registry import get_ai_service, get_risk_agent, get_summarization_agent
+from api.services.timeline_service import (
+    InvalidCursor,
+    get_timeline_page,
+    get_timeline_statistics,
+    journey_summary_cache,
+    journey_summary_inputs,
+    refresh_journey_summary,
+)
 
 router = APIRouter(prefix="/ai", tags=["ai"])
 
-# Initialize agents
-summarization_agent = SummarizationAgent()
-risk_agent = RiskAssessmentAgent()
-ai_service = MedicalAIService()
+# Notes analyzed at once per batch request; bounds concurrent LLM calls
+BATCH_SUMMARIZE_CONCURRENCY = int(os.getenv("BATCH_SUMMARIZE_CONCURRENCY", "8"))
+BATCH_SUMMARIZE_MAX_NOTES = 500
+
+# Keep proxies from buffering server-sent events
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+def _sse(event: str, data: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
 @router.post("/summarize/{note_id}")
 async def summarize_note(
@@ -64,7 +84,7 @@ async def summarize_note_sync(
             raise HTTPException(status_code=404, detail="Patient not found")
         
         # Process note with AI
-        result = summarization_agent.process_note(note, patient, db)
+        result = get_summarization_agent().process_note(note, patient, db)
         
         if result["success"]:
             return {
@@ -80,6 +100,70 @@ async def summarize_note_sync(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing note: {str(e)}")
 
+@router.post("/summarize/{note_id}/stream")
+async def summarize_note_stream(
+    note_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Summarize a note, streaming the model output as server-sent events: "token"
+    events while it generates, then "result" (same fields as /sync, saved to the
+    note) or "error", then "done".
+    """
+    notes, jobs = get_summarization_agent().load_batch([note_id], db)
+    if note_id not in notes:
+        raise HTTPException(status_code=404, detail="Note not found")
+    if note_id not in jobs:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    
+    return StreamingResponse(
+        _stream_note_summary(note_id, jobs[note_id]), media_type="text/event-stream", headers=SSE_HEADERS
+    )
+
+def _stream_note_summary(note_id: int, job: tuple):
+    # A plain generator: Starlette iterates it on a worker thread, so blocking reads
+    # from the model don't stall the event loop
+    summarization_agent = get_summarization_agent()
+    ai_service = summarization_agent.ai_service
+    note_content, note_type, patient_context, patient_history, _ = job
+    
+    parts = []
+    try:
+        for text in ai_service.stream_note_analysis(note_content, note_type, patient_context, patient_history):
+            parts.append(text)
+            yield _sse("token", {"text": text})
+    except Exception as e:
+        print(f"Streaming note analysis failed: {e}")
+    
+    fused = ai_service.parse_fused_analysis("".join(parts)) if parts else None
+    db = SessionLocal()
+    try:
+        if fused:
+            analysis = summarization_agent.analysis_from_fused(fused, note_type)
+        else:
+            # Unusable or no streamed output: same fallback as the fused path in process_note
+            analysis = summarization_agent.analyze_note(*job, mode="multi_call", note_id=note_id)
+        note = db.get(Note, note_id)
+        if note is None:
+            raise ValueError("Note not found")
+        result = summarization_agent.apply_analysis(note, analysis)
+        db.commit()
+        yield _sse("result", {
+            "message": "Note summarized successfully",
+            "summary": result["summary"],
+            "risk_level": result["risk_level"],
+            "recommendations": result["recommendations"],
+            "tags": result["tags"],
+            "analysis_mode": result["analysis_mode"]
+        })
+    except Exception as e:
+        db.rollback()
+        yield _sse("error", {"detail": f"Error processing note: {str(e)}"})
+    finally:
+        db.close()
+    yield _sse("done", {})
+
 @router.get("/risk-report/{patient_id}")
 async def get_patient_risk_report(
     patient_id: int,
@@ -88,7 +172,7 @@ async def get_patient_risk_report(
 ):
     """Get comprehensive risk report for a patient"""
     try:
-        risk_report = risk_agent.generate_patient_risk_report(patient_id, db)
+        risk_report = get_risk_agent().generate_patient_risk_report(patient_id, db)
         
         if "error" in risk_report:
             raise HTTPException(status_code=404, detail=risk_report["error"])
@@ -106,7 +190,7 @@ async def get_high_risk_patients(
 ):
     """Get list of high-risk patients"""
     try:
-        high_risk_patients = risk_agent.get_high_risk_patients(db, limit)
+        high_risk_patients = get_risk_agent().get_high_risk_patients(db, limit)
         return {
             "high_risk_patients": high_risk_patients,
             "count": len(high_risk_patients)
@@ -118,46 +202,106 @@ async def get_high_risk_patients(
 @router.post("/batch-summarize")
 async def batch_summarize_notes(
     request_data: Dict[str, List[int]],
-    db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    """Batch process multiple notes for AI summarization"""
+    """
+    Batch process multiple notes for AI summarization.
+    Streams one NDJSON line per note as it completes, then a final totals line.
+    """
+    note_ids = list(dict.fromkeys(request_data.get("note_ids", [])))
+    if not note_ids:
+        raise HTTPException(status_code=400, detail="note_ids must not be empty")
+    if len(note_ids) > BATCH_SUMMARIZE_MAX_NOTES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {BATCH_SUMMARIZE_MAX_NOTES} notes per batch"
+        )
+    
+    return StreamingResponse(_stream_batch_summaries(note_ids), media_type="application/x-ndjson")
+
+async def _stream_batch_summaries(note_ids: List[int]):
+    # The request's session is gone by the time the body streams, so use our own;
+    # every use of it is awaited in turn, never from two threads at once. Loaded notes
+    # stay usable across the per-note commits instead of being reloaded one by one.
+    summarization_agent = get_summarization_agent()
+    db = SessionLocal(expire_on_commit=False)
     try:
-        note_ids = request_data.get("note_ids", [])
-        results = []
-        
+        notes, jobs = await asyncio.to_thread(summarization_agent.load_batch, note_ids, db)
+        processed = failed = 0
         for note_id in note_ids:
-            note = db.query(Note).filter(Note.id == note_id).first()
-            if note:
-                patient = db.query(Patient).filter(Patient.id == note.patient_id).first()
-                if patient:
-                    result = summarization_agent.process_note(note, patient, db)
-                    results.append({
-                        "note_id": note_id,
-                        "success": result["success"],
-                        "summary": result.get("summary"),
-                        "risk_level": result.get("risk_level"),
-                        "error": result.get("error")
-                    })
+            if note_id not in jobs:
+                failed += 1
+                error = "Note not found" if note_id not in notes else "Patient not found"
+                yield json.dumps({"note_id": note_id, "success": False, "error": error}) + "\n"
         
-        return {
-            "message": f"Processed {len(results)} notes",
-            "results": results
-        }
-    
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error in batch processing: {str(e)}")
+        semaphore = asyncio.Semaphore(BATCH_SUMMARIZE_CONCURRENCY)
+        
+        async def analyze(note_id: int):
+            async with semaphore:
+                try:
+                    analysis = await asyncio.to_thread(
+                        summarization_agent.analyze_note, *jobs[note_id], batchable=True, note_id=note_id
+                    )
+                    return note_id, analysis, None
+                except Exception as e:
+                    return note_id, None, e
+        
+        def save(note_id: int, analysis: Dict) -> Dict:
+            try:
+                result = summarization_agent.apply_analysis(notes[note_id], analysis)
+                db.commit()
+                return result
+            except Exception:
+                db.rollback()
+                raise
+        
+        for next_done in asyncio.as_completed([analyze(note_id) for note_id in jobs]):
+            note_id, analysis, error = await next_done
+            if error is None:
+                try:
+                    result = await asyncio.to_thread(save, note_id, analysis)
+                except Exception as e:
+                    error = e
+            if error is not None:
+                failed += 1
+                line = {"note_id": note_id, "success": False, "error": str(error)}
+            else:
+                processed += 1
+                line = {
+                    "note_id": note_id,
+                    "success": True,
+                    "summary": result.get("summary"),
+                    "risk_level": result.get("risk_level"),
+                    "error": None
+                }
+            yield json.dumps(line) + "\n"
+        
+        yield json.dumps({
+            "done": True,
+            "message": f"Processed {processed} notes",
+            "processed": processed,
+            "failed": failed
+        }) + "\n"
+    finally:
+        db.close()
 
 @router.get("/ai-status")
 async def get_ai_status():
     """Check AI service status and configuration"""
     try:
         # Test AI service availability
+        ai_service = get_ai_service()
         return {
             "status": "operational" if ai_service.enabled else "disabled",
             "openai_configured": bool(ai_service.enabled and hasattr(ai_service, 'openai_api_key') and ai_service.openai_api_key),
             "models_available": ai_service.enabled,
-            "vector_store_ready": ai_service.enabled and ai_service.vectorstore is not None
+            "llm_backend": getattr(ai_service, "llm_backend", None),
+            "vector_store_ready": bool((ai_service.vector_index_stats() or {}).get("vectors")),
+            "embeddings_provider": ai_service.embeddings.model if ai_service.embeddings else None,
+            "vector_index": ai_service.vector_index_stats(),
+            "embedding_cache": ai_service.embeddings.cache.stats() if getattr(getattr(ai_service, "embeddings", None), "cache", None) else None,
+            "llm_cache": ai_service.response_cache.stats() if getattr(ai_service, "response_cache", None) else None,
+            "micro_batching": ai_service.note_batcher.stats() if getattr(ai_service, "note_batcher", None) else None
         }
     
     except Exception as e:
@@ -172,134 +316,103 @@ async def get_ai_status():
 @router.post("/patient-summary/{patient_id}")
 async def get_patient_summary(
     patient_id: int,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """
-    Generate a concise 3-4 line summary for a patient from recent notes.
+    Concise 3-4 line summary of a patient, maintained as notes are written.
+    The stored summary is returned immediately with how many notes it doesn't
+    cover yet; a stale summary is brought up to date in the background. Only a
+    patient's first summary is generated during the request.
     """
     patient = db.query(Patient).filter(Patient.id == patient_id).first()
     if not patient:
         raise HTTPException(status_code=404, detail="Patient not found")
 
-    # Pull recent notes for context
-    recent_notes = (
-        db.query(Note)
-        .filter(Note.patient_id == patient_id)
-        .order_by(Note.created_at.desc())
-        .limit(10)
-        .all()
-    )
-    note_texts = [n.content or "" for n in recent_notes if n.content]
+    state = summary_state(db, patient_id)
+    if state is None:
+        update_patient_summary(db, get_ai_service(), patient_id)
+        state = summary_state(db, patient_id)
+        if state is None:
+            raise HTTPException(status_code=503, detail="Patient summary is unavailable, retry shortly")
+    elif state["stale"]:
+        background_tasks.add_task(refresh_patient_summary, get_ai_service(), patient_id)
 
-    summary_text = ai_service.generate_patient_summary(
-        patient_name=f"{patient.first_name} {patient.last_name}",
-        notes=note_texts
-    )
+    return {"patient_id": patient_id, **state}
 
-    return {"patient_id": patient_id, "summary": summary_text}
+@router.post("/patient-summary/{patient_id}/stream")
+async def stream_patient_summary(
+    patient_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    /patient-summary as server-sent events. A summary that covers the chart is
+    sent as one "token"; otherwise the update is streamed as it is generated and
+    stored like any other. Ends with "result" (or "error") and "done".
+    """
+    patient = db.query(Patient).filter(Patient.id == patient_id).first()
+    if not patient:
+        raise HTTPException(status_code=404, detail="Patient not found")
+
+    def events():
+        session = SessionLocal()
+        try:
+            state = summary_state(session, patient_id)
+            if state is not None and not state["stale"]:
+                yield _sse("token", {"text": state["summary"]})
+            else:
+                for text in stream_patient_summary_update(session, get_ai_service(), patient_id):
+                    yield _sse("token", {"text": text})
+                state = summary_state(session, patient_id)
+            if state is None:
+                yield _sse("error", {"detail": "Patient summary is unavailable, retry shortly"})
+            else:
+                yield _sse("result", {"patient_id": patient_id, **state})
+        except Exception as e:
+            yield _sse("error", {"detail": f"Error generating patient summary: {str(e)}"})
+        finally:
+            session.close()
+        yield _sse("done", {})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
 
 @router.get("/patient-timeline/{patient_id}")
 async def get_patient_timeline_with_ai(
     patient_id: int,
+    background_tasks: BackgroundTasks,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    """Get comprehensive patient visit history with AI-generated timeline summary"""
+    """
+    Get a page of the patient's visit history (notes and appointments, newest first).
+    The AI journey summary is served from cache and refreshed in the background
+    whenever the chart has changed since it was generated.
+    """
     try:
-        from api.services.ai_service import MedicalAIService
-        
-        # Fetch patient
         patient = db.query(Patient).filter(Patient.id == patient_id).first()
         if not patient:
             raise HTTPException(status_code=404, detail="Patient not found")
-        
-        # Fetch all notes ordered by date
-        notes = db.query(Note).filter(
-            Note.patient_id == patient_id
-        ).order_by(Note.created_at.desc()).all()
-        
-        # Fetch all appointments
-        appointments = db.query(Appointment).filter(
-            Appointment.patient_id == patient_id
-        ).order_by(Appointment.start_time.desc()).all()
-        
-        # Build timeline data
-        timeline_items = []
-        for note in notes:
-            timeline_items.append({
-                "type": "note",
-                "id": note.id,
-                "date": note.created_at.isoformat(),
-                "title": note.title,
-                "content": note.content,
-                "summary": note.summary,
-                "risk_level": note.risk_level,
-                "author": note.author_name
-            })
-        
-        for apt in appointments:
-            timeline_items.append({
-                "type": "appointment",
-                "id": apt.id,
-                "date": apt.start_time.isoformat(),
-                "title": apt.title,
-                "reason": apt.reason,
-                "status": apt.status
-            })
-        
-        # Sort by date
-        timeline_items.sort(key=lambda x: x["date"], reverse=True)
-        
-        # Generate AI summary of patient journey
-        ai_service = MedicalAIService()
-        if ai_service.enabled:
-            # Build context for AI
-            patient_info = f"""
-Patient: {patient.first_name} {patient.last_name}
-DOB: {patient.date_of_birth}
-MRN: {patient.medical_record_number}
-Allergies: {patient.allergies or 'None'}
-Medical History: {patient.medical_history or 'None'}
-
-Total Visits: {len(notes)}
-Total Appointments: {len(appointments)}
-            """
-            
-            # Summarize recent notes
-            recent_notes_summary = "\n\n".join([
-                f"{note.created_at.strftime('%Y-%m-%d')}: {note.title}\n{note.content[:300]}..."
-                for note in notes[:10]  # Last 10 notes
-            ])
-            
-            prompt = f"""As a medical AI assistant, analyze this patient's complete medical timeline and provide:
 
-1. **Patient Journey Summary**: A comprehensive overview of the patient's medical journey
-2. **Key Medical Events**: Significant diagnoses, treatments, or changes in condition
-3. **Risk Trends**: How the patient's risk level has changed over time
-4. **Current Status**: Patient's current health status based on recent visits
-5. **Recommendations**: Suggested follow-ups or areas requiring attention
+        try:
+            timeline_items, next_cursor = get_timeline_page(db, patient_id, limit=limit, cursor=cursor)
+        except InvalidCursor as e:
+            raise HTTPException(status_code=400, detail=str(e))
 
-{patient_info}
+        statistics = get_timeline_statistics(db, patient_id)
+        fingerprint = statistics.pop("fingerprint")
 
-Recent Visit Summaries:
-{recent_notes_summary}
-
-Provide a structured, professional medical summary."""
-            
-            try:
-                ai_summary = ai_service._call_openai(prompt, max_tokens=800)
-            except Exception as e:
-                ai_summary = f"AI summary unavailable: {str(e)}"
+        cached = journey_summary_cache.get(patient_id)
+        if cached and cached["fingerprint"] == fingerprint:
+            ai_summary_status = "ready"
         else:
-            ai_summary = "AI service not configured"
-        
-        # Calculate statistics
-        risk_distribution = {}
-        for note in notes:
-            if note.risk_level:
-                risk_distribution[note.risk_level] = risk_distribution.get(note.risk_level, 0) + 1
-        
+            ai_summary_status = "stale" if cached else "pending"
+            if journey_summary_cache.claim(patient_id):
+                background_tasks.add_task(refresh_journey_summary, get_ai_service(), patient_id)
+
         return {
             "patient": {
                 "id": patient.id,
@@ -310,16 +423,59 @@ Provide a structured, professional medical summary."""
                 "medical_history": patient.medical_history
             },
             "timeline": timeline_items,
-            "ai_summary": ai_summary,
-            "statistics": {
-                "total_visits": len(notes),
-                "total_appointments": len(appointments),
-                "risk_distribution": risk_distribution,
-                "last_visit": notes[0].created_at.isoformat() if notes else None
-            }
+            "next_cursor": next_cursor,
+            "ai_summary": cached["summary"] if cached else None,
+            "ai_summary_status": ai_summary_status,
+            "ai_summary_generated_at": cached["generated_at"] if cached else None,
+            "statistics": statistics
         }
-        
+
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating patient timeline: {str(e)}")
+
+@router.get("/patient-timeline/{patient_id}/summary/stream")
+async def stream_patient_journey_summary(
+    patient_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    The timeline's AI journey summary as server-sent events. A summary that is
+    current for the chart is sent as one "token"; otherwise it is generated live and
+    cached for the timeline. Ends with "result" (or "error") and "done".
+    """
+    patient = db.query(Patient).filter(Patient.id == patient_id).first()
+    if not patient:
+        raise HTTPException(status_code=404, detail="Patient not found")
+
+    fingerprint = get_timeline_statistics(db, patient_id)["fingerprint"]
+    cached = journey_summary_cache.get(patient_id)
+    if cached and cached["fingerprint"] == fingerprint:
+        inputs = None
+    else:
+        inputs = journey_summary_inputs(db, patient)
+
+    def events():
+        if inputs is None:
+            yield _sse("token", {"text": cached["summary"]})
+            yield _sse("result", {"patient_id": patient_id, "summary": cached["summary"],
+                                  "generated_at": cached["generated_at"], "cached": True})
+            yield _sse("done", {})
+            return
+        parts = []
+        try:
+            for text in get_ai_service().stream_journey_summary(*inputs):
+                parts.append(text)
+                yield _sse("token", {"text": text})
+            summary = "".join(parts).strip()
+            journey_summary_cache.put(patient_id, fingerprint, summary)
+            yield _sse("result", {"patient_id": patient_id, "summary": summary,
+                                  "generated_at": journey_summary_cache.get(patient_id)["generated_at"],
+                                  "cached": False})
+        except Exception as e:
+            yield _sse("error", {"detail": f"AI summary unavailable: {str(e)}"})
+        yield _sse("done", {})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
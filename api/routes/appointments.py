@@ -1,21 +1,53 @@
+import heapq
 from datetime import datetime, timedelta
-from typing import List, Optional
+from typing import List, Literal, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
 from api.db.database import get_db
 from api.deps import get_current_active_user
-from api.models.appointment import Appointment
+from api.models.appointment import Appointment, AppointmentSeries
 from api.models.user import User
 from api.schemas.appointment import (
     AppointmentCreate,
     AppointmentResponse,
+    AppointmentSeriesCreate,
+    AppointmentSeriesResponse,
+    AppointmentSyncResponse,
     AppointmentUpdate,
+    CalendarFeedUrl,
+    ResourceAvailability,
+    ResourceUtilization,
 )
+from api.services.appointment_conflicts import (
+    INACTIVE_STATUSES,
+    MAX_APPOINTMENT_DURATION,
+    find_conflicts,
+    find_series_conflicts,
+)
+from api.services.availability import find_free_slots
+from api.services.calendar_sync import (
+    InvalidSyncToken,
+    changes_since,
+    feed_signature,
+    feed_version,
+    record_tombstone,
+    render_feed,
+    verify_feed_signature,
+)
+from api.services.recurrence import align_datetime, expand_in_window, last_occurrence, parse_weekdays
+from api.services.utilization import utilization_report
 
 router = APIRouter(prefix="/appointments", tags=["appointments"])
 
+# Upper bound on a single calendar read; keeps every query an index range scan
+MAX_WINDOW_DAYS = 366
+
 
 @router.post("/", response_model=AppointmentResponse, status_code=status.HTTP_201_CREATED)
 def create_appointment(
@@ -23,41 +55,252 @@ def create_appointment(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user),
 ):
-    if appointment.end_time <= appointment.start_time:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="End time must be after start time.",
-        )
+    _validate_times(appointment.start_time, appointment.end_time)
+
+    if appointment.status not in INACTIVE_STATUSES:
+        _raise_on_conflicts(find_conflicts(
+            db,
+            appointment.start_time,
+            appointment.end_time,
+            location=appointment.location,
+            clinician_id=current_user.id,
+        ))
 
     db_appointment = Appointment(**appointment.dict(), created_by=current_user.id)
     db.add(db_appointment)
-    db.commit()
+    _commit_booking(db)
     db.refresh(db_appointment)
     return db_appointment
 
 
 @router.get("/", response_model=List[AppointmentResponse])
 def list_appointments(
-    start: Optional[datetime] = None,
-    end: Optional[datetime] = None,
+    start: datetime,
+    end: datetime,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user),
+):
+    """Appointments starting within [start, end], including occurrences of recurring series."""
+    _validate_window(start, end)
+
+    appointments = (
+        db.query(Appointment)
+        .filter(Appointment.start_time >= start, Appointment.start_time <= end)
+        .order_by(Appointment.start_time.asc())
+        .all()
+    )
+    occurrences = _expand_series(db, start, end)
+    if not occurrences:
+        return appointments
+
+    return list(heapq.merge(appointments, occurrences, key=_start_of))
+
+
+@router.get("/availability", response_model=List[ResourceAvailability])
+def get_availability(
+    start: datetime,
+    end: datetime,
+    duration_minutes: int = Query(..., gt=0, le=24 * 60),
+    locations: Optional[List[str]] = Query(None),
+    clinician_ids: Optional[List[int]] = Query(None),
+    day_start: int = Query(8, ge=0, le=23, description="Opening hour"),
+    day_end: int = Query(18, ge=1, le=24, description="Closing hour"),
+    limit_per_resource: Optional[int] = Query(None, gt=0),
+    clinic_timezone: Optional[str] = Query(None, description="IANA zone of the opening hours; defaults to CLINIC_TIMEZONE"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user),
+):
+    """Free windows that fit `duration_minutes` for each requested location and clinician."""
+    _validate_window(start, end)
+    if day_end <= day_start:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Closing hour must be after opening hour.",
+        )
+    if clinic_timezone is not None:
+        try:
+            ZoneInfo(clinic_timezone)
+        except (ZoneInfoNotFoundError, ValueError):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown time zone {clinic_timezone!r}.",
+            )
+    resources = [("location", location) for location in locations or []]
+    resources += [("clinician", clinician_id) for clinician_id in clinician_ids or []]
+    if not resources:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Provide at least one location or clinician.",
+        )
+
+    return find_free_slots(
+        db,
+        resources,
+        start,
+        end,
+        timedelta(minutes=duration_minutes),
+        day_start=day_start,
+        day_end=day_end,
+        limit_per_resource=limit_per_resource,
+        clinic_timezone=clinic_timezone,
+    )
+
+
+@router.get("/utilization", response_model=List[ResourceUtilization])
+def get_utilization(
+    start: datetime,
+    end: datetime,
+    resource: Optional[Literal["location", "clinician"]] = Query(None, description="Limit to one resource type"),
+    locations: Optional[List[str]] = Query(None),
+    clinician_ids: Optional[List[int]] = Query(None),
+    day_start: int = Query(8, ge=0, le=23, description="Opening hour"),
+    day_end: int = Query(18, ge=1, le=24, description="Closing hour"),
+    open_weekdays: str = Query("0,1,2,3,4", description="Open weekdays, Mon=0"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user),
+):
+    """Booked minutes, utilization and no-shows per location and clinician, per day."""
+    _validate_window(start, end)
+    if day_end <= day_start:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Closing hour must be after opening hour.",
+        )
+    try:
+        weekdays = parse_weekdays(open_weekdays, 0)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    return utilization_report(
+        db,
+        start,
+        end,
+        resource_types=(resource,) if resource else ("location", "clinician"),
+        locations=locations,
+        clinician_ids=clinician_ids,
+        day_start=day_start,
+        day_end=day_end,
+        open_weekdays=weekdays,
+    )
+
+
+@router.get("/sync", response_model=AppointmentSyncResponse)
+def sync_appointments(
+    token: Optional[str] = None,
+    limit: int = Query(500, ge=1, le=2000),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user),
+):
+    """Changes to the current user's appointments since `token`; omit it for a full sync."""
+    try:
+        return changes_since(db, current_user.id, token=token, limit=limit)
+    except InvalidSyncToken as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+@router.get("/feed-url", response_model=CalendarFeedUrl)
+def get_calendar_feed_url(
+    request: Request,
+    current_user: User = Depends(get_current_active_user),
+):
+    """Signed iCalendar subscription URL for the current user."""
+    url = request.url_for("get_calendar_feed", user_id=current_user.id)
+    return {"url": f"{url}?sig={feed_signature(current_user)}"}
+
+
+@router.post("/feed-url/rotate", response_model=CalendarFeedUrl)
+def rotate_calendar_feed_url(
+    request: Request,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user),
 ):
-    query = db.query(Appointment)
-    if start:
-        query = query.filter(Appointment.start_time >= start)
-    if end:
-        query = query.filter(Appointment.start_time <= end)
+    """Revoke the current user's feed URLs (e.g. after one leaked) and return a new one."""
+    current_user.calendar_feed_rotation = (current_user.calendar_feed_rotation or 0) + 1
+    db.commit()
+    url = request.url_for("get_calendar_feed", user_id=current_user.id)
+    return {"url": f"{url}?sig={feed_signature(current_user)}"}
 
-    appointments = query.order_by(Appointment.start_time.asc()).all()
 
-    if not appointments:
-        total = db.query(Appointment).count()
-        if total == 0:
-            _seed_sample_appointments(db, current_user, start)
-            appointments = query.order_by(Appointment.start_time.asc()).all()
+@router.get("/feed/{user_id}.ics", name="get_calendar_feed")
+def get_calendar_feed(
+    user_id: int,
+    request: Request,
+    sig: str = Query(...),
+    db: Session = Depends(get_db),
+):
+    """
+    iCalendar feed for calendar apps, which cannot send bearer tokens; the URL
+    signature authorizes it while the user is active and hasn't rotated it.
+    Answers 304 while the ETag is unchanged.
+    """
+    if not verify_feed_signature(db.get(User, user_id), sig):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid feed signature")
 
-    return appointments
+    etag = f'"{feed_version(db, user_id)}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    return Response(
+        content=render_feed(db, user_id),
+        media_type="text/calendar; charset=utf-8",
+        headers={"ETag": etag},
+    )
+
+
+@router.post("/series", response_model=AppointmentSeriesResponse, status_code=status.HTTP_201_CREATED)
+def create_appointment_series(
+    series: AppointmentSeriesCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user),
+):
+    try:
+        parse_weekdays(series.by_weekday, series.start_time.weekday())
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if series.until and series.until < series.start_time:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Series must end after its first occurrence.",
+        )
+
+    if timedelta(minutes=series.duration_minutes) > MAX_APPOINTMENT_DURATION:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Appointments may not exceed {MAX_APPOINTMENT_DURATION}.",
+        )
+
+    db_series = AppointmentSeries(**series.dict(), created_by=current_user.id)
+    if series.count:
+        # Store the effective end so window queries can skip finished series
+        last = last_occurrence(
+            series.start_time, series.frequency, series.interval, series.by_weekday, series.count
+        )
+        db_series.until = min(last, series.until) if series.until else last
+
+    if series.status not in INACTIVE_STATUSES:
+        _raise_on_conflicts(find_series_conflicts(db, db_series))
+
+    db.add(db_series)
+    db.commit()
+    db.refresh(db_series)
+    return db_series
+
+
+@router.delete("/series/{series_id}", status_code=status.HTTP_204_NO_CONTENT)
+def delete_appointment_series(
+    series_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user),
+):
+    series = db.query(AppointmentSeries).filter(AppointmentSeries.id == series_id).first()
+    if not series:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Appointment series not found")
+
+    if series.created_by != current_user.id and current_user.role != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Insufficient permissions")
+
+    record_tombstone(db, "series", series.id, series.created_by)
+    db.delete(series)
+    db.commit()
 
 
 @router.put("/{appointment_id}", response_model=AppointmentResponse)
@@ -74,21 +317,29 @@ def update_appointment(
     if appointment.created_by != current_user.id and current_user.role != "admin":
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Insufficient permissions")
 
-    if (
-        appointment_update.start_time
-        and appointment_update.end_time
-        and appointment_update.end_time <= appointment_update.start_time
-    ):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="End time must be after start time.",
-        )
-
     update_data = appointment_update.dict(exclude_unset=True)
+    start_time = update_data.get("start_time") or appointment.start_time
+    end_time = update_data.get("end_time") or appointment.end_time
+    _validate_times(start_time, align_datetime(end_time, start_time))
+
+    new_status = update_data.get("status", appointment.status)
+    booking_changed = any(
+        field in update_data for field in ("start_time", "end_time", "location", "status")
+    )
+    if booking_changed and new_status not in INACTIVE_STATUSES:
+        _raise_on_conflicts(find_conflicts(
+            db,
+            start_time,
+            align_datetime(end_time, start_time),
+            location=update_data.get("location") or appointment.location,
+            clinician_id=appointment.created_by,
+            exclude_id=appointment.id,
+        ))
+
     for field, value in update_data.items():
         setattr(appointment, field, value)
 
-    db.commit()
+    _commit_booking(db)
     db.refresh(appointment)
     return appointment
 
@@ -106,36 +357,97 @@ def delete_appointment(
     if appointment.created_by != current_user.id and current_user.role != "admin":
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Insufficient permissions")
 
+    record_tombstone(db, "appointment", appointment.id, appointment.created_by)
     db.delete(appointment)
     db.commit()
 
 
-def _seed_sample_appointments(db: Session, user: User, start: Optional[datetime]) -> None:
-    """Bootstrap the calendar with a few sample appointments when the table is empty."""
-    reference = start or datetime.now()
-    base = reference.replace(day=1, hour=8, minute=0, second=0, microsecond=0)
-    samples = [
-        (1, "Cardiology Consult", "Clinic 4A", "Consultation", "John Smith", 60),
-        (3, "Post-op Follow-up", "Clinic 2C", "Follow-up", "Ravi Patel", 45),
-        (6, "Telehealth Diabetes Check", "Virtual Room", "Telehealth", "Maria Lopez", 30),
-        (10, "Knee Replacement Prep", "OR Block 3", "Procedure", "Marcus Lee", 90),
-    ]
-
-    for day_offset, title, location, visit_type, patient_name, duration in samples:
-        start_dt = base + timedelta(days=day_offset)
-        end_dt = start_dt + timedelta(minutes=duration)
-        db.add(
-            Appointment(
-                title=title,
-                patient_name=patient_name,
-                appointment_type=visit_type,
-                status="confirmed",
-                location=location,
-                start_time=start_dt,
-                end_time=end_dt,
-                notes=None,
-                created_by=user.id,
+def _validate_times(start: datetime, end: datetime) -> None:
+    if end <= start:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="End time must be after start time.",
+        )
+    if end - start > MAX_APPOINTMENT_DURATION:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Appointments may not exceed {MAX_APPOINTMENT_DURATION}.",
+        )
+
+
+def _raise_on_conflicts(conflicts: List[dict]) -> None:
+    if conflicts:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={
+                "message": "Appointment overlaps an existing booking for the same location or clinician.",
+                "conflicts": jsonable_encoder(conflicts),
+            },
+        )
+
+
+def _commit_booking(db: Session) -> None:
+    """Commit, translating Postgres exclusion-constraint violations (concurrent double-booking) to 409."""
+    try:
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        if "overlap" in str(e.orig):
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail={"message": "Appointment overlaps an existing booking.", "conflicts": []},
             )
+        raise
+
+
+def _validate_window(start: datetime, end: datetime) -> None:
+    if end <= start:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Window end must be after window start.",
+        )
+    if end - start > timedelta(days=MAX_WINDOW_DAYS):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Window may span at most {MAX_WINDOW_DAYS} days.",
         )
 
-    db.commit()
+
+def _start_of(item) -> datetime:
+    return item["start_time"] if isinstance(item, dict) else item.start_time
+
+
+def _expand_series(db: Session, start: datetime, end: datetime) -> List[dict]:
+    """Expand the recurring series that intersect the window into virtual appointments."""
+    series_list = (
+        db.query(AppointmentSeries)
+        .filter(
+            AppointmentSeries.start_time <= end,
+            or_(AppointmentSeries.until.is_(None), AppointmentSeries.until >= start),
+        )
+        .all()
+    )
+
+    occurrences = []
+    for series in series_list:
+        for index, occurrence_start, occurrence_end in expand_in_window(series, start, end):
+            occurrences.append({
+                "id": None,
+                "series_id": series.id,
+                "occurrence_index": index,
+                "title": series.title,
+                "patient_name": series.patient_name,
+                "patient_id": series.patient_id,
+                "appointment_type": series.appointment_type,
+                "status": series.status,
+                "location": series.location,
+                "notes": series.notes,
+                "start_time": occurrence_start,
+                "end_time": occurrence_end,
+                "created_by": series.created_by,
+                "created_at": series.created_at,
+                "updated_at": series.updated_at,
+            })
+
+    occurrences.sort(key=_start_of)
+    return occurrences
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from typing import List
 
@@ -9,12 +9,15 @@ from api.models.user import User
 from api.deps import get_current_active_user
 from api.agents.summarization_agent import _normalize_risk_level
 from api.services.ai_service import MedicalAIService
+from api.services.patient_summary import refresh_patient_summary
+from api.services.registry import get_ai_service
 
 router = APIRouter(prefix="/notes", tags=["notes"])
 
 @router.post("/", response_model=NoteResponse)
 def create_note(
     note: NoteCreate,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
@@ -25,6 +28,7 @@ def create_note(
     db.add(db_note)
     db.commit()
     db.refresh(db_note)
+    background_tasks.add_task(refresh_patient_summary, get_ai_service(), db_note.patient_id)
     return db_note
 
 @router.get("/", response_model=List[NoteSummary])
@@ -95,6 +99,7 @@ def get_note(
 def update_note(
     note_id: int,
     note_update: NoteUpdate,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
@@ -118,4 +123,7 @@ def update_note(
     
     db.commit()
     db.refresh(note)
+    # Edits and finalization change what the patient's rolling summary should say
+    if {"content", "status"} & update_data.keys():
+        background_tasks.add_task(refresh_patient_summary, get_ai_service(), note.patient_id)
     return note
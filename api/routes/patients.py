@@ -1,14 +1,27 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from typing import List
+from typing import Any, Callable, Dict, List, Tuple
+from datetime import datetime
+import asyncio
+import logging
+import os
 
-from api.db.database import get_db
-from api.schemas.patient import PatientCreate, PatientUpdate, PatientResponse
+from api.db.database import get_db, get_session_factory
+from api.schemas.patient import PatientCreate, PatientUpdate, PatientResponse, PatientDashboard
+from api.schemas.note import NoteResponse
+from api.schemas.appointment import AppointmentResponse
 from api.models.patient import Patient
+from api.models.note import Note
+from api.models.appointment import Appointment
 from api.models.user import User
 from api.deps import get_current_active_user
 
 router = APIRouter(prefix="/patients", tags=["patients"])
+logger = logging.getLogger(__name__)
+
+# Per-section budget for the dashboard; slow sections are dropped, not awaited
+DASHBOARD_SECTION_TIMEOUT = float(os.getenv("DASHBOARD_SECTION_TIMEOUT", "2.0"))
 
 @router.post("/", response_model=PatientResponse)
 def create_patient(
@@ -77,3 +90,111 @@ def update_patient(
     db.commit()
     db.refresh(patient)
     return patient
+
+@router.get("/{patient_id}/dashboard", response_model=PatientDashboard)
+async def get_patient_dashboard(
+    patient_id: int,
+    notes_limit: int = 5,
+    appointments_limit: int = 5,
+    session_factory: Callable[[], Session] = Depends(get_session_factory),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Everything the chart view needs in one round-trip.
+    Sections load concurrently, each with its own session and timeout;
+    a failed or slow section is reported in `errors` ("timeout" or "unavailable")
+    instead of failing the request.
+    """
+    sections: List[Tuple[str, Callable[[Session], Any]]] = [
+        ("patient", lambda db: _load_demographics(db, patient_id)),
+        ("recent_notes", lambda db: _load_recent_notes(db, patient_id, notes_limit)),
+        ("upcoming_appointments", lambda db: _load_upcoming_appointments(db, patient_id, appointments_limit)),
+        ("risk", lambda db: _load_risk_state(db, patient_id)),
+        ("summary", lambda db: _load_cached_summary(db, patient_id)),
+    ]
+
+    results = await asyncio.gather(
+        *(_run_section(session_factory, loader) for _, loader in sections),
+        return_exceptions=True
+    )
+
+    dashboard: Dict[str, Any] = {}
+    errors: Dict[str, str] = {}
+    for (name, _), result in zip(sections, results):
+        if isinstance(result, asyncio.TimeoutError):
+            logger.warning("Dashboard section %s for patient %s timed out after %ss",
+                           name, patient_id, DASHBOARD_SECTION_TIMEOUT)
+            errors[name] = "timeout"
+        elif isinstance(result, Exception):
+            # Details stay in the log; they can contain SQL or internal paths
+            logger.error("Dashboard section %s for patient %s failed", name, patient_id, exc_info=result)
+            errors[name] = "unavailable"
+        else:
+            dashboard[name] = result
+
+    if "patient" not in errors and dashboard.get("patient") is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Patient not found"
+        )
+
+    return PatientDashboard(**dashboard, partial=bool(errors), errors=errors)
+
+async def _run_section(session_factory: Callable[[], Session], loader: Callable[[Session], Any]) -> Any:
+    def run():
+        db = session_factory()
+        try:
+            return loader(db)
+        finally:
+            db.close()
+
+    return await asyncio.wait_for(asyncio.to_thread(run), timeout=DASHBOARD_SECTION_TIMEOUT)
+
+def _load_demographics(db: Session, patient_id: int):
+    patient = db.query(Patient).filter(Patient.id == patient_id).first()
+    return PatientResponse.model_validate(patient) if patient else None
+
+def _load_recent_notes(db: Session, patient_id: int, limit: int):
+    notes = db.query(Note).filter(
+        Note.patient_id == patient_id
+    ).order_by(Note.created_at.desc()).limit(limit).all()
+    return [NoteResponse.model_validate(note) for note in notes]
+
+def _load_upcoming_appointments(db: Session, patient_id: int, limit: int):
+    appointments = db.query(Appointment).filter(
+        Appointment.patient_id == patient_id,
+        Appointment.start_time >= datetime.now()
+    ).order_by(Appointment.start_time.asc()).limit(limit).all()
+    return [AppointmentResponse.model_validate(apt) for apt in appointments]
+
+def _load_risk_state(db: Session, patient_id: int) -> Dict[str, Any]:
+    """Risk as already persisted on notes by the AI pipeline; never calls the LLM."""
+    distribution = dict(
+        db.query(Note.risk_level, func.count(Note.id))
+        .filter(Note.patient_id == patient_id, Note.risk_level.isnot(None))
+        .group_by(Note.risk_level)
+        .all()
+    )
+    latest = db.query(Note.id, Note.risk_level, Note.created_at).filter(
+        Note.patient_id == patient_id,
+        Note.risk_level.isnot(None)
+    ).order_by(Note.created_at.desc()).first()
+    return {
+        "risk_level": latest.risk_level if latest else None,
+        "assessed_note_id": latest.id if latest else None,
+        "assessed_at": latest.created_at if latest else None,
+        "risk_distribution": distribution
+    }
+
+def _load_cached_summary(db: Session, patient_id: int) -> Dict[str, Any]:
+    latest = db.query(Note.id, Note.summary, Note.created_at).filter(
+        Note.patient_id == patient_id,
+        Note.summary.isnot(None)
+    ).order_by(Note.created_at.desc()).first()
+    if not latest:
+        return {"summary": None, "source_note_id": None, "generated_at": None}
+    return {
+        "summary": latest.summary,
+        "source_note_id": latest.id,
+        "generated_at": latest.created_at
+    }
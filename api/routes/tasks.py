@@ -9,8 +9,8 @@ from pydantic import BaseModel
 from api.db.database import get_db
 from api.models.note import Note
 from api.models.patient import Patient
-from api.agents.summarization_agent import SummarizationAgent
-from api.agents.risk_agent import RiskAssessmentAgent
+from api.services.registry import get_risk_agent, get_summarization_agent
+from api.services.reminder_service import dispatch_due_reminders
 
 router = APIRouter(prefix="/ai/tasks", tags=["background-tasks"])
 
@@ -20,6 +20,9 @@ class SummarizeTaskRequest(BaseModel):
 class RiskAssessmentTaskRequest(BaseModel):
     patient_id: int
 
+class ReminderTaskRequest(BaseModel):
+    hours_ahead: int = 24
+
 @router.post("/summarize")
 async def process_summarization_task(
     request: SummarizeTaskRequest,
@@ -40,7 +43,7 @@ async def process_summarization_task(
             raise HTTPException(status_code=404, detail="Patient not found")
         
         # Perform AI summarization using agent
-        agent = SummarizationAgent()
+        agent = get_summarization_agent()
         result = agent.process_note(note, patient, db)
         
         # Results are already saved in process_note, just commit
@@ -71,7 +74,7 @@ async def process_risk_assessment_task(
     
     try:
         # Perform risk assessment using agent
-        agent = RiskAssessmentAgent()
+        agent = get_risk_agent()
         risk_report = agent.generate_patient_risk_report(patient.id, db)
         
         if "error" in risk_report:
@@ -86,3 +89,23 @@ async def process_risk_assessment_task(
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/appointment-reminders")
+def process_appointment_reminders_task(
+    request: ReminderTaskRequest,
+    db: Session = Depends(get_db)
+):
+    """
+    Send reminders for appointments in the next `hours_ahead` hours.
+    Called by Cloud Scheduler. A plain def: dispatch blocks, so it runs in the threadpool.
+    """
+    if request.hours_ahead < 1 or request.hours_ahead > 24 * 7:
+        raise HTTPException(status_code=400, detail="hours_ahead must be between 1 and 168")
+    
+    stats = dispatch_due_reminders(db, hours_ahead=request.hours_ahead)
+    return {
+        "status": "success",
+        "due": stats["due"],
+        "sent": stats["sent"],
+        "failed": stats["failed"]
+    }
@@ -0,0 +1,34 @@
+from typing import List, Literal
+
+from pydantic import BaseModel, Field, field_validator
+
+
+class FusedNoteAnalysis(BaseModel):
+    """Structured result of the single-call note analysis, validated before it is saved."""
+    summary: str = Field(..., min_length=1)
+    key_findings: str = ""
+    risk_level: Literal["LOW", "MEDIUM", "HIGH", "CRITICAL"]
+    risk_factors: List[str] = []
+    recommendations: List[str] = []
+    nursing_actions: List[str] = []
+
+    @field_validator("risk_level", mode="before")
+    @classmethod
+    def _upper_risk_level(cls, value):
+        return value.strip().upper() if isinstance(value, str) else value
+
+    @field_validator("key_findings", mode="before")
+    @classmethod
+    def _join_findings(cls, value):
+        if isinstance(value, list):
+            return "; ".join(str(item) for item in value)
+        return value or ""
+
+    @field_validator("risk_factors", "recommendations", "nursing_actions", mode="before")
+    @classmethod
+    def _listify(cls, value):
+        if value is None:
+            return []
+        if isinstance(value, str):
+            return [value] if value.strip() else []
+        return value
@@ -1,5 +1,5 @@
-from datetime import datetime
-from typing import Optional
+from datetime import date, datetime
+from typing import List, Literal, Optional, Union
 
 from pydantic import BaseModel, Field
 
@@ -33,6 +33,36 @@ class AppointmentUpdate(BaseModel):
 
 
 class AppointmentResponse(AppointmentBase):
+    # Occurrences expanded from a recurring series have no row of their own
+    id: Optional[int] = None
+    series_id: Optional[int] = None
+    occurrence_index: Optional[int] = None
+    created_by: int
+    created_at: datetime
+    updated_at: Optional[datetime]
+
+    class Config:
+        from_attributes = True
+
+
+class AppointmentSeriesCreate(BaseModel):
+    title: str = Field(..., example="Weekly Physiotherapy")
+    patient_name: str = Field(..., example="John Smith")
+    patient_id: Optional[int] = Field(None, description="Link to patient record if known")
+    appointment_type: str = Field(..., example="Therapy")
+    status: str = Field("confirmed", example="confirmed")
+    location: str = Field(..., example="Rehab Gym")
+    start_time: datetime = Field(..., description="First occurrence")
+    duration_minutes: int = Field(..., gt=0, example=45)
+    frequency: Literal["daily", "weekly"] = "weekly"
+    interval: int = Field(1, ge=1, example=1)
+    by_weekday: Optional[str] = Field(None, example="0,3", description="Weekdays for weekly series, Mon=0")
+    count: Optional[int] = Field(None, gt=0, description="Stop after this many occurrences")
+    until: Optional[datetime] = Field(None, description="Stop after this time")
+    notes: Optional[str] = None
+
+
+class AppointmentSeriesResponse(AppointmentSeriesCreate):
     id: int
     created_by: int
     created_at: datetime
@@ -40,3 +70,54 @@ class AppointmentResponse(AppointmentBase):
 
     class Config:
         from_attributes = True
+
+
+class FreeWindow(BaseModel):
+    start: datetime
+    end: datetime
+    slots: int = Field(..., description="Back-to-back slots of the requested duration that fit")
+
+
+class ResourceAvailability(BaseModel):
+    resource: Literal["location", "clinician"]
+    key: Union[int, str]
+    free: List[FreeWindow]
+
+
+class DeletedCalendarItem(BaseModel):
+    kind: Literal["appointment", "series"]
+    id: int
+    deleted_at: datetime
+
+
+class AppointmentSyncResponse(BaseModel):
+    appointments: List[AppointmentResponse]
+    series: List[AppointmentSeriesResponse]
+    deleted: List[DeletedCalendarItem]
+    next_token: str = Field(..., description="Pass back as `token` to receive only later changes")
+    has_more: bool
+
+
+class CalendarFeedUrl(BaseModel):
+    url: str
+
+
+class UtilizationDay(BaseModel):
+    date: date
+    booked_minutes: float
+    appointments: int
+    no_shows: int
+    cancelled: int
+    utilization_pct: Optional[float] = Field(None, description="Null on closed days")
+
+
+class ResourceUtilization(BaseModel):
+    resource: Literal["location", "clinician"]
+    key: Union[int, str]
+    booked_minutes: float
+    open_minutes: int
+    utilization_pct: Optional[float]
+    appointments: int
+    no_shows: int
+    cancelled: int
+    days: List[UtilizationDay]
@@ -1,6 +1,8 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, List, Dict, Any
 from datetime import datetime, date
+from api.schemas.note import NoteResponse
+from api.schemas.appointment import AppointmentResponse
 
 class PatientBase(BaseModel):
     patient_id: str
@@ -8,6 +10,8 @@ class PatientBase(BaseModel):
     last_name: str
     date_of_birth: date
     medical_record_number: str
+    email: Optional[str] = None
+    phone: Optional[str] = None
     emergency_contact: Optional[str] = None
     allergies: Optional[str] = None
     medical_history: Optional[str] = None
@@ -18,6 +22,8 @@ class PatientCreate(PatientBase):
 class PatientUpdate(BaseModel):
     first_name: Optional[str] = None
     last_name: Optional[str] = None
+    email: Optional[str] = None
+    phone: Optional[str] = None
     emergency_contact: Optional[str] = None
     allergies: Optional[str] = None
     medical_history: Optional[str] = None
@@ -29,3 +35,12 @@ class PatientResponse(PatientBase):
     
     class Config:
         from_attributes = True
+
+class PatientDashboard(BaseModel):
+    patient: Optional[PatientResponse] = None
+    recent_notes: Optional[List[NoteResponse]] = None
+    upcoming_appointments: Optional[List[AppointmentResponse]] = None
+    risk: Optional[Dict[str, Any]] = None
+    summary: Optional[Dict[str, Any]] = None
+    partial: bool = False
+    errors: Dict[str, str] = {}
@@ -6,6 +6,7 @@ from api.db.database import SessionLocal, engine, Base
 from api.models.user import User
 from api.models.patient import Patient
 from api.models.note import Note
+from api.models.appointment import Appointment
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
 import random
@@ -186,6 +187,10 @@ def create_more_fake_data():
         
         db.commit()
         print(f"✅ Created {len(created_notes)} new notes")
+
+        # Sample calendar entries (previously seeded on first calendar read)
+        created_appointments = create_sample_appointments(db, all_users[0])
+        print(f"✅ Created {len(created_appointments)} new appointments")
         
         print("\n🎉 Successfully created extensive fake data!")
         print("\n📊 Summary:")
@@ -212,5 +217,39 @@ def create_more_fake_data():
     finally:
         db.close()
 
+def create_sample_appointments(db, user, reference=None):
+    """Bootstrap the calendar with a few sample appointments when the table is empty."""
+    if db.query(Appointment.id).first():
+        return []
+
+    reference = reference or datetime.now()
+    base = reference.replace(day=1, hour=8, minute=0, second=0, microsecond=0)
+    samples = [
+        (1, "Cardiology Consult", "Clinic 4A", "Consultation", "John Smith", 60),
+        (3, "Post-op Follow-up", "Clinic 2C", "Follow-up", "Ravi Patel", 45),
+        (6, "Telehealth Diabetes Check", "Virtual Room", "Telehealth", "Maria Lopez", 30),
+        (10, "Knee Replacement Prep", "OR Block 3", "Procedure", "Marcus Lee", 90),
+    ]
+
+    created = []
+    for day_offset, title, location, visit_type, patient_name, duration in samples:
+        start_dt = base + timedelta(days=day_offset)
+        appointment = Appointment(
+            title=title,
+            patient_name=patient_name,
+            appointment_type=visit_type,
+            status="confirmed",
+            location=location,
+            start_time=start_dt,
+            end_time=start_dt + timedelta(minutes=duration),
+            notes=None,
+            created_by=user.id,
+        )
+        db.add(appointment)
+        created.append(appointment)
+
+    db.commit()
+    return created
+
 if __name__ == "__main__":
     create_more_fake_data()
@@ -2,23 +2,99 @@
 Enhanced AI Service for medical note processing using LangChain and OpenAI
 REAL AI implementation with GPT-4 and embeddings
 """
+import hashlib
 import os
-from typing import Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 import json
 import re
+import threading
 from datetime import datetime
 
-try:
-    from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-    from langchain_core.prompts import PromptTemplate, ChatPromptTemplate
-    from langchain_core.messages import HumanMessage, SystemMessage
-    from langchain_community.vectorstores import FAISS
-    from langchain_text_splitters import RecursiveCharacterTextSplitter
-    from langchain_core.output_parsers import JsonOutputParser
-    AI_AVAILABLE = True
-except ImportError as e:
-    AI_AVAILABLE = False
-    print(f"⚠️ LangChain not available: {e}")
+from pydantic import ValidationError
+
+from api.schemas.ai import FusedNoteAnalysis
+from api.services.clinical_terms import clinical_terms
+from api.services.embeddings import get_embeddings_provider, split_text
+from api.services import llm_backends
+from api.services.llm_backends import LOCAL_BACKENDS, create_chat_model, llm_backend
+from api.services.llm_cache import CachedLLMResponse, cache_key, get_llm_cache
+from api.services.micro_batcher import MicroBatcher
+from api.services.vector_index import get_note_index, sync_note_index
+
+# LangChain and the OpenAI SDK take seconds to import, so they are loaded when the
+# first service is built rather than when the API process starts
+ChatOpenAI = HumanMessage = SystemMessage = RecursiveCharacterTextSplitter = None
+AI_AVAILABLE: Optional[bool] = None
+_ai_import_lock = threading.Lock()
+
+def _load_ai_dependencies() -> bool:
+    global ChatOpenAI, HumanMessage, SystemMessage, RecursiveCharacterTextSplitter, AI_AVAILABLE
+    with _ai_import_lock:
+        if AI_AVAILABLE is None:
+            try:
+                from langchain_openai import ChatOpenAI
+                from langchain_core.messages import HumanMessage, SystemMessage
+                from langchain_text_splitters import RecursiveCharacterTextSplitter
+                AI_AVAILABLE = True
+            except ImportError as e:
+                AI_AVAILABLE = False
+                print(f"⚠️ LangChain not available: {e}")
+        return AI_AVAILABLE
+
+def _use_builtin_messages():
+    """Message classes for the local LLM backends when LangChain isn't installed."""
+    global HumanMessage, SystemMessage
+    with _ai_import_lock:
+        if HumanMessage is None:
+            HumanMessage, SystemMessage = llm_backends.HumanMessage, llm_backends.SystemMessage
+
+FUSED_ANALYSIS_SYSTEM_PROMPT = """You are an expert clinical documentation and risk assessment assistant.
+Analyze the medical note once and return a single JSON object. Be precise, use standard
+medical terminology, base the risk level on symptoms, vitals, history and clinical guidelines,
+and do not include identifiable patient information in your answer."""
+
+MICRO_BATCH_SYSTEM_SUFFIX = """
+You may receive several notes labeled [0], [1], ... Each belongs to a different encounter:
+analyze each on its own and never carry findings from one note into another. Copy each
+note's NOTE REF into the "note_ref" field of its result."""
+
+FUSED_ANALYSIS_TEMPLATE = """{
+    "summary": "Brief 2-3 sentence overview",
+    "key_findings": "Most important clinical findings",
+    "risk_level": "LOW|MEDIUM|HIGH|CRITICAL",
+    "risk_factors": ["specific risk factors"],
+    "recommendations": ["specific evidence-based recommendations"],
+    "nursing_actions": ["nursing interventions; empty unless this is a nurse note"]
+}"""
+
+# Rule-based fallbacks used when AI is unavailable, keyed by clinical_terms concepts
+MOCK_RECOMMENDATION_RULES = (
+    ({"chest pain", "shortness of breath", "dyspnea"},
+     "Obtain ECG/troponin and monitor vitals closely; escalate if pain worsens."),
+    ({"fever", "infection"},
+     "Check CBC and cultures if indicated; start antipyretics and hydration."),
+    ({"headache"},
+     "Assess neuro status; consider imaging if red flags (sudden/severe, neuro deficits)."),
+    ({"imaging"},
+     "Confirm imaging order and follow up on results with the patient."),
+    ({"diabetes", "glucose"},
+     "Reinforce glucose control, medication adherence, and foot care education."),
+    ({"hypertension", "blood pressure"},
+     "Review antihypertensive regimen and home BP logs; adjust if persistently elevated."),
+    ({"asthma", "wheezing"},
+     "Assess inhaler technique; ensure rescue inhaler available; monitor for triggers."),
+)
+
+# Most notes one patient-summary prompt reads, to keep it compact
+PATIENT_SUMMARY_NOTES = 8
+
+MOCK_SUMMARY_HIGH_RISK = {"chest pain", "severe", "critical", "dyspnea", "unstable"}
+MOCK_SUMMARY_LOW_RISK = {"routine", "stable", "well controlled", "improved"}
+MOCK_ASSESSMENT_HIGH_RISK = {"critical", "urgent", "emergency", "severe"}
+MOCK_ASSESSMENT_LOW_RISK = {"stable", "normal", "routine"}
+
+# Notes up to this length are micro-batched; longer notes are analyzed alone
+MICRO_BATCH_MAX_NOTE_CHARS = int(os.getenv("MICRO_BATCH_MAX_NOTE_CHARS", "800"))
 
 class MedicalAIService:
     """
@@ -32,36 +108,52 @@ class MedicalAIService:
     """
     
     def __init__(self):
-        if not AI_AVAILABLE:
+        # Retrieval has its own provider (see EMBEDDINGS_PROVIDER) and works offline
+        # even when the LLM features below are disabled
+        self.embeddings = get_embeddings_provider(os.getenv("OPENAI_API_KEY"))
+        self.note_index = get_note_index(self.embeddings.model) if self.embeddings else None
+        if self.embeddings and self.note_index is None:
+            print("⚠️ Note index disabled - set VECTOR_INDEX_DIR to storage shared with the worker")
+        
+        # LLM_BACKEND=fake or replay stands in for OpenAI (see llm_backends) and
+        # needs neither LangChain nor an API key
+        self.llm_backend = llm_backend()
+        local_backend = self.llm_backend in LOCAL_BACKENDS
+        langchain_loaded = _load_ai_dependencies()
+        if not langchain_loaded and not local_backend:
             self.enabled = False
             print("⚠️ AI Service disabled - missing dependencies")
             return
             
         self.openai_api_key = os.getenv("OPENAI_API_KEY")
-        if not self.openai_api_key:
+        if not self.openai_api_key and not local_backend:
             self.enabled = False
             print("⚠️ AI Service disabled - OPENAI_API_KEY not set")
             return
         
         self.enabled = True
+        if not langchain_loaded:
+            _use_builtin_messages()
         
         # Initialize LLM models
-        self.llm = ChatOpenAI(
-            model="gpt-4o-mini",  # Using GPT-4o-mini for cost efficiency
+        self.llm = create_chat_model(
+            "gpt-4o-mini",  # Using GPT-4o-mini for cost efficiency
             temperature=0.1,  # Low temperature for medical accuracy
             openai_api_key=self.openai_api_key
         )
         
-        self.creative_llm = ChatOpenAI(
-            model="gpt-4o-mini",
+        self.creative_llm = create_chat_model(
+            "gpt-4o-mini",
             temperature=0.7,  # Higher temperature for recommendations
             openai_api_key=self.openai_api_key
         )
         
-        # Initialize embeddings for RAG
-        self.embeddings = OpenAIEmbeddings(
-            openai_api_key=self.openai_api_key,
-            model="text-embedding-3-small"
+        # JSON mode for the fused analysis, whose output is schema-validated
+        self.json_llm = create_chat_model(
+            "gpt-4o-mini",
+            temperature=0.1,
+            json_mode=True,
+            openai_api_key=self.openai_api_key
         )
         
         # Text splitter for document chunking
@@ -69,17 +161,94 @@ class MedicalAIService:
             chunk_size=1000,
             chunk_overlap=200,
             length_function=len,
-        )
+        ) if langchain_loaded else None
         
-        # Vector store for historical notes (RAG)
-        self.vectorstore = None
+        # Identical prompts (re-clicks, task retries) are answered from cache, except
+        # when recording: a cached answer would never reach the cassette
+        self.response_cache = get_llm_cache() if self.llm_backend != "record" else None
+        
+        # Short notes submitted together from batch paths share one fused-analysis request
+        self.note_batcher = None
+        if os.getenv("MICRO_BATCH_ENABLED", "true").lower() not in ("0", "false", "no"):
+            self.note_batcher = MicroBatcher(
+                self._analyze_fused_batch,
+                max_wait_seconds=float(os.getenv("MICRO_BATCH_WAIT_MS", "15")) / 1000,
+                token_budget=int(os.getenv("MICRO_BATCH_TOKEN_BUDGET", "3000")),
+                max_items=int(os.getenv("MICRO_BATCH_MAX_ITEMS", "12"))
+            )
         
         print("✅ Enhanced AI Service initialized successfully!")
     
+    def _invoke(self, llm, messages, validate: Optional[Callable[[str], Any]] = None):
+        """
+        Call the chat model, reusing the cached response for a byte-identical prompt.
+        Empty answers are never cached; with `validate`, neither is one for which
+        validate(content) is falsy, so an answer that fails parsing is asked for
+        again rather than replayed.
+        """
+        cache = getattr(self, "response_cache", None)
+        if cache is None:
+            return llm.invoke(messages)
+        
+        key = cache_key(getattr(llm, "model_name", None), getattr(llm, "temperature", None), messages)
+        try:
+            cached = cache.get(key)
+        except Exception as e:
+            print(f"LLM cache lookup failed: {e}")
+            cached = None
+        if cached is not None:
+            return CachedLLMResponse(content=cached)
+        
+        response = llm.invoke(messages)
+        self._cache_put(cache, key, response.content, validate)
+        return response
+    
+    @staticmethod
+    def _cache_put(cache, key: str, content: str, validate: Optional[Callable[[str], Any]]):
+        try:
+            if content and content.strip() and (validate is None or validate(content)):
+                cache.put(key, content)
+        except Exception as e:
+            print(f"LLM cache store failed: {e}")
+
+    @staticmethod
+    def _json_object(content: str) -> Optional[Dict]:
+        """The JSON object in a model answer, or None if there is no parseable one."""
+        json_match = re.search(r'\{.*\}', content or "", re.DOTALL)
+        try:
+            return json.loads(json_match.group()) if json_match else None
+        except json.JSONDecodeError:
+            return None
+    
+    def _stream(self, llm, messages, validate: Optional[Callable[[str], Any]] = None) -> Iterator[str]:
+        """Like _invoke, but yields text as the model produces it. A cached answer arrives in one piece."""
+        cache = getattr(self, "response_cache", None)
+        key = None
+        if cache is not None:
+            key = cache_key(getattr(llm, "model_name", None), getattr(llm, "temperature", None), messages)
+            try:
+                cached = cache.get(key)
+            except Exception as e:
+                print(f"LLM cache lookup failed: {e}")
+                cached = None
+            if cached is not None:
+                yield cached
+                return
+        
+        parts = []
+        for chunk in llm.stream(messages):
+            if chunk.content:
+                parts.append(chunk.content)
+                yield chunk.content
+        if key is not None:
+            self._cache_put(cache, key, "".join(parts), validate)
+    
     def summarize_medical_note(self, note_content: str, note_type: str = "general", 
-                               patient_history: Optional[List[str]] = None) -> Dict:
+                               patient_history: Optional[List[str]] = None,
+                               patient_id: Optional[int] = None, note_id: Optional[int] = None) -> Dict:
         """
-        Generate comprehensive medical note summary using GPT-4
+        Generate comprehensive medical note summary using GPT-4.
+        With `patient_id`, related passages from that patient's other notes are added as context.
         """
         if not self.enabled:
             return self._get_mock_summary(note_content, note_type)
@@ -87,10 +256,11 @@ class MedicalAIService:
         try:
             # Build context from patient history if available
             history_context = ""
-            if patient_history and self.vectorstore:
-                # Use RAG to find relevant historical information
-                relevant_docs = self.vectorstore.similarity_search(note_content, k=3)
-                history_context = "\n".join([doc.page_content for doc in relevant_docs])
+            if patient_id is not None:
+                # Use RAG to find relevant historical information, from this patient's chart only
+                history_context = "\n".join(
+                    self.search_history(note_content, patient_id, k=3, exclude_note_id=note_id)
+                )
             
             # Create specialized prompt based on note type
             system_prompt = """You are an expert medical AI assistant specializing in clinical documentation. 
@@ -135,7 +305,7 @@ Guidelines:
                 HumanMessage(content=user_prompt)
             ]
             
-            response = self.llm.invoke(messages)
+            response = self._invoke(self.llm, messages, validate=self._json_object)
             
             # Parse JSON response
             try:
@@ -166,41 +336,293 @@ Guidelines:
             print(f"Error in AI summarization: {str(e)}")
             return self._get_mock_summary(note_content, note_type)
 
-    def generate_patient_summary(self, patient_name: str, notes: List[str]) -> str:
+    def analyze_note_fused(self, note_content: str, note_type: str = "general",
+                           patient_context: str = "", patient_history: Optional[List[str]] = None,
+                           batchable: bool = False) -> Optional[Dict]:
+        """
+        Summary, risk and recommendations for a note from one LLM call.
+        Returns None when AI is disabled or the response fails validation, so callers
+        can fall back to the separate summary and risk calls.
+        
+        With `batchable` (backfills and batch summarization, never interactive
+        requests) a short note goes through the micro-batcher and shares a request
+        with other short notes submitted within a few milliseconds.
+        """
+        if not self.enabled:
+            return None
+        
+        payload = {
+            "note_content": note_content,
+            "note_type": note_type,
+            "patient_context": patient_context,
+            "patient_history": patient_history
+        }
+        if batchable and self.note_batcher is not None and len(note_content) <= MICRO_BATCH_MAX_NOTE_CHARS:
+            try:
+                result = self.note_batcher.submit(payload, self._estimate_tokens(payload)).result(timeout=120)
+            except Exception as e:
+                print(f"Micro-batched analysis failed, retrying alone: {e}")
+                result = None
+            if result is not None:
+                return result
+        return self._analyze_note_fused_single(**payload)
+    
+    @staticmethod
+    def _estimate_tokens(payload: Dict) -> int:
+        # ~4 characters per token is close enough for batching decisions
+        text = payload["note_content"] + (payload["patient_context"] or "")
+        text += "".join((payload["patient_history"] or [])[-5:])
+        return len(text) // 4 + 50
+    
+    @staticmethod
+    def _fused_note_sections(payload: Dict) -> List[str]:
+        sections = [f"NOTE TYPE: {payload['note_type']}", f"MEDICAL NOTE:\n{payload['note_content']}"]
+        if payload["patient_context"]:
+            sections.append(f"PATIENT CONTEXT:\n{payload['patient_context']}")
+        if payload["patient_history"]:
+            sections.append("PATIENT HISTORY:\n" + "\n".join(payload["patient_history"][-5:]))
+        return sections
+    
+    @staticmethod
+    def _stamp_fused(analysis: FusedNoteAnalysis) -> Dict:
+        result = analysis.model_dump()
+        result["ai_generated"] = True
+        result["model"] = "gpt-4o-mini"
+        result["timestamp"] = datetime.now().isoformat()
+        return result
+    
+    def _fused_messages(self, payload: Dict) -> List:
+        user_prompt = (
+            "\n\n".join(self._fused_note_sections(payload))
+            + "\n\nRespond with JSON in exactly this format:\n"
+            + FUSED_ANALYSIS_TEMPLATE
+        )
+        return [
+            SystemMessage(content=FUSED_ANALYSIS_SYSTEM_PROMPT),
+            HumanMessage(content=user_prompt)
+        ]
+    
+    @classmethod
+    def parse_fused_analysis(cls, content: str) -> Optional[Dict]:
+        """Validated fused analysis from a model response, or None if it is unusable."""
+        json_match = re.search(r'\{.*\}', content or "", re.DOTALL)
+        if not json_match:
+            print("Fused analysis returned no JSON")
+            return None
+        try:
+            return cls._stamp_fused(FusedNoteAnalysis.model_validate(json.loads(json_match.group())))
+        except (json.JSONDecodeError, ValidationError) as e:
+            print(f"Fused analysis response rejected: {e}")
+            return None
+    
+    def _analyze_note_fused_single(self, note_content: str, note_type: str = "general",
+                                   patient_context: str = "", patient_history: Optional[List[str]] = None) -> Optional[Dict]:
+        try:
+            response = self._invoke(self.json_llm, self._fused_messages({
+                "note_content": note_content,
+                "note_type": note_type,
+                "patient_context": patient_context,
+                "patient_history": patient_history
+            }), validate=self.parse_fused_analysis)
+            return self.parse_fused_analysis(response.content)
+        except Exception as e:
+            print(f"Error in fused note analysis: {str(e)}")
+            return None
+    
+    def stream_note_analysis(self, note_content: str, note_type: str = "general",
+                             patient_context: str = "", patient_history: Optional[List[str]] = None) -> Iterator[str]:
+        """
+        Raw JSON of the fused analysis as it is generated; parse the joined text with
+        parse_fused_analysis. Yields nothing when AI is disabled.
+        """
+        if not self.enabled:
+            return
+        yield from self._stream(self.json_llm, self._fused_messages({
+            "note_content": note_content,
+            "note_type": note_type,
+            "patient_context": patient_context,
+            "patient_history": patient_history
+        }), validate=self.parse_fused_analysis)
+    
+    def _analyze_fused_batch(self, payloads: List[Dict]) -> List[Optional[Dict]]:
+        """One request for several short notes; answers come back as an indexed JSON array."""
+        if len(payloads) == 1:
+            return [self._analyze_note_fused_single(**payloads[0])]
+        
+        refs = [self.note_ref(payload) for payload in payloads]
+        notes_section = "\n\n".join(
+            f"[{index}]\nNOTE REF: {ref}\n" + "\n".join(self._fused_note_sections(payload))
+            for index, (ref, payload) in enumerate(zip(refs, payloads))
+        )
+        user_prompt = (
+            f"Analyze each of the following {len(payloads)} notes independently.\n\n"
+            f"{notes_section}\n\n"
+            'Respond with JSON of the form {"results": [...]} containing one object per note, '
+            'each with an "index" field matching the note label, a "note_ref" field copying its '
+            'NOTE REF, and the fields of this format:\n'
+            + FUSED_ANALYSIS_TEMPLATE
+        )
+        response = self._invoke(self.json_llm, [
+            SystemMessage(content=FUSED_ANALYSIS_SYSTEM_PROMPT + MICRO_BATCH_SYSTEM_SUFFIX),
+            HumanMessage(content=user_prompt)
+        ], validate=lambda content: all(self.parse_indexed_analyses(content, refs)))
+        return self.parse_indexed_analyses(response.content, refs)
+    
+    @staticmethod
+    def note_ref(payload: Dict) -> str:
+        """Short digest of everything a batched note's analysis depends on."""
+        digest = hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+        return digest[:12]
+    
+    @classmethod
+    def parse_indexed_analyses(cls, content: str, refs: List[str]) -> List[Optional[Dict]]:
+        """
+        Scatter a batched response back into per-note results. An entry is only used
+        if it echoes the NOTE REF of the note at its index, so a mislabelled index can't
+        put one patient's analysis on another's note. Missing, duplicate, mismatched
+        or invalid entries are None so those notes can be retried on their own.
+        """
+        count = len(refs)
+        results: List[Optional[Dict]] = [None] * count
+        try:
+            data = json.loads(content)
+        except json.JSONDecodeError:
+            json_match = re.search(r'[\[{].*[\]}]', content, re.DOTALL)
+            if not json_match:
+                return results
+            try:
+                data = json.loads(json_match.group())
+            except json.JSONDecodeError:
+                return results
+        items = data.get("results", []) if isinstance(data, dict) else data
+        if not isinstance(items, list):
+            return results
+        
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            try:
+                index = int(item.get("index"))
+                analysis = FusedNoteAnalysis.model_validate(item)
+            except (TypeError, ValueError, ValidationError):
+                continue
+            if 0 <= index < count and results[index] is None and item.get("note_ref") == refs[index]:
+                results[index] = cls._stamp_fused(analysis)
+        return results
+
+    def generate_patient_summary(self, patient_name: str, notes: List[str]) -> Optional[str]:
         """
         Generate a concise 3-4 line patient overview from recent notes.
+        None when AI is disabled or the call fails.
         """
         if not notes:
             return "No documented encounters yet. Please add clinical notes to enable AI summaries."
 
-        joined_notes = "\n\n".join(notes[:8])  # keep prompt compact
+        if not self.enabled:
+            return None
+
+        try:
+            response = self._invoke(self.llm, self._patient_summary_messages(patient_name, notes))
+            return response.content.strip()
+        except Exception as e:
+            print(f"Error generating patient summary: {e}")
+            return None
 
+    def fold_patient_summary(self, patient_name: str, previous_summary: str, new_notes: List[str]) -> Optional[str]:
+        """
+        Update an existing patient overview with notes written since, instead of
+        re-reading the chart. None when AI is disabled or the call fails.
+        """
         if not self.enabled:
-            # Lightweight fallback summary
-            trimmed = joined_notes[:400].replace("\n", " ")
-            return f"Patient overview for {patient_name}: {trimmed}..."
+            return None
 
         try:
-            system_prompt = (
-                "You are an expert clinical documentation assistant. "
-                "Write a brief, 3-4 line overview that captures the patient's current status, "
-                "key diagnoses/complaints, notable vitals/findings, and plan or follow-up. "
-                "Be concise, objective, and clinically relevant."
-            )
-            user_prompt = f"Patient: {patient_name}\nRecent notes:\n{joined_notes}"
+            response = self._invoke(self.llm, self._fold_patient_summary_messages(patient_name, previous_summary, new_notes))
+            return response.content.strip()
+        except Exception as e:
+            print(f"Error updating patient summary: {e}")
+            return None
 
-            messages = [
-                SystemMessage(content=system_prompt),
-                HumanMessage(content=user_prompt)
-            ]
+    def stream_patient_summary(self, patient_name: str, notes: List[str]) -> Iterator[str]:
+        """generate_patient_summary, yielding text as it is generated; nothing when AI is disabled."""
+        if not notes:
+            yield "No documented encounters yet. Please add clinical notes to enable AI summaries."
+        elif self.enabled:
+            yield from self._stream(self.llm, self._patient_summary_messages(patient_name, notes))
+
+    def stream_fold_patient_summary(self, patient_name: str, previous_summary: str,
+                                    new_notes: List[str]) -> Iterator[str]:
+        """fold_patient_summary, yielding text as it is generated; nothing when AI is disabled."""
+        if self.enabled:
+            yield from self._stream(self.llm, self._fold_patient_summary_messages(patient_name, previous_summary, new_notes))
+
+    @classmethod
+    def _fold_patient_summary_messages(cls, patient_name: str, previous_summary: str, new_notes: List[str]) -> List:
+        messages = cls._patient_summary_messages(patient_name, new_notes)
+        messages[1] = HumanMessage(content=(
+            f"Patient: {patient_name}\n"
+            f"Current overview:\n{previous_summary}\n\n"
+            "New notes since that overview (newest first):\n" + "\n\n".join(new_notes[:PATIENT_SUMMARY_NOTES]) +
+            "\n\nRewrite the overview to reflect the new notes, keeping it to 3-4 lines. "
+            "Where they conflict, the new notes supersede the overview."
+        ))
+        return messages
+
+    @staticmethod
+    def _patient_summary_messages(patient_name: str, notes: List[str]) -> List:
+        joined_notes = "\n\n".join(notes[:PATIENT_SUMMARY_NOTES])  # keep prompt compact
+        system_prompt = (
+            "You are an expert clinical documentation assistant. "
+            "Write a brief, 3-4 line overview that captures the patient's current status, "
+            "key diagnoses/complaints, notable vitals/findings, and plan or follow-up. "
+            "Be concise, objective, and clinically relevant."
+        )
+        user_prompt = f"Patient: {patient_name}\nRecent notes:\n{joined_notes}"
+        return [
+            SystemMessage(content=system_prompt),
+            HumanMessage(content=user_prompt)
+        ]
 
-            response = self.llm.invoke(messages)
+    def generate_journey_summary(self, patient_info: str, recent_notes: List[str]) -> str:
+        """
+        Narrative summary of a patient's medical journey for the timeline view.
+        """
+        if not self.enabled:
+            return "AI service not configured"
+
+        try:
+            response = self._invoke(self.llm, self._journey_summary_messages(patient_info, recent_notes))
             return response.content.strip()
         except Exception as e:
-            print(f"Error generating patient summary: {e}")
-            trimmed = joined_notes[:400].replace("\n", " ")
-            return f"Patient overview for {patient_name}: {trimmed}..."
-    
+            print(f"Error generating journey summary: {e}")
+            return f"AI summary unavailable: {str(e)}"
+
+    def stream_journey_summary(self, patient_info: str, recent_notes: List[str]) -> Iterator[str]:
+        """generate_journey_summary, yielding text as it is generated."""
+        if not self.enabled:
+            yield "AI service not configured"
+        else:
+            yield from self._stream(self.llm, self._journey_summary_messages(patient_info, recent_notes))
+
+    @staticmethod
+    def _journey_summary_messages(patient_info: str, recent_notes: List[str]) -> List:
+        recent_notes_summary = "\n\n".join(recent_notes) or "No documented visits."
+        prompt = f"""As a medical AI assistant, analyze this patient's complete medical timeline and provide:
+
+1. **Patient Journey Summary**: A comprehensive overview of the patient's medical journey
+2. **Key Medical Events**: Significant diagnoses, treatments, or changes in condition
+3. **Risk Trends**: How the patient's risk level has changed over time
+4. **Current Status**: Patient's current health status based on recent visits
+5. **Recommendations**: Suggested follow-ups or areas requiring attention
+
+{patient_info}
+
+Recent Visit Summaries:
+{recent_notes_summary}
+
+Provide a structured, professional medical summary."""
+        return [HumanMessage(content=prompt)]
+
     def assess_patient_risk(self, note_content: str, patient_history: List[str] = None, 
                            vital_signs: Dict = None) -> Dict:
         """
@@ -262,7 +684,7 @@ Base your assessment on:
                 HumanMessage(content=user_prompt)
             ]
             
-            response = self.llm.invoke(messages)
+            response = self._invoke(self.llm, messages, validate=self._json_object)
             
             # Parse response
             try:
@@ -332,7 +754,7 @@ Always consider patient safety, contraindications, and individual patient factor
                 HumanMessage(content=user_prompt)
             ]
             
-            response = self.creative_llm.invoke(messages)
+            response = self._invoke(self.creative_llm, messages, validate=self._json_object)
             
             try:
                 content = response.content
@@ -372,7 +794,7 @@ Always consider patient safety, contraindications, and individual patient factor
                 f"{entity_json_template}\n"
             )
             
-            response = self.llm.invoke([HumanMessage(content=prompt)])
+            response = self._invoke(self.llm, [HumanMessage(content=prompt)], validate=self._json_object)
             
             try:
                 json_match = re.search(r'\{.*\}', response.content, re.DOTALL)
@@ -386,35 +808,58 @@ Always consider patient safety, contraindications, and individual patient factor
         except Exception as e:
             return {"error": str(e)}
     
-    def create_vectorstore_from_notes(self, notes: List[Dict]):
+    def search_history(self, query: str, patient_id: int, k: int = 3,
+                       exclude_note_id: Optional[int] = None) -> List[str]:
         """
-        Create FAISS vector store from historical notes for RAG
+        Note chunks of one patient most similar to `query`, from the persistent
+        index, leaving out the note being analyzed. Never searches across patients.
         """
-        if not self.enabled:
-            return
-        
+        if self.embeddings is None or self.note_index is None:
+            return []
         try:
-            texts = []
-            for note in notes:
-                text = f"Date: {note.get('date', 'N/A')}\n"
-                text += f"Type: {note.get('type', 'N/A')}\n"
-                text += f"Content: {note.get('content', '')}"
-                texts.append(text)
-            
-            if texts:
-                docs = self.text_splitter.create_documents(texts)
-                self.vectorstore = FAISS.from_documents(docs, self.embeddings)
-                print(f"✅ Created vector store with {len(docs)} documents")
+            # A per-patient lookup, not a corpus-wide count, saves embedding the query for empty charts
+            if not self.note_index.has_patient(patient_id):
+                return []
+            hits = self.note_index.search(
+                self.embeddings.embed_query(query), k=k, patient_id=patient_id, exclude_note_id=exclude_note_id
+            )
+            return [hit["text"] for hit in hits]
         except Exception as e:
-            print(f"Error creating vector store: {str(e)}")
-
+            print(f"Note index search failed: {e}")
+        return []
+    
+    def sync_vector_index(self, db) -> Dict:
+        """Embed notes changed since the last sync into the persistent index."""
+        if self.embeddings is None or self.note_index is None:
+            return {"status": "disabled"}
+        splitter = getattr(self, "text_splitter", None)
+        # This run's own counts; query embeddings from concurrent searches stay out of them.
+        # Chunks served from the embedding cache are API work this run did not repeat
+        counters = {"texts": 0, "cached": 0, "embedded": 0, "api_calls": 0}
+        stats = sync_note_index(
+            db, self.note_index, lambda texts: self.embeddings.embed_documents(texts, counters=counters),
+            splitter.split_text if splitter else split_text
+        )
+        stats["embeddings"] = counters
+        return stats
+    
+    def vector_index_stats(self) -> Optional[Dict]:
+        index = getattr(self, "note_index", None)
+        if index is None:
+            return None
+        try:
+            return index.stats()
+        except Exception as e:
+            return {"error": str(e)}
+    
     # --- Compatibility helpers used by agents/routes without needing a full LLM call ---
-    def summarize_note(self, note_content: str, note_type: str = "general", patient_context: str = "") -> Dict:
+    def summarize_note(self, note_content: str, note_type: str = "general", patient_context: str = "",
+                       patient_id: Optional[int] = None, note_id: Optional[int] = None) -> Dict:
         """
         Compatibility wrapper expected by SummarizationAgent.
         Uses real LLM when enabled; otherwise uses structured mock summarization.
         """
-        base_summary = self.summarize_medical_note(note_content, note_type)
+        base_summary = self.summarize_medical_note(note_content, note_type, patient_id=patient_id, note_id=note_id)
 
         # If the LLM did not generate recommendations, synthesize lightweight guidance
         if not base_summary.get("recommendations"):
@@ -424,6 +869,29 @@ Always consider patient safety, contraindications, and individual patient factor
 
         return base_summary
 
+    def condense_history(self, history: str, max_tokens: int) -> Optional[str]:
+        """
+        Shorten summaries of earlier notes to roughly max_tokens (the reduce step of
+        the chart context builder). None when AI is disabled or the call fails.
+        """
+        if not self.enabled:
+            return None
+        try:
+            response = self._invoke(self.llm, [
+                SystemMessage(content=(
+                    "You condense clinical history. Keep diagnoses, risk events, procedures, "
+                    "medications, allergies and dates; drop routine findings. Plain text, "
+                    "chronological, no preamble."
+                )),
+                HumanMessage(content=(
+                    f"Condense these earlier notes to at most {max(max_tokens * 3 // 4, 1)} words:\n\n{history}"
+                ))
+            ])
+            return response.content.strip()
+        except Exception as e:
+            print(f"Error condensing history: {e}")
+            return None
+
     def assess_risk(self, note_content: str, patient_history: List[str] = None) -> Dict:
         """
         Compatibility wrapper expected by SummarizationAgent.
@@ -450,7 +918,7 @@ Always consider patient safety, contraindications, and individual patient factor
         import re
 
         text = content or ""
-        lowered = text.lower()
+        concepts = clinical_terms.concepts(text)
 
         # Extract key-value sections like **Reason for Admission:** headache
         section_matches = re.findall(r"\*\*(.+?)\*\*\s*:?\s*([^*]+)", text)
@@ -488,20 +956,9 @@ Always consider patient safety, contraindications, and individual patient factor
             if rec and rec not in recommendations:
                 recommendations.append(rec)
 
-        if any(word in lowered for word in ["chest pain", "shortness of breath", "dyspnea"]):
-            add_rec("Obtain ECG/troponin and monitor vitals closely; escalate if pain worsens.")
-        if "fever" in lowered or "infection" in lowered:
-            add_rec("Check CBC and cultures if indicated; start antipyretics and hydration.")
-        if "headache" in lowered:
-            add_rec("Assess neuro status; consider imaging if red flags (sudden/severe, neuro deficits).")
-        if "mri" in lowered or "ct" in lowered:
-            add_rec("Confirm imaging order and follow up on results with the patient.")
-        if "diabetes" in lowered or "glucose" in lowered:
-            add_rec("Reinforce glucose control, medication adherence, and foot care education.")
-        if "hypertension" in lowered or "bp" in lowered:
-            add_rec("Review antihypertensive regimen and home BP logs; adjust if persistently elevated.")
-        if "asthma" in lowered or "wheezing" in lowered:
-            add_rec("Assess inhaler technique; ensure rescue inhaler available; monitor for triggers.")
+        for triggers, rec in MOCK_RECOMMENDATION_RULES:
+            if concepts & triggers:
+                add_rec(rec)
 
         if not recommendations:
             add_rec("Monitor symptoms, document changes, and schedule follow-up if no improvement.")
@@ -510,9 +967,9 @@ Always consider patient safety, contraindications, and individual patient factor
 
         # Simple risk heuristic
         risk_level = "medium"
-        if any(word in lowered for word in ["chest pain", "severe", "critical", "dyspnea", "unstable"]):
+        if concepts & MOCK_SUMMARY_HIGH_RISK:
             risk_level = "high"
-        elif any(word in lowered for word in ["routine", "stable", "well controlled", "improved"]):
+        elif concepts & MOCK_SUMMARY_LOW_RISK:
             risk_level = "low"
 
         key_findings = "; ".join(summary_parts[:3])
@@ -533,10 +990,11 @@ Always consider patient safety, contraindications, and individual patient factor
     
     def _get_mock_risk_assessment(self, content: str) -> Dict:
         """Fallback risk assessment"""
+        concepts = clinical_terms.concepts(content)
         risk_level = "medium"
-        if any(word in content.lower() for word in ["critical", "urgent", "emergency", "severe"]):
+        if concepts & MOCK_ASSESSMENT_HIGH_RISK:
             risk_level = "high"
-        elif any(word in content.lower() for word in ["stable", "normal", "routine"]):
+        elif concepts & MOCK_ASSESSMENT_LOW_RISK:
             risk_level = "low"
         
         return {
@@ -0,0 +1,385 @@
+"""
+Double-booking detection for rooms (location) and clinicians (created_by).
+
+Postgres answers overlap queries with tstzrange && over the GiST exclusion
+constraints that migration 0004 adds to the appointments table. SQLite has no
+range types, so each room/clinician gets an in-memory interval tree that is
+loaded on first use. Triggers (migration 0005) change appointment_revision on
+every write to the table, from any process, and a tree is reloaded once the
+revision it was loaded at is no longer current.
+"""
+import random
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event, func, literal, or_, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from api.models.appointment import Appointment, AppointmentSeries
+from api.services.recurrence import align_datetime, expand_in_window
+
+# Bookings longer than this are rejected; it bounds the look-back of range scans
+MAX_APPOINTMENT_DURATION = timedelta(hours=24)
+INACTIVE_STATUSES = ("cancelled",)
+# How far ahead a new recurring series is checked against existing bookings
+SERIES_CONFLICT_HORIZON = timedelta(days=366)
+
+
+def comparable_key(dialect_name: str):
+    """Normalize datetimes so values read back from the database compare with request values."""
+    if dialect_name == "sqlite":
+        # SQLite stores wall-clock text and silently drops any offset
+        return lambda value: value.replace(tzinfo=None) if value.tzinfo else value
+    return lambda value: value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+
+
+class _Node:
+    __slots__ = ("start", "end", "item_id", "priority", "left", "right", "max_end")
+
+    def __init__(self, start, end, item_id):
+        self.start = start
+        self.end = end
+        self.item_id = item_id
+        self.priority = random.random()
+        self.left = None
+        self.right = None
+        self.max_end = end
+
+
+class IntervalTree:
+    """
+    Treap ordered by (start, id) where every node tracks the largest end in its
+    subtree, so overlap queries skip whole subtrees that end before the window.
+    """
+
+    def __init__(self, intervals=()):
+        self._root = None
+        self._by_id: Dict[int, Tuple[datetime, datetime]] = {}
+        nodes = sorted(
+            (_Node(start, end, item_id) for start, end, item_id in intervals),
+            key=lambda node: (node.start, node.item_id)
+        )
+        self._root = self._build(nodes)
+        self._by_id = {node.item_id: (node.start, node.end) for node in nodes}
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __contains__(self, item_id):
+        return item_id in self._by_id
+
+    def _build(self, nodes):
+        """Linear-time treap construction from nodes already sorted by key."""
+        stack = []
+        for node in nodes:
+            last = None
+            while stack and stack[-1].priority < node.priority:
+                last = stack.pop()
+                self._update(last)
+            node.left = last
+            if stack:
+                stack[-1].right = node
+            stack.append(node)
+        while stack:
+            self._update(stack.pop())
+        return self._root_of(nodes)
+
+    @staticmethod
+    def _root_of(nodes):
+        return max(nodes, key=lambda node: node.priority) if nodes else None
+
+    @staticmethod
+    def _update(node):
+        node.max_end = node.end
+        if node.left and node.left.max_end > node.max_end:
+            node.max_end = node.left.max_end
+        if node.right and node.right.max_end > node.max_end:
+            node.max_end = node.right.max_end
+
+    def _split(self, node, key):
+        """Split into (keys < key, keys >= key)."""
+        if node is None:
+            return None, None
+        if (node.start, node.item_id) < key:
+            node.right, right = self._split(node.right, key)
+            self._update(node)
+            return node, right
+        left, node.left = self._split(node.left, key)
+        self._update(node)
+        return left, node
+
+    def _merge(self, left, right):
+        if left is None or right is None:
+            return left or right
+        if left.priority > right.priority:
+            left.right = self._merge(left.right, right)
+            self._update(left)
+            return left
+        right.left = self._merge(left, right.left)
+        self._update(right)
+        return right
+
+    def insert(self, start: datetime, end: datetime, item_id: int):
+        if item_id in self._by_id:
+            self.remove(item_id)
+        left, right = self._split(self._root, (start, item_id))
+        self._root = self._merge(self._merge(left, _Node(start, end, item_id)), right)
+        self._by_id[item_id] = (start, end)
+
+    def remove(self, item_id: int):
+        if item_id not in self._by_id:
+            return
+        start, _ = self._by_id.pop(item_id)
+        left, rest = self._split(self._root, (start, item_id))
+        _, right = self._split(rest, (start, item_id + 1))
+        self._root = self._merge(left, right)
+
+    def overlapping(self, start: datetime, end: datetime) -> List[Tuple[int, datetime, datetime]]:
+        """Intervals overlapping the half-open window [start, end), ordered by start."""
+        hits = []
+        stack = []
+        node = self._root
+        # In-order walk, pruning subtrees that end too early or start too late
+        while stack or node is not None:
+            while node is not None and node.max_end > start:
+                stack.append(node)
+                node = node.left
+            if not stack:
+                break
+            node = stack.pop()
+            if node.start >= end:
+                break
+            if node.end > start:
+                hits.append((node.item_id, node.start, node.end))
+            node = node.right
+        return hits
+
+
+_sqlite_key = comparable_key("sqlite")
+
+
+class _SQLiteIntervalIndex:
+    """Per-database interval trees keyed by ("location", name) or ("clinician", user_id)."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._trees: Dict[Tuple[str, str, object], IntervalTree] = {}
+        # Database revision the cached trees of each database were loaded at
+        self._revisions: Dict[str, int] = {}
+
+    @staticmethod
+    def _revision(db: Session) -> Optional[int]:
+        try:
+            return db.execute(text("SELECT revision FROM appointment_revision WHERE id = 1")).scalar()
+        except OperationalError:
+            # Database not migrated: nothing tells us when trees go stale
+            return None
+
+    @staticmethod
+    def _load(db: Session, kind: str, key) -> IntervalTree:
+        column = Appointment.location if kind == "location" else Appointment.created_by
+        rows = db.query(Appointment.id, Appointment.start_time, Appointment.end_time).filter(
+            column == key,
+            Appointment.status.notin_(INACTIVE_STATUSES)
+        ).all()
+        return IntervalTree((_sqlite_key(s), _sqlite_key(e), i) for i, s, e in rows)
+
+    def tree(self, db: Session, kind: str, key) -> IntervalTree:
+        # Read first: a write committed after this point changes the revision again
+        revision = self._revision(db)
+        if revision is None:
+            return self._load(db, kind, key)
+
+        url = str(db.get_bind().url)
+        with self._lock:
+            if self._revisions.get(url) != revision:
+                self._trees = {k: tree for k, tree in self._trees.items() if k[0] != url}
+                self._revisions[url] = revision
+            tree = self._trees.get((url, kind, key))
+            if tree is not None:
+                return tree
+
+        tree = self._load(db, kind, key)
+        with self._lock:
+            if self._revisions.get(url) != revision:
+                # Another request saw a newer revision meanwhile; don't cache an older view
+                return tree
+            return self._trees.setdefault((url, kind, key), tree)
+
+    def clear(self):
+        with self._lock:
+            self._trees.clear()
+            self._revisions.clear()
+
+
+sqlite_interval_index = _SQLiteIntervalIndex()
+
+# Trees are only valid for the table they were loaded from
+event.listen(Appointment.__table__, "after_create", lambda *args, **kwargs: sqlite_interval_index.clear())
+event.listen(Appointment.__table__, "after_drop", lambda *args, **kwargs: sqlite_interval_index.clear())
+
+
+def _conflict(resource: str, appointment_id: Optional[int], series_id: Optional[int], start, end) -> Dict:
+    return {
+        "resource": resource,
+        "appointment_id": appointment_id,
+        "series_id": series_id,
+        "start_time": start,
+        "end_time": end,
+    }
+
+
+def _appointment_conflicts(db: Session, start: datetime, end: datetime, resources, exclude_id):
+    conflicts = []
+    if db.get_bind().dialect.name == "postgresql":
+        window = func.tstzrange(literal(start), literal(end), "[)")
+        for resource, column, value in resources:
+            query = db.query(Appointment.id, Appointment.start_time, Appointment.end_time).filter(
+                column == value,
+                Appointment.status.notin_(INACTIVE_STATUSES),
+                func.tstzrange(Appointment.start_time, Appointment.end_time, "[)").op("&&")(window),
+            )
+            if exclude_id:
+                query = query.filter(Appointment.id != exclude_id)
+            rows = query.all()
+            conflicts.extend(_conflict(resource, i, None, s, e) for i, s, e in rows)
+        return conflicts
+
+    naive_start = _sqlite_key(start)
+    naive_end = _sqlite_key(end)
+    for resource, _, value in resources:
+        tree = sqlite_interval_index.tree(db, resource, value)
+        for item_id, s, e in tree.overlapping(naive_start, naive_end):
+            if item_id != exclude_id:
+                conflicts.append(_conflict(resource, item_id, None, s, e))
+    return conflicts
+
+
+def _series_conflicts(db: Session, start: datetime, end: datetime, resources, exclude_series_id=None):
+    filters = [
+        (AppointmentSeries.location if resource == "location" else AppointmentSeries.created_by) == value
+        for resource, _, value in resources
+    ]
+    series_list = db.query(AppointmentSeries).filter(
+        or_(*filters),
+        AppointmentSeries.status.notin_(INACTIVE_STATUSES),
+        AppointmentSeries.start_time < end,
+        or_(AppointmentSeries.until.is_(None), AppointmentSeries.until >= start - MAX_APPOINTMENT_DURATION),
+    ).all()
+
+    conflicts = []
+    for series in series_list:
+        if series.id == exclude_series_id:
+            continue
+        for _, occ_start, occ_end in expand_in_window(series, start - MAX_APPOINTMENT_DURATION, end):
+            if occ_end > align_datetime(start, occ_end) and occ_start < align_datetime(end, occ_start):
+                for resource, _, value in resources:
+                    series_value = series.location if resource == "location" else series.created_by
+                    if series_value == value:
+                        conflicts.append(_conflict(resource, None, series.id, occ_start, occ_end))
+    return conflicts
+
+
+def _resources(location: Optional[str], clinician_id: Optional[int]):
+    resources = []
+    if location is not None:
+        resources.append(("location", Appointment.location, location))
+    if clinician_id is not None:
+        resources.append(("clinician", Appointment.created_by, clinician_id))
+    return resources
+
+
+def find_conflicts(
+    db: Session,
+    start: datetime,
+    end: datetime,
+    location: Optional[str] = None,
+    clinician_id: Optional[int] = None,
+    exclude_id: Optional[int] = None,
+) -> List[Dict]:
+    """Active bookings and series occurrences overlapping [start, end) in the same room or for the same clinician."""
+    resources = _resources(location, clinician_id)
+    if not resources:
+        return []
+    return (
+        _appointment_conflicts(db, start, end, resources, exclude_id)
+        + _series_conflicts(db, start, end, resources)
+    )
+
+
+def find_series_conflicts(db: Session, series: AppointmentSeries) -> List[Dict]:
+    """
+    Check every occurrence of a new series (up to SERIES_CONFLICT_HORIZON) against
+    existing one-off bookings and the occurrences of other active series, using
+    one interval tree per resource for the whole span.
+    """
+    resources = _resources(series.location, series.created_by)
+    horizon = series.start_time + SERIES_CONFLICT_HORIZON
+    span_end = min(align_datetime(series.until, horizon), horizon) if series.until else horizon
+    occurrences = expand_in_window(series, series.start_time, span_end)
+    if not occurrences:
+        return []
+
+    span_start = occurrences[0][1]
+    span_stop = occurrences[-1][2]
+    naive = comparable_key(db.get_bind().dialect.name)
+    conflicts = []
+    for resource, column, value in resources:
+        rows = db.query(Appointment.id, Appointment.start_time, Appointment.end_time).filter(
+            column == value,
+            Appointment.status.notin_(INACTIVE_STATUSES),
+            Appointment.start_time < span_stop,
+            Appointment.start_time >= span_start - MAX_APPOINTMENT_DURATION,
+        ).all()
+        if not rows:
+            continue
+        tree = IntervalTree((naive(s), naive(e), i) for i, s, e in rows)
+        for _, occ_start, occ_end in occurrences:
+            for item_id, s, e in tree.overlapping(naive(occ_start), naive(occ_end)):
+                conflicts.append(_conflict(resource, item_id, None, s, e))
+
+    conflicts.extend(_series_against_series(db, series, occurrences, resources, naive))
+    return conflicts
+
+
+def _series_against_series(db: Session, series: AppointmentSeries, occurrences, resources, naive) -> List[Dict]:
+    span_start = occurrences[0][1]
+    span_stop = occurrences[-1][2]
+    filters = [
+        (AppointmentSeries.location if resource == "location" else AppointmentSeries.created_by) == value
+        for resource, _, value in resources
+    ]
+    query = db.query(AppointmentSeries).filter(
+        or_(*filters),
+        AppointmentSeries.status.notin_(INACTIVE_STATUSES),
+        AppointmentSeries.start_time < span_stop,
+        or_(
+            AppointmentSeries.until.is_(None),
+            AppointmentSeries.until >= span_start - MAX_APPOINTMENT_DURATION,
+        ),
+    )
+    if series.id is not None:
+        query = query.filter(AppointmentSeries.id != series.id)
+    others = query.all()
+    if not others:
+        return []
+
+    conflicts = []
+    for resource, _, value in resources:
+        # Tree ids index into the other series' occurrences
+        spans = [
+            (other.id, occ_start, occ_end)
+            for other in others
+            if (other.location if resource == "location" else other.created_by) == value
+            for _, occ_start, occ_end in expand_in_window(other, span_start - MAX_APPOINTMENT_DURATION, span_stop)
+        ]
+        if not spans:
+            continue
+        tree = IntervalTree((naive(s), naive(e), index) for index, (_, s, e) in enumerate(spans))
+        for _, occ_start, occ_end in occurrences:
+            for index, _, _ in tree.overlapping(naive(occ_start), naive(occ_end)):
+                other_id, s, e = spans[index]
+                conflicts.append(_conflict(resource, None, other_id, s, e))
+    return conflicts
@@ -0,0 +1,191 @@
+"""
+Free-slot search over rooms and clinicians.
+
+Busy intervals for every requested resource come back from one indexed range
+query, closed hours are added as synthetic busy blocks, and a single NumPy sweep
+(sort + running max of end times) yields the gaps for all resources at once.
+
+The sweep runs on the timeline comparable_key maps stored values to: UTC on
+Postgres, stored wall-clock time on SQLite. Opening hours are clinic-local
+(CLINIC_TIMEZONE), so each day's opening and closing times are converted onto
+that timeline, which also keeps them right across DST changes.
+"""
+import os
+from datetime import datetime, time, timedelta, timezone, tzinfo
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from zoneinfo import ZoneInfo
+
+import numpy as np
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from api.models.appointment import Appointment, AppointmentSeries
+from api.services.appointment_conflicts import INACTIVE_STATUSES, MAX_APPOINTMENT_DURATION, comparable_key
+from api.services.recurrence import expand_in_window
+
+Resource = Tuple[str, object]  # ("location", "Clinic 4A") or ("clinician", 7)
+
+CLINIC_TIMEZONE = os.getenv("CLINIC_TIMEZONE", "UTC")
+
+
+def _timeline(dialect_name: str, clinic_tz: tzinfo) -> Tuple[Callable, Callable]:
+    """(to_local, to_timeline) between comparable_key's naive values and clinic-local aware datetimes."""
+    if dialect_name == "sqlite":
+        # Stored wall-clock time is taken to be clinic time
+        return (lambda value: value.replace(tzinfo=clinic_tz)), (lambda value: value.replace(tzinfo=None))
+    return (
+        lambda value: value.replace(tzinfo=timezone.utc).astimezone(clinic_tz),
+        lambda value: value.astimezone(timezone.utc).replace(tzinfo=None),
+    )
+
+
+def _busy_intervals(
+    db: Session,
+    resources: Sequence[Resource],
+    start: datetime,
+    end: datetime,
+) -> Dict[Resource, List[Tuple[datetime, datetime]]]:
+    locations = [key for kind, key in resources if kind == "location"]
+    clinicians = [key for kind, key in resources if kind == "clinician"]
+    busy: Dict[Resource, List[Tuple[datetime, datetime]]] = {resource: [] for resource in resources}
+
+    filters = []
+    if locations:
+        filters.append(Appointment.location.in_(locations))
+    if clinicians:
+        filters.append(Appointment.created_by.in_(clinicians))
+    rows = db.query(
+        Appointment.location, Appointment.created_by, Appointment.start_time, Appointment.end_time
+    ).filter(
+        or_(*filters),
+        Appointment.status.notin_(INACTIVE_STATUSES),
+        Appointment.start_time < end,
+        Appointment.start_time >= start - MAX_APPOINTMENT_DURATION,
+    ).all()
+    for location, created_by, s, e in rows:
+        if ("location", location) in busy:
+            busy[("location", location)].append((s, e))
+        if ("clinician", created_by) in busy:
+            busy[("clinician", created_by)].append((s, e))
+
+    series_filters = []
+    if locations:
+        series_filters.append(AppointmentSeries.location.in_(locations))
+    if clinicians:
+        series_filters.append(AppointmentSeries.created_by.in_(clinicians))
+    series_list = db.query(AppointmentSeries).filter(
+        or_(*series_filters),
+        AppointmentSeries.status.notin_(INACTIVE_STATUSES),
+        AppointmentSeries.start_time < end,
+        or_(AppointmentSeries.until.is_(None), AppointmentSeries.until >= start - MAX_APPOINTMENT_DURATION),
+    ).all()
+    for series in series_list:
+        occurrences = [(s, e) for _, s, e in expand_in_window(series, start - MAX_APPOINTMENT_DURATION, end)]
+        for resource in (("location", series.location), ("clinician", series.created_by)):
+            if resource in busy:
+                busy[resource].extend(occurrences)
+
+    return busy
+
+
+def _closed_hours(start: datetime, end: datetime, day_start: int, day_end: int,
+                  to_local: Callable, to_timeline: Callable) -> np.ndarray:
+    """Busy blocks covering everything outside [day_start, day_end) clinic time on each day of the window."""
+    day = to_local(start).date() - timedelta(days=1)
+    last_day = to_local(end).date() + timedelta(days=1)
+    local_tz = to_local(start).tzinfo
+    blocks = []
+    while day <= last_day:
+        midnight = datetime.combine(day, time(), tzinfo=local_tz)
+        next_midnight = datetime.combine(day + timedelta(days=1), time(), tzinfo=local_tz)
+        # Closed from midnight until today's open, and from close until midnight
+        blocks.append((midnight, midnight + timedelta(hours=day_start)))
+        blocks.append((midnight + timedelta(hours=day_end), next_midnight))
+        day += timedelta(days=1)
+    return np.array(
+        [(np.datetime64(to_timeline(s), "s"), np.datetime64(to_timeline(e), "s")) for s, e in blocks],
+        dtype="datetime64[s]"
+    ).astype("int64").reshape(-1, 2)
+
+
+def find_free_slots(
+    db: Session,
+    resources: Sequence[Resource],
+    start: datetime,
+    end: datetime,
+    duration: timedelta,
+    day_start: int = 8,
+    day_end: int = 18,
+    limit_per_resource: Optional[int] = None,
+    clinic_timezone: Optional[str] = None,
+) -> List[Dict]:
+    """
+    Free windows of at least `duration` inside [start, end) and opening hours
+    (in `clinic_timezone`, default CLINIC_TIMEZONE), per resource. Each window
+    reports how many back-to-back slots it fits.
+    """
+    dialect_name = db.get_bind().dialect.name
+    key = comparable_key(dialect_name)
+    start, end = key(start), key(end)
+    busy = _busy_intervals(db, resources, start, end)
+
+    window_start = np.datetime64(start, "s").astype("int64")
+    window_end = np.datetime64(end, "s").astype("int64")
+    to_local, to_timeline = _timeline(dialect_name, ZoneInfo(clinic_timezone or CLINIC_TIMEZONE))
+    # Days are padded for the offset to UTC; the sentinels below cover what lies outside the window
+    closed = np.clip(_closed_hours(start, end, day_start, day_end, to_local, to_timeline), window_start, window_end)
+    # Shift each resource onto its own stretch of the number line so one sort handles all of them
+    stride = (window_end - window_start) + 4 * 86400
+
+    starts, ends, owners = [], [], []
+    for index, resource in enumerate(resources):
+        intervals = busy[resource]
+        resource_busy = np.array(
+            [(np.datetime64(key(s), "s"), np.datetime64(key(e), "s")) for s, e in intervals],
+            dtype="datetime64[s]"
+        ).astype("int64").reshape(-1, 2)
+        # Everything outside the window counts as busy
+        sentinels = np.array(
+            [[window_start - 2 * 86400, window_start], [window_end, window_end + 2 * 86400]], dtype="int64"
+        )
+        blocks = np.concatenate([resource_busy, closed, sentinels]) - window_start + index * stride
+        starts.append(blocks[:, 0])
+        ends.append(blocks[:, 1])
+        owners.append(np.full(len(blocks), index))
+
+    if not starts:
+        return []
+
+    starts = np.concatenate(starts)
+    ends = np.concatenate(ends)
+    owners = np.concatenate(owners)
+    order = np.argsort(starts, kind="stable")
+    starts, ends, owners = starts[order], ends[order], owners[order]
+
+    covered_until = np.maximum.accumulate(ends)
+    gap_starts = covered_until[:-1]
+    gap_ends = starts[1:]
+    seconds = int(duration.total_seconds())
+    fits = (gap_ends - gap_starts >= seconds) & (owners[:-1] == owners[1:])
+
+    results = []
+    gap_owners = owners[:-1][fits]
+    free_starts = gap_starts[fits]
+    free_ends = gap_ends[fits]
+    for index, resource in enumerate(resources):
+        mask = gap_owners == index
+        resource_starts = free_starts[mask] - index * stride + window_start
+        resource_ends = free_ends[mask] - index * stride + window_start
+        if limit_per_resource is not None:
+            resource_starts = resource_starts[:limit_per_resource]
+            resource_ends = resource_ends[:limit_per_resource]
+        windows = [
+            {
+                "start": np.datetime64(int(s), "s").astype(datetime),
+                "end": np.datetime64(int(e), "s").astype(datetime),
+                "slots": int((e - s) // seconds),
+            }
+            for s, e in zip(resource_starts, resource_ends)
+        ]
+        results.append({"resource": resource[0], "key": resource[1], "free": windows})
+    return results
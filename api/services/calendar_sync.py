@@ -0,0 +1,259 @@
+"""
+Calendar export: a signed per-clinician iCalendar feed and token-based delta sync.
+
+Sync tokens carry a change watermark over coalesce(updated_at, created_at) and
+tombstone deletion times. Each sync only returns changes strictly before the
+database clock reading taken at its start, so a row changed again within the
+same (second-resolution, on SQLite) tick is picked up by the next sync. When a
+page is cut short, the token also lists the items already returned at the
+watermark instant; the next request reads from the watermark inclusive and
+skips those.
+"""
+import base64
+import hashlib
+import hmac
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import DateTime, func, literal, or_
+from sqlalchemy.orm import Session
+
+from api.deps import SECRET_KEY
+from api.models.appointment import Appointment, AppointmentSeries, AppointmentTombstone
+from api.models.user import User
+from api.services.recurrence import align_datetime, parse_weekdays
+
+# The feed covers recent history and the coming year; calendar apps keep older events
+FEED_PAST_DAYS = 30
+FEED_FUTURE_DAYS = 365
+
+_PRODID = "-//Secure Medical Notes//Appointments//EN"
+_UID_DOMAIN = "secure-medical-notes"
+_WEEKDAYS = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")
+
+
+class InvalidSyncToken(ValueError):
+    pass
+
+
+def feed_signature(user: User) -> str:
+    """
+    Signature that authorizes the unauthenticated feed URL for one user. It covers
+    the user's feed rotation, so rotating revokes URLs handed out before.
+    """
+    payload = f"calendar-feed:{user.id}:{user.calendar_feed_rotation or 0}"
+    return hmac.new(SECRET_KEY.encode(), payload.encode(), hashlib.sha256).hexdigest()
+
+
+def verify_feed_signature(user: Optional[User], signature: str) -> bool:
+    """Valid only for an existing, active user and their current rotation."""
+    if user is None or not user.is_active:
+        return False
+    return hmac.compare_digest(feed_signature(user), signature or "")
+
+
+def encode_sync_token(since: Optional[datetime], seen: List[str]) -> str:
+    raw = json.dumps({"since": since.isoformat() if since else None, "seen": sorted(seen)}).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_sync_token(token: str) -> Tuple[Optional[datetime], List[str]]:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(token.encode()))
+        since = datetime.fromisoformat(data["since"]) if data["since"] else None
+        return since, [str(key) for key in data["seen"]]
+    except Exception:
+        raise InvalidSyncToken("Invalid sync token")
+
+
+def _change_key(expr, dialect_name: str):
+    # Same reasoning as the timeline keyset: compare SQLite text timestamps on julianday()
+    if dialect_name == "sqlite":
+        return func.julianday(expr)
+    return expr
+
+
+def _sources():
+    return (
+        ("appointment", Appointment,
+         func.coalesce(Appointment.updated_at, Appointment.created_at), Appointment.created_by),
+        ("series", AppointmentSeries,
+         func.coalesce(AppointmentSeries.updated_at, AppointmentSeries.created_at), AppointmentSeries.created_by),
+        ("deleted", AppointmentTombstone, AppointmentTombstone.deleted_at, AppointmentTombstone.created_by),
+    )
+
+
+def changes_since(db: Session, user_id: int, token: Optional[str] = None, limit: int = 500) -> Dict:
+    """
+    Appointments, series and deletions for one clinician changed since `token`,
+    oldest change first. Without a token, returns everything that currently exists.
+    """
+    since, seen = decode_sync_token(token) if token else (None, [])
+    seen_keys = set(seen)
+    dialect_name = db.get_bind().dialect.name
+    cutoff = db.query(func.now()).scalar()
+
+    changes = []
+    for kind, model, changed_at, owner in _sources():
+        if kind == "deleted" and token is None:
+            # A fresh client has nothing to delete
+            continue
+        key = _change_key(changed_at, dialect_name)
+        query = db.query(model, changed_at.label("changed_at")).filter(
+            owner == user_id,
+            key < _change_key(literal(cutoff, DateTime(timezone=True)), dialect_name),
+        )
+        if since is not None:
+            query = query.filter(key >= _change_key(literal(since, DateTime(timezone=True)), dialect_name))
+        rows = query.order_by(key.asc(), model.id.asc()).limit(limit + 1 + len(seen_keys)).all()
+        for item, item_changed_at in rows:
+            item_key = f"{kind}:{item.id}"
+            if item_key not in seen_keys:
+                changes.append((item_changed_at, item_key, kind, item))
+
+    changes.sort(key=lambda change: (change[0], change[1]))
+    page = changes[:limit]
+
+    has_more = len(changes) > limit
+    if has_more:
+        watermark = page[-1][0]
+        new_seen = [item_key for changed_at, item_key, _, _ in page if changed_at == watermark]
+        if since is not None and watermark == since:
+            new_seen += seen
+    else:
+        watermark, new_seen = cutoff, []
+
+    result = {"appointments": [], "series": [], "deleted": []}
+    for _, _, kind, item in page:
+        if kind == "deleted":
+            result["deleted"].append({"kind": item.kind, "id": item.item_id, "deleted_at": item.deleted_at})
+        else:
+            result["appointments" if kind == "appointment" else "series"].append(item)
+    result["next_token"] = encode_sync_token(watermark, new_seen)
+    result["has_more"] = has_more
+    return result
+
+
+def record_tombstone(db: Session, kind: str, item_id: int, created_by: int):
+    """Add a tombstone in the caller's transaction, alongside the delete."""
+    db.add(AppointmentTombstone(kind=kind, item_id=item_id, created_by=created_by))
+
+
+def _feed_window(now: datetime) -> Tuple[datetime, datetime]:
+    return now - timedelta(days=FEED_PAST_DAYS), now + timedelta(days=FEED_FUTURE_DAYS)
+
+
+def feed_version(db: Session, user_id: int, now: Optional[datetime] = None) -> str:
+    """Cheap ETag for a user's feed, so polling clients get 304 until something changes."""
+    now = now or datetime.now()
+    parts = [now.date().isoformat()]
+    for _, model, changed_at, owner in _sources():
+        count, latest, top_id = db.query(
+            func.count(model.id), func.max(changed_at), func.max(model.id)
+        ).filter(owner == user_id).one()
+        parts.append(f"{count}:{latest}:{top_id}")
+    return hashlib.sha256("|".join(parts).encode()).hexdigest()[:32]
+
+
+def _escape(text: Optional[str]) -> str:
+    if not text:
+        return ""
+    return (
+        text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+        .replace("\r\n", "\\n").replace("\n", "\\n")
+    )
+
+
+def _fold(line: str) -> str:
+    """Fold content lines at 75 octets (RFC 5545 section 3.1)."""
+    if len(line.encode()) <= 75:
+        return line
+    parts, current, size = [], "", 0
+    for char in line:
+        width = len(char.encode())
+        if size + width > 75:
+            parts.append(current)
+            current, size = " ", 1
+        current += char
+        size += width
+    parts.append(current)
+    return "\r\n".join(parts)
+
+
+def _ics_datetime(value: datetime) -> str:
+    # Naive values are wall-clock times and are emitted as floating times
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    return value.strftime("%Y%m%dT%H%M%S")
+
+
+def _ics_status(status: Optional[str]) -> str:
+    if status == "cancelled":
+        return "CANCELLED"
+    if status in ("pending", "tentative"):
+        return "TENTATIVE"
+    return "CONFIRMED"
+
+
+def _rrule(series: AppointmentSeries) -> str:
+    parts = [f"FREQ={series.frequency.upper()}", f"INTERVAL={series.interval or 1}"]
+    if series.frequency == "weekly":
+        days = parse_weekdays(series.by_weekday, series.start_time.weekday())
+        parts.append("BYDAY=" + ",".join(_WEEKDAYS[day] for day in days))
+    if series.count:
+        parts.append(f"COUNT={series.count}")
+    elif series.until:
+        parts.append(f"UNTIL={_ics_datetime(align_datetime(series.until, series.start_time))}")
+    return "RRULE:" + ";".join(parts)
+
+
+def _event(uid: str, stamp: str, item, start: datetime, end: datetime, extra: List[str]) -> List[str]:
+    # Patient names and free-text notes stay out of the feed; it leaves our systems
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:{uid}@{_UID_DOMAIN}",
+        f"DTSTAMP:{stamp}",
+        f"DTSTART:{_ics_datetime(start)}",
+        f"DTEND:{_ics_datetime(end)}",
+        f"SUMMARY:{_escape(f'{item.title} ({item.appointment_type})')}",
+        f"LOCATION:{_escape(item.location)}",
+        f"STATUS:{_ics_status(item.status)}",
+    ]
+    changed = item.updated_at or item.created_at
+    if changed is not None:
+        # Server timestamps are UTC even when the driver returns them naive
+        lines.append(f"LAST-MODIFIED:{_ics_datetime(changed if changed.tzinfo else changed.replace(tzinfo=timezone.utc))}")
+    return lines + extra + ["END:VEVENT"]
+
+
+def render_feed(db: Session, user_id: int, now: Optional[datetime] = None) -> str:
+    """iCalendar document with the user's appointments in the feed window; series use RRULE."""
+    now = now or datetime.now()
+    window_start, window_end = _feed_window(now)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+    appointments = db.query(Appointment).filter(
+        Appointment.created_by == user_id,
+        Appointment.start_time >= window_start,
+        Appointment.start_time <= window_end,
+    ).order_by(Appointment.start_time.asc()).all()
+    series_list = db.query(AppointmentSeries).filter(
+        AppointmentSeries.created_by == user_id,
+        AppointmentSeries.start_time <= window_end,
+        or_(AppointmentSeries.until.is_(None), AppointmentSeries.until >= window_start),
+    ).all()
+
+    lines = ["BEGIN:VCALENDAR", "VERSION:2.0", f"PRODID:{_PRODID}", "CALSCALE:GREGORIAN", "METHOD:PUBLISH"]
+    for appointment in appointments:
+        lines += _event(
+            f"appointment-{appointment.id}", stamp, appointment,
+            appointment.start_time, appointment.end_time, []
+        )
+    for series in series_list:
+        lines += _event(
+            f"series-{series.id}", stamp, series,
+            series.start_time, series.start_time + timedelta(minutes=series.duration_minutes), [_rrule(series)]
+        )
+    lines.append("END:VCALENDAR")
+    return "\r\n".join(_fold(line) for line in lines) + "\r\n"
@@ -0,0 +1,149 @@
+"""
+Clinical term matching for the rule-based heuristics (mock summaries and risk
+assessments, risk factor and tag extraction).
+
+CLINICAL_LEXICON maps each concept to its surface forms: abbreviations (HTN,
+SOB, DM), synonyms and inflections. ClinicalTermMatcher compiles every form into
+one Aho-Corasick automaton over words, so a note is tokenized once and scanned
+once however many terms there are, and terms only match whole words ("ct" no
+longer matches inside "affected"). Overlapping terms are all reported: "chest
+pain" also yields "pain".
+"""
+import re
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Iterable, List, Sequence, Tuple
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+CLINICAL_LEXICON: Dict[str, Tuple[str, ...]] = {
+    # Findings and conditions
+    "chest pain": ("chest pain", "chest pains", "chest tightness", "angina"),
+    "shortness of breath": ("shortness of breath", "short of breath", "sob", "breathlessness"),
+    "dyspnea": ("dyspnea", "dyspnoea", "dyspneic"),
+    "hypertension": ("hypertension", "hypertensive", "htn", "high blood pressure", "elevated blood pressure"),
+    "blood pressure": ("blood pressure", "bp"),
+    "diabetes": ("diabetes", "diabetic", "diabetes mellitus", "dm", "t1dm", "t2dm", "iddm", "niddm"),
+    "glucose": ("glucose", "blood sugar", "hyperglycemia", "hypoglycemia", "hba1c", "a1c"),
+    "fever": ("fever", "fevers", "febrile", "pyrexia"),
+    "infection": ("infection", "infections", "infected", "uti", "pneumonia", "cellulitis"),
+    "headache": ("headache", "headaches", "cephalgia", "migraine"),
+    "imaging": ("mri", "ct", "ct scan", "cat scan"),
+    "asthma": ("asthma", "asthmatic"),
+    "wheezing": ("wheezing", "wheeze", "wheezes"),
+    "cough": ("cough", "coughing", "coughs"),
+    "pain": ("pain", "pains", "painful", "ache", "aches"),
+    "dizziness": ("dizziness", "dizzy", "lightheaded", "lightheadedness", "vertigo"),
+    "nausea": ("nausea", "nauseous", "nauseated"),
+    "vomiting": ("vomiting", "vomited", "emesis"),
+    "bleeding": ("bleeding", "bleed", "hemorrhage", "haemorrhage"),
+    "swelling": ("swelling", "swollen", "edema", "oedema"),
+    "confusion": ("confusion", "confused", "disoriented", "altered mental status", "ams"),
+    "weakness": ("weakness", "weak"),
+    "fatigue": ("fatigue", "fatigued", "tired", "malaise"),
+    "weight loss": ("weight loss", "lost weight"),
+    "weight gain": ("weight gain", "gained weight"),
+    # Severity and course
+    "severe": ("severe", "severely"),
+    "critical": ("critical", "critically"),
+    "unstable": ("unstable", "deteriorating"),
+    "urgent": ("urgent", "urgently", "stat"),
+    "emergency": ("emergency", "emergent"),
+    "routine": ("routine",),
+    "stable": ("stable",),
+    "well controlled": ("well controlled",),
+    "improved": ("improved", "improving"),
+    "normal": ("normal", "wnl", "within normal limits"),
+}
+
+
+# Concepts that describe severity or course rather than a finding
+COURSE_CONCEPTS = frozenset({
+    "severe", "critical", "unstable", "urgent", "emergency",
+    "routine", "stable", "well controlled", "improved", "normal",
+})
+
+
+def _words(text: str) -> List[str]:
+    return _WORD.findall(text.lower())
+
+
+@dataclass(frozen=True)
+class TermHit:
+    concept: str
+    term: str
+    start: int
+    end: int
+
+
+class ClinicalTermMatcher:
+    def __init__(self, lexicon: Dict[str, Iterable[str]] = CLINICAL_LEXICON):
+        # State 0 is the root; goto[state] maps the next word to a state
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # (concept, term, length in words) ending at each state, including via failure links
+        self._out: List[Tuple[Tuple[str, str, int], ...]] = [()]
+
+        for concept, terms in lexicon.items():
+            for term in terms:
+                words = _words(term)
+                if not words:
+                    continue
+                state = 0
+                for word in words:
+                    if word not in self._goto[state]:
+                        self._goto.append({})
+                        self._fail.append(0)
+                        self._out.append(())
+                        self._goto[state][word] = len(self._goto) - 1
+                    state = self._goto[state][word]
+                self._out[state] += ((concept, term, len(words)),)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for word, child in self._goto[state].items():
+                queue.append(child)
+                fallback = self._fail[state]
+                while fallback and word not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(word, 0)
+                self._fail[child] = target if target != child else 0
+                self._out[child] += self._out[self._fail[child]]
+
+    def concepts(self, text: str) -> FrozenSet[str]:
+        """Every concept mentioned in the text."""
+        goto, fail, out = self._goto, self._fail, self._out
+        found = set()
+        state = 0
+        for word in _words(text or ""):
+            while state and word not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(word, 0)
+            for concept, _, _ in out[state]:
+                found.add(concept)
+        return frozenset(found)
+
+    def concepts_many(self, texts: Sequence[str]) -> List[FrozenSet[str]]:
+        """concepts() for each text, e.g. a page of notes."""
+        return [self.concepts(text) for text in texts]
+
+    def scan(self, text: str) -> List[TermHit]:
+        """Every term occurrence with its character span, in order of where it ends."""
+        goto, fail, out = self._goto, self._fail, self._out
+        # Spans index the lowercased text, which has the same length for clinical (ASCII) text
+        lowered = (text or "").lower()
+        spans = [match.span() for match in _WORD.finditer(lowered)]
+        hits = []
+        state = 0
+        for index, (start, end) in enumerate(spans):
+            word = lowered[start:end]
+            while state and word not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(word, 0)
+            for concept, term, length in out[state]:
+                hits.append(TermHit(concept, term, spans[index - length + 1][0], end))
+        return hits
+
+
+clinical_terms = ClinicalTermMatcher()
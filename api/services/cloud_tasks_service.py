@@ -3,8 +3,7 @@ Google Cloud Tasks integration for background job processing.
 Replaces Celery for Cloud Run environment.
 """
 import os
-from google.cloud import tasks_v2
-from google.protobuf import timestamp_pb2
+import threading
 import datetime
 from typing import Optional, Dict, Any
 import json
@@ -13,9 +12,18 @@ PROJECT_ID = os.getenv("GCP_PROJECT_ID", "securemed-ai")
 LOCATION = os.getenv("GCP_REGION", "us-central1")
 QUEUE_NAME = "mednotes-tasks"
 
+_client = None
+_client_lock = threading.Lock()
+
 def get_tasks_client():
-    """Get Cloud Tasks client."""
-    return tasks_v2.CloudTasksClient()
+    """Get the process's Cloud Tasks client, importing the GCP SDK on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            # The SDK (grpc, protobuf) is slow to import; keep it off the startup path
+            from google.cloud import tasks_v2
+            _client = tasks_v2.CloudTasksClient()
+        return _client
 
 def create_task(
     endpoint: str,
@@ -35,6 +43,8 @@ def create_task(
     Returns:
         Task name/ID
     """
+    from google.cloud import tasks_v2
+    
     client = get_tasks_client()
     
     # Construct the queue path
@@ -63,6 +73,7 @@ def create_task(
     
     # Schedule task if time provided
     if schedule_time:
+        from google.protobuf import timestamp_pb2
         timestamp = timestamp_pb2.Timestamp()
         timestamp.FromDatetime(schedule_time)
         task["schedule_time"] = timestamp
@@ -0,0 +1,193 @@
+"""
+Token-bounded chart context for prompts that look at a patient's whole chart.
+
+The newest notes go in verbatim, then the highest-risk older ones while they fit.
+Everything older is represented by its per-note summary (the one saved when the
+note was summarized, else its opening sentences). If even those exceed what is
+left of the budget they are condensed map-reduce style, in groups taken oldest
+first, so a group's text, and therefore its cached condensation, stays the same
+as new notes arrive. The result never exceeds the budget, however long the chart.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+RISK_CONTEXT_TOKEN_BUDGET = int(os.getenv("RISK_CONTEXT_TOKEN_BUDGET", "6000"))
+RECENT_NOTES_VERBATIM = 3
+# Verbatim notes may use this share of the budget; the rest is kept for older history
+VERBATIM_SHARE = 0.6
+# Per-note cap on a summary standing in for an older note
+NOTE_SUMMARY_TOKENS = 120
+# Input and output size of one condensation call, and how many times condensed text may be
+# condensed again. The output size is fixed rather than a share of the budget so that an
+# unchanged group makes an identical, cacheable request.
+REDUCE_GROUP_TOKENS = 3000
+CONDENSED_GROUP_TOKENS = 300
+MAX_REDUCE_ROUNDS = 3
+HIGH_RISK_LEVELS = ("high", "critical")
+
+RECENT_HEADING = "RECENT AND HIGH-RISK NOTES (full text):"
+HISTORY_HEADING = "EARLIER HISTORY (summarized):"
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # Not installed, or its BPE file can't be fetched offline
+        return None
+
+
+def count_tokens(text: str) -> int:
+    encoding = _encoding()
+    if encoding is None:
+        # About four characters per token for English clinical text
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    encoding = _encoding()
+    if encoding is None:
+        return text[:max(max_tokens * 4 - 3, 0)].rstrip() + "..."
+    # Re-encoding a decoded prefix can merge differently, so leave a token spare
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:max(max_tokens - 2, 0)]) + "..."
+
+
+@dataclass
+class ChartNote:
+    title: str
+    content: str
+    created_at: Optional[datetime] = None
+    risk_level: Optional[str] = None
+    summary: Optional[str] = None
+
+    @classmethod
+    def from_note(cls, note) -> "ChartNote":
+        return cls(
+            title=note.title or "",
+            content=note.content or "",
+            created_at=note.created_at,
+            risk_level=note.risk_level,
+            summary=note.summary,
+        )
+
+    def entry(self, body: str) -> str:
+        date = self.created_at.strftime("%Y-%m-%d") if self.created_at else "undated"
+        return f"[{date}] {self.title}: {body}"
+
+    def short_summary(self) -> str:
+        if self.summary:
+            return truncate_to_tokens(self.summary.strip(), NOTE_SUMMARY_TOKENS)
+        # Unsummarized notes: their opening sentences
+        return truncate_to_tokens(" ".join(self.content.split()), NOTE_SUMMARY_TOKENS)
+
+
+@dataclass
+class ChartContext:
+    text: str
+    tokens: int
+    stats: Dict[str, int] = field(default_factory=dict)
+
+
+def build_chart_context(
+    notes: Sequence[ChartNote],
+    token_budget: int = RISK_CONTEXT_TOKEN_BUDGET,
+    condense: Optional[Callable[[str, int], Optional[str]]] = None,
+    header: str = "",
+) -> ChartContext:
+    """
+    Pack `notes` (newest first) under `token_budget`. `condense(text, max_tokens)`
+    shortens a group of older summaries, returning None if it can't; without it,
+    the oldest summaries are dropped instead.
+    """
+    stats = {"notes": len(notes), "verbatim": 0, "summarized": 0, "condensed_groups": 0, "omitted": 0}
+    parts = [header] if header else []
+    remaining = token_budget - count_tokens("\n\n".join(parts + [RECENT_HEADING, HISTORY_HEADING]))
+
+    # Newest notes first, then older high-risk ones, newest first
+    candidates = list(range(min(RECENT_NOTES_VERBATIM, len(notes))))
+    candidates += [
+        index for index in range(len(candidates), len(notes))
+        if (notes[index].risk_level or "").lower() in HIGH_RISK_LEVELS
+    ]
+    verbatim_budget = int(remaining * VERBATIM_SHARE)
+    verbatim: Dict[int, str] = {}
+    for index in candidates:
+        entry = notes[index].entry(notes[index].content)
+        cost = count_tokens(entry)
+        if cost > verbatim_budget and not verbatim:
+            # An oversized newest note still leads, cut to fit
+            entry = truncate_to_tokens(entry, verbatim_budget)
+            cost = count_tokens(entry)
+        if entry and cost <= verbatim_budget:
+            verbatim[index] = entry
+            verbatim_budget -= cost
+            remaining -= cost + 1
+    stats["verbatim"] = len(verbatim)
+    if verbatim:
+        parts.append("\n".join([RECENT_HEADING] + [verbatim[index] for index in sorted(verbatim)]))
+
+    # Oldest first: earlier groups don't change when notes are added
+    older = [note for index, note in reversed(list(enumerate(notes))) if index not in verbatim]
+    lines = [note.entry(note.short_summary()) for note in older]
+    stats["summarized"] = len(lines)
+    lines, stats["condensed_groups"] = _condense(lines, remaining, condense)
+
+    # Whatever still doesn't fit goes, oldest first
+    while lines and count_tokens("\n".join(lines)) > remaining:
+        if len(lines) == 1:
+            lines = [truncate_to_tokens(lines[0], remaining)]
+            break
+        lines.pop(0)
+        stats["omitted"] += 1
+    if any(lines):
+        parts.append("\n".join([HISTORY_HEADING] + lines))
+
+    # Token counts of joined parts can differ from their sum by a token or two
+    text = truncate_to_tokens("\n\n".join(parts), token_budget)
+    return ChartContext(text=text, tokens=count_tokens(text), stats=stats)
+
+
+def _condense(lines: List[str], budget: int,
+              condense: Optional[Callable[[str, int], Optional[str]]]) -> Tuple[List[str], int]:
+    condensed_groups = 0
+    for _ in range(MAX_REDUCE_ROUNDS):
+        if condense is None or not lines or count_tokens("\n".join(lines)) <= budget:
+            break
+        groups = _group(lines, REDUCE_GROUP_TOKENS)
+        target = max(min(CONDENSED_GROUP_TOKENS, budget), 1)
+        with ThreadPoolExecutor(max_workers=min(8, len(groups))) as executor:
+            results = list(executor.map(lambda group: condense(group, target), groups))
+        if all(result is None for result in results):
+            break
+        # A group that couldn't be condensed is cut to size instead
+        lines = [
+            truncate_to_tokens((result or group).strip(), target)
+            for group, result in zip(groups, results)
+        ]
+        condensed_groups += len(groups)
+    return lines, condensed_groups
+
+
+def _group(lines: List[str], group_tokens: int) -> List[str]:
+    groups, current, size = [], [], 0
+    for line in lines:
+        cost = count_tokens(line) + 1
+        if current and size + cost > group_tokens:
+            groups.append("\n".join(current))
+            current, size = [], 0
+        current.append(line)
+        size += cost
+    if current:
+        groups.append("\n".join(current))
+    return groups
@@ -0,0 +1,212 @@
+"""
+Content-addressed cache for embedding vectors.
+
+Keys are the embedding model plus a SHA-256 of the chunk text, so re-indexing an
+unchanged note, or an edited note's unchanged chunks, never calls the embeddings
+API again. Vectors are stored as raw float32 bytes (6 KB for 1536 dimensions) in
+a local SQLite file, with Redis as an optional shared tier for other workers.
+The vectors are derived from note text, so the file has no default location
+(EMBEDDING_CACHE_PATH) and is created owner-only.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+# Shared-tier entries outlive any one worker but are rebuilt from SQLite or the API if lost
+REDIS_TTL_SECONDS = 30 * 24 * 3600
+
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def _to_bytes(vector) -> bytes:
+    return np.asarray(vector, dtype="float32").tobytes()
+
+
+def _from_bytes(blob: bytes) -> List[float]:
+    return np.frombuffer(blob, dtype="float32").tolist()
+
+
+class EmbeddingCache:
+    def __init__(self, path: str, redis_url: Optional[str] = None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "redis_hits": 0, "misses": 0, "stores": 0, "errors": 0}
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+        # SQLite gives the -wal and -shm files the same mode
+        os.close(os.open(path, os.O_CREAT | os.O_RDWR, 0o600))
+        os.chmod(path, 0o600)
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL, hash TEXT NOT NULL, vector BLOB NOT NULL, created_at REAL NOT NULL,"
+            " PRIMARY KEY (model, hash))"
+        )
+
+        self._redis = None
+        if redis_url and REDIS_AVAILABLE:
+            try:
+                self._redis = redis.Redis.from_url(redis_url, socket_timeout=0.5, socket_connect_timeout=0.5)
+            except Exception as e:
+                print(f"⚠️ Embedding cache Redis tier disabled: {e}")
+
+    def get_many(self, model: str, hashes: Sequence[str]) -> Dict[str, List[float]]:
+        wanted = list(dict.fromkeys(hashes))
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            for start in range(0, len(wanted), 500):
+                part = wanted[start:start + 500]
+                for key, blob in self._conn.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({','.join('?' * len(part))})",
+                    [model, *part],
+                ):
+                    found[key] = _from_bytes(blob)
+            self._stats["hits"] += len(found)
+
+        missing = [key for key in wanted if key not in found]
+        if missing and self._redis is not None:
+            try:
+                blobs = self._redis.mget([f"emb:{model}:{key}" for key in missing])
+            except Exception:
+                blobs = [None] * len(missing)
+                self._count("errors")
+            shared = {key: blob for key, blob in zip(missing, blobs) if blob is not None}
+            if shared:
+                self._store_local(model, shared)
+                found.update({key: _from_bytes(blob) for key, blob in shared.items()})
+                self._count("redis_hits", len(shared))
+        self._count("misses", len(wanted) - len(found))
+        return found
+
+    def put_many(self, model: str, vectors: Dict[str, Sequence[float]]):
+        blobs = {key: _to_bytes(vector) for key, vector in vectors.items()}
+        self._store_local(model, blobs)
+        self._count("stores", len(blobs))
+        if self._redis is not None and blobs:
+            try:
+                pipeline = self._redis.pipeline()
+                for key, blob in blobs.items():
+                    pipeline.set(f"emb:{model}:{key}", blob, ex=REDIS_TTL_SECONDS)
+                pipeline.execute()
+            except Exception:
+                self._count("errors")
+
+    def _store_local(self, model: str, blobs: Dict[str, bytes]):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, vector, created_at) VALUES (?, ?, ?, ?)",
+                [(model, key, blob, now) for key, blob in blobs.items()],
+            )
+
+    def _count(self, stat: str, amount: int = 1):
+        with self._lock:
+            self._stats[stat] += amount
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        lookups = stats["hits"] + stats["redis_hits"] + stats["misses"]
+        stats["hit_ratio"] = round((stats["hits"] + stats["redis_hits"]) / lookups, 3) if lookups else None
+        stats["redis_enabled"] = self._redis is not None
+        return stats
+
+
+class CachedEmbeddings:
+    """
+    Wraps an embeddings client (embed_documents / embed_query) so only texts
+    missing from the cache are sent, in one call per batch. Counts what was
+    saved, process-wide and in a caller's own `counters` dict, so a run can
+    report just its own calls. Not a LangChain Embeddings: it
+    feeds the note index only, never a LangChain vector store.
+    """
+
+    def __init__(self, embeddings, model: str, cache: Optional[EmbeddingCache]):
+        self.embeddings = embeddings
+        self.model = model
+        self.cache = cache
+        self._lock = threading.Lock()
+        self.counters = {"texts": 0, "cached": 0, "embedded": 0, "api_calls": 0}
+
+    def embed_documents(self, texts: List[str], counters: Optional[Dict[str, int]] = None) -> List[List[float]]:
+        if not texts:
+            return []
+        if self.cache is None:
+            self._add(counters, texts=len(texts), embedded=len(texts), api_calls=1)
+            return self.embeddings.embed_documents(texts)
+
+        hashes = [chunk_hash(text) for text in texts]
+        try:
+            vectors = self.cache.get_many(self.model, hashes)
+        except Exception as e:
+            print(f"Embedding cache lookup failed: {e}")
+            vectors = {}
+        missing = {key: text for key, text in zip(hashes, texts) if key not in vectors}
+        if missing:
+            fresh = dict(zip(missing, self.embeddings.embed_documents(list(missing.values()))))
+            try:
+                self.cache.put_many(self.model, fresh)
+            except Exception as e:
+                print(f"Embedding cache store failed: {e}")
+            vectors.update(fresh)
+        # Repeated texts in one call are embedded once; the repeats count as saved
+        self._add(
+            counters, texts=len(texts), cached=len(texts) - len(missing), embedded=len(missing),
+            api_calls=1 if missing else 0,
+        )
+        return [vectors[key] for key in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def _add(self, counters: Optional[Dict[str, int]], **amounts):
+        with self._lock:
+            for name, amount in amounts.items():
+                self.counters[name] += amount
+                if counters is not None:
+                    counters[name] = counters.get(name, 0) + amount
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return dict(self.counters)
+
+
+_cache: Optional[EmbeddingCache] = None
+_cache_pid: Optional[int] = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """
+    Process-wide cache configured from the environment; None when
+    EMBEDDING_CACHE_ENABLED=false or EMBEDDING_CACHE_PATH is unset.
+    """
+    global _cache, _cache_pid
+    if os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() in ("0", "false", "no"):
+        return None
+    path = os.getenv("EMBEDDING_CACHE_PATH")
+    if not path:
+        return None
+    with _cache_lock:
+        # A forked worker opens its own connection rather than sharing the parent's
+        if _cache is None or _cache_pid != os.getpid():
+            _cache_pid = os.getpid()
+            _cache = EmbeddingCache(path, redis_url=os.getenv("EMBEDDING_CACHE_REDIS_URL"))
+        return _cache
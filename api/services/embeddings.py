@@ -0,0 +1,118 @@
+"""
+Embedding providers for retrieval.
+
+EMBEDDINGS_PROVIDER picks one: "openai" (text-embedding-3-small, cached by
+chunk hash), "hashing" (local, offline) or "none". The default, "auto", uses
+OpenAI when a key is configured and the local provider otherwise, so
+air-gapped test and staging environments still index and retrieve notes.
+
+HashingEmbeddings uses signed feature hashing of character 3- to 5-grams with
+sublinear term frequency, L2-normalized. A whole batch is hashed in a few NumPy
+passes over the concatenated text, which runs at thousands of chunks per second
+on one core. The vectors are lexical, not semantic: fine for exercising and
+benchmarking the retrieval path, not a substitute for a trained model.
+"""
+import os
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from api.services.embedding_cache import CachedEmbeddings, get_embedding_cache
+
+OPENAI_EMBEDDING_MODEL = "text-embedding-3-small"
+DEFAULT_HASHING_DIMENSION = 768
+
+_MULTIPLIER = np.uint64(0x100000001B3)
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+class HashingEmbeddings:
+    def __init__(self, dimension: int = DEFAULT_HASHING_DIMENSION, ngram_sizes: Sequence[int] = (3, 4, 5)):
+        self.dimension = dimension
+        self.ngram_sizes = tuple(ngram_sizes)
+        self.model = f"hashing-char{min(self.ngram_sizes)}-{max(self.ngram_sizes)}-d{dimension}"
+
+    def embed_matrix(self, texts: Sequence[str]) -> np.ndarray:
+        """(len(texts), dimension) float32 matrix of unit vectors."""
+        count = len(texts)
+        matrix = np.zeros(count * self.dimension, dtype="float64")
+        if not count:
+            return matrix.reshape(0, self.dimension).astype("float32")
+
+        # Pad with spaces so word boundaries become n-gram features
+        encoded = [f" {' '.join(text.lower().split())} ".encode() for text in texts]
+        lengths = np.fromiter((len(data) for data in encoded), dtype="int64", count=count)
+        data = np.frombuffer(b"".join(encoded), dtype="uint8").astype("uint64")
+        owner = np.repeat(np.arange(count, dtype="int64"), lengths)
+
+        with np.errstate(over="ignore"):
+            for size in self.ngram_sizes:
+                windows = len(data) - size + 1
+                if windows <= 0:
+                    continue
+                # FNV-style rolling hash over each window, then a multiplicative mix
+                hashes = np.full(windows, 0xCBF29CE484222325, dtype="uint64")
+                for offset in range(size):
+                    hashes = (hashes ^ data[offset:offset + windows]) * _MULTIPLIER
+                hashes = (hashes ^ (hashes >> np.uint64(31))) * _MIX
+                # Drop windows that straddle two texts
+                valid = owner[:windows] == owner[size - 1:]
+                hashes, docs = hashes[valid], owner[:windows][valid]
+                buckets = (hashes % np.uint64(self.dimension)).astype("int64")
+                signs = np.where((hashes >> np.uint64(63)) == 1, -1.0, 1.0)
+                matrix += np.bincount(docs * self.dimension + buckets, weights=signs, minlength=len(matrix))
+
+        matrix = matrix.reshape(count, self.dimension)
+        matrix = np.sign(matrix) * np.log1p(np.abs(matrix))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return (matrix / np.where(norms == 0, 1, norms)).astype("float32")
+
+    def embed_documents(self, texts: List[str]) -> List[np.ndarray]:
+        return list(self.embed_matrix(texts))
+
+    def embed_query(self, text: str) -> np.ndarray:
+        return self.embed_matrix([text])[0]
+
+
+def split_text(text: str, chunk_size: int = 1000, chunk_overlap: int = 200) -> List[str]:
+    """Whitespace-aligned fixed-size chunks, for when the LangChain splitter is unavailable."""
+    text = text.strip()
+    if len(text) <= chunk_size:
+        return [text] if text else []
+    chunks, start = [], 0
+    while start < len(text):
+        end = min(start + chunk_size, len(text))
+        if end < len(text):
+            cut = text.rfind(" ", start + chunk_overlap + 1, end)
+            end = cut if cut > 0 else end
+        chunks.append(text[start:end].strip())
+        if end >= len(text):
+            break
+        back = text.rfind(" ", start + 1, end - chunk_overlap)
+        start = back + 1 if back > start else end - chunk_overlap
+    return chunks
+
+
+def get_embeddings_provider(openai_api_key: Optional[str] = None) -> Optional[CachedEmbeddings]:
+    """Embeddings client selected by EMBEDDINGS_PROVIDER; None when retrieval is turned off."""
+    provider = os.getenv("EMBEDDINGS_PROVIDER", "auto").lower()
+    if provider == "none":
+        return None
+    if provider in ("auto", "openai") and openai_api_key:
+        try:
+            from langchain_openai import OpenAIEmbeddings
+        except ImportError:
+            if provider == "openai":
+                raise
+        else:
+            # Unchanged chunks are served from the embedding cache
+            return CachedEmbeddings(
+                OpenAIEmbeddings(openai_api_key=openai_api_key, model=OPENAI_EMBEDDING_MODEL),
+                model=OPENAI_EMBEDDING_MODEL,
+                cache=get_embedding_cache(),
+            )
+    if provider == "openai":
+        raise ValueError("EMBEDDINGS_PROVIDER=openai requires OPENAI_API_KEY")
+    local = HashingEmbeddings(int(os.getenv("HASHING_EMBEDDINGS_DIM", str(DEFAULT_HASHING_DIMENSION))))
+    # Cheaper to recompute than to look up
+    return CachedEmbeddings(local, model=local.model, cache=None)
@@ -0,0 +1,370 @@
+"""
+Chat-model backends for MedicalAIService, selected by LLM_BACKEND:
+
+    openai   ChatOpenAI (default)
+    fake     in-process stand-in that answers every prompt with schema-valid output
+             derived from the note text, after a latency drawn from configurable
+             time-to-first-token and token-rate distributions
+    record   ChatOpenAI, appending each answer and its latency to a cassette; the
+             response cache is bypassed so every prompt is recorded
+    replay   answers and latencies from a cassette; a prompt that isn't in it fails,
+             or is answered by the fake with LLM_REPLAY_MISS=fake
+
+fake and replay need neither an API key nor LangChain, so load tests and
+benchmarks exercise the real pipeline offline and reproducibly. Cassettes are
+JSON lines keyed by a hash of model, temperature and messages; prompts
+themselves are never written, only the model's answers. They live at
+LLM_CASSETTE_PATH, which has no default, and are created owner-only.
+"""
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import ClassVar, Dict, Iterator, List, Optional, Sequence
+
+from api.services.clinical_terms import COURSE_CONCEPTS, clinical_terms
+from api.services.context_builder import count_tokens
+from api.services.llm_cache import cache_key
+
+LOCAL_BACKENDS = ("fake", "replay")
+
+
+@dataclass
+class BaseMessage:
+    """Stand-in for LangChain messages; same `type` values, so cache keys match."""
+    content: str
+    type: ClassVar[str] = "base"
+
+
+class SystemMessage(BaseMessage):
+    type = "system"
+
+
+class HumanMessage(BaseMessage):
+    type = "human"
+
+
+class AIMessage(BaseMessage):
+    type = "ai"
+
+
+class CassetteMiss(KeyError):
+    pass
+
+
+class Cassette:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict] = {}
+        if os.path.exists(path):
+            with open(path) as handle:
+                for line in handle:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries[entry["key"]] = entry
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            return self._entries.get(key)
+
+    def put(self, key: str, entry: Dict):
+        entry = {"key": key, **entry}
+        with self._lock:
+            self._entries[key] = entry
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Answers about patients: readable by the owner only
+            with os.fdopen(os.open(self.path, os.O_CREAT | os.O_WRONLY | os.O_APPEND, 0o600), "a") as handle:
+                handle.write(json.dumps(entry) + "\n")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+@dataclass
+class LatencyProfile:
+    """Time to first token is log-normal around its median; token rate is normal, clipped."""
+    ttft_ms: float = 400.0
+    ttft_sigma: float = 0.5
+    tokens_per_second: float = 60.0
+    tokens_per_second_sd: float = 15.0
+
+    @classmethod
+    def from_env(cls) -> "LatencyProfile":
+        return cls(
+            ttft_ms=float(os.getenv("LLM_FAKE_TTFT_MS", "400")),
+            ttft_sigma=float(os.getenv("LLM_FAKE_TTFT_SIGMA", "0.5")),
+            tokens_per_second=float(os.getenv("LLM_FAKE_TOKENS_PER_S", "60")),
+            tokens_per_second_sd=float(os.getenv("LLM_FAKE_TOKENS_PER_S_SD", "15")),
+        )
+
+    def sample(self, rng: random.Random):
+        """(seconds to first token, seconds per further token); zero settings mean no delay."""
+        ttft = self.ttft_ms / 1000 * math.exp(rng.gauss(0, self.ttft_sigma)) if self.ttft_ms > 0 else 0.0
+        if self.tokens_per_second <= 0:
+            return ttft, 0.0
+        rate = max(rng.gauss(self.tokens_per_second, self.tokens_per_second_sd), self.tokens_per_second / 10)
+        return ttft, 1 / rate
+
+
+class FakeChatModel:
+    def __init__(self, model: str, temperature: float, profile: Optional[LatencyProfile] = None,
+                 seed: Optional[int] = None):
+        # Its own cache namespace: fake answers must never be served as real ones
+        self.model_name = f"fake:{model}"
+        self.temperature = temperature
+        self.profile = profile or LatencyProfile.from_env()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _delays(self):
+        with self._lock:
+            return self.profile.sample(self._rng)
+
+    def invoke(self, messages: Sequence) -> AIMessage:
+        content = fake_answer(messages)
+        ttft, per_token = self._delays()
+        time.sleep(ttft + per_token * max(count_tokens(content) - 1, 0))
+        return AIMessage(content=content)
+
+    def stream(self, messages: Sequence) -> Iterator[AIMessage]:
+        content = fake_answer(messages)
+        ttft, per_token = self._delays()
+        time.sleep(ttft)
+        for index, piece in enumerate(re.findall(r"\s*\S+|\s+", content)):
+            if index:
+                time.sleep(per_token)
+            yield AIMessage(content=piece)
+
+
+class RecordingChatModel:
+    def __init__(self, llm, cassette: Cassette):
+        self.llm = llm
+        self.cassette = cassette
+        self.model_name = llm.model_name
+        self.temperature = llm.temperature
+
+    def _record(self, messages: Sequence, content: str, ttft: float, total: float):
+        self.cassette.put(cache_key(self.model_name, self.temperature, messages), {
+            "model": self.model_name,
+            "content": content,
+            "ttft_s": round(ttft, 4),
+            "latency_s": round(total, 4),
+        })
+
+    def invoke(self, messages: Sequence):
+        started = time.perf_counter()
+        response = self.llm.invoke(messages)
+        elapsed = time.perf_counter() - started
+        self._record(messages, response.content, elapsed, elapsed)
+        return response
+
+    def stream(self, messages: Sequence):
+        started = time.perf_counter()
+        first = None
+        parts = []
+        for chunk in self.llm.stream(messages):
+            if first is None:
+                first = time.perf_counter() - started
+            parts.append(chunk.content)
+            yield chunk
+        self._record(messages, "".join(parts), first or 0.0, time.perf_counter() - started)
+
+
+class ReplayChatModel:
+    def __init__(self, model: str, temperature: float, cassette: Cassette,
+                 fallback: Optional[FakeChatModel] = None, replay_latency: bool = True):
+        self.source_model = model
+        self.model_name = f"replay:{model}"
+        self.temperature = temperature
+        self.cassette = cassette
+        self.fallback = fallback
+        self.replay_latency = replay_latency
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0}
+
+    def _entry(self, messages: Sequence) -> Optional[Dict]:
+        entry = self.cassette.get(cache_key(self.source_model, self.temperature, messages))
+        with self._lock:
+            self.counters["hits" if entry else "misses"] += 1
+        if entry is None and self.fallback is None:
+            raise CassetteMiss(f"No recorded answer for this {self.source_model} prompt in {self.cassette.path}")
+        return entry
+
+    def invoke(self, messages: Sequence):
+        entry = self._entry(messages)
+        if entry is None:
+            return self.fallback.invoke(messages)
+        if self.replay_latency:
+            time.sleep(entry.get("latency_s", 0))
+        return AIMessage(content=entry["content"])
+
+    def stream(self, messages: Sequence):
+        entry = self._entry(messages)
+        if entry is None:
+            yield from self.fallback.stream(messages)
+            return
+        if self.replay_latency:
+            time.sleep(entry.get("ttft_s", 0))
+        pieces = re.findall(r"\s*\S+|\s+", entry["content"]) or [""]
+        per_piece = max(entry.get("latency_s", 0) - entry.get("ttft_s", 0), 0) / len(pieces)
+        for index, piece in enumerate(pieces):
+            if index and self.replay_latency:
+                time.sleep(per_piece)
+            yield AIMessage(content=piece)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(self.counters)
+
+
+_cassettes: Dict[str, Cassette] = {}
+_cassettes_lock = threading.Lock()
+
+
+def get_cassette(path: Optional[str] = None) -> Cassette:
+    path = path or os.getenv("LLM_CASSETTE_PATH")
+    if not path:
+        raise ValueError("LLM_BACKEND=record and replay require LLM_CASSETTE_PATH")
+    with _cassettes_lock:
+        if path not in _cassettes:
+            _cassettes[path] = Cassette(path)
+        return _cassettes[path]
+
+
+def llm_backend() -> str:
+    return os.getenv("LLM_BACKEND", "openai").lower()
+
+
+def create_chat_model(model: str, temperature: float, json_mode: bool = False,
+                      openai_api_key: Optional[str] = None, backend: Optional[str] = None):
+    """A chat model for `backend` (default LLM_BACKEND) with invoke() and stream()."""
+    backend = backend or llm_backend()
+    seed = os.getenv("LLM_FAKE_SEED")
+    if backend == "fake":
+        return FakeChatModel(model, temperature, seed=int(seed) if seed else None)
+    if backend == "replay":
+        fallback = None
+        if os.getenv("LLM_REPLAY_MISS", "error").lower() == "fake":
+            fallback = FakeChatModel(model, temperature, seed=int(seed) if seed else None)
+        return ReplayChatModel(
+            model, temperature, get_cassette(), fallback=fallback,
+            replay_latency=os.getenv("LLM_REPLAY_LATENCY", "recorded").lower() != "none"
+        )
+    if backend not in ("openai", "record"):
+        raise ValueError(f"Unknown LLM_BACKEND {backend!r}")
+
+    from langchain_openai import ChatOpenAI
+    kwargs = {"model_kwargs": {"response_format": {"type": "json_object"}}} if json_mode else {}
+    llm = ChatOpenAI(model=model, temperature=temperature, openai_api_key=openai_api_key, **kwargs)
+    return RecordingChatModel(llm, get_cassette()) if backend == "record" else llm
+
+
+# --- Fake answers -------------------------------------------------------------
+
+# Where the prompts built by MedicalAIService put the clinical text, and what follows it
+_TEXT_START = re.compile(
+    r"\b(?:MEDICAL NOTE|Recent notes|Recent Visit Summaries|TEXT|New notes since that overview \(newest first\)"
+    r"|Condense these earlier notes to at most \d+ words):\s*"
+)
+_TEXT_END = re.compile(r"\n\s*(?:[A-Z][A-Z ]+:\n|(?:Respond|Rewrite|Provide) |\{)")
+_NOTE_REF = re.compile(r"NOTE REF: (\w+)")
+
+
+def _clinical_text(prompt: str) -> str:
+    starts = list(_TEXT_START.finditer(prompt))
+    text = prompt[starts[-1].end():] if starts else prompt
+    end = _TEXT_END.search(text)
+    return (text[:end.start()] if end else text).strip()
+
+
+def _findings(concepts) -> List[str]:
+    return sorted(set(concepts) - COURSE_CONCEPTS)
+
+
+def _fused_answer(prompt: str) -> Dict:
+    from api.services.ai_service import MedicalAIService
+
+    text = _clinical_text(prompt)
+    mock = MedicalAIService.build_structured_mock_summary(text)
+    recommendations = [rec for rec in mock["recommendations"].split(" • ") if rec]
+    return {
+        "summary": mock["summary"],
+        "key_findings": mock["key_findings"],
+        "risk_level": mock["risk_level"].upper(),
+        "risk_factors": _findings(clinical_terms.concepts(text)),
+        "recommendations": recommendations,
+        "nursing_actions": recommendations if "NOTE TYPE: nurse_note" in prompt else [],
+    }
+
+
+def fake_answer(messages: Sequence) -> str:
+    """
+    What the fake model says: the JSON shape the prompt asks for, filled from its
+    note text by the rule-based heuristics, or a short plain-text summary.
+    """
+    prompt = messages[-1].content if messages else ""
+
+    if '{"results": [...]}' in prompt:
+        sections = re.split(r"(?m)^\[(\d+)\]$", prompt)
+        return json.dumps({"results": [
+            {"index": int(index), "note_ref": _NOTE_REF.search(body).group(1), **_fused_answer(body)}
+            for index, body in zip(sections[1::2], sections[2::2])
+        ]})
+    if '"nursing_actions"' in prompt:
+        return json.dumps(_fused_answer(prompt))
+
+    fused = _fused_answer(prompt)
+    high_risk = fused["risk_level"] in ("HIGH", "CRITICAL")
+    if '"confidence_score"' in prompt:
+        return json.dumps({
+            "risk_level": fused["risk_level"],
+            "confidence_score": 60,
+            "summary": f"{fused['risk_level'].title()} risk. {fused['summary']}",
+            "risk_factors": fused["risk_factors"],
+            "clinical_concerns": fused["risk_factors"][:3] if high_risk else [],
+            "recommendations": fused["recommendations"],
+            "monitoring_plan": "Vitals every 2-4 hours" if high_risk else "Routine vitals each shift",
+            "escalation_criteria": "Worsening symptoms or unstable vital signs",
+            "requires_urgent_attention": high_risk,
+            "estimated_severity": "severe" if high_risk else "moderate" if fused["risk_level"] == "MEDIUM" else "mild",
+        })
+    if '"chief_complaint"' in prompt:
+        return json.dumps({
+            "summary": fused["summary"],
+            "key_findings": fused["key_findings"],
+            "chief_complaint": fused["summary"].split(". ")[0],
+            "assessment": "Findings as documented; clinical correlation advised",
+            "vital_signs": "As documented",
+            "medications": "As documented",
+            "treatment_plan": "; ".join(fused["recommendations"]),
+            "follow_up": "Follow up if no improvement",
+            "risk_factors": ", ".join(fused["risk_factors"]) or "None identified",
+            "urgent_flags": "Escalate per risk level" if high_risk else "None",
+        })
+    if '"primary_treatment"' in prompt:
+        return json.dumps({
+            "primary_treatment": "Per current clinical guidelines for the documented diagnosis",
+            "medications": [],
+            "non_pharmacological": ["Lifestyle modifications", "Regular monitoring"],
+            "monitoring_requirements": "Symptoms and vitals at each visit",
+            "patient_education": ["Warning signs and when to seek care"],
+            "red_flags": fused["risk_factors"][:3],
+            "follow_up_timeline": "2-4 weeks",
+        })
+    if '"conditions"' in prompt and '"symptoms"' in prompt:
+        return json.dumps({
+            "conditions": fused["risk_factors"], "symptoms": [], "medications": [],
+            "procedures": [], "vital_signs": [], "lab_results": [],
+        })
+
+    concerns = ", ".join(fused["risk_factors"]) or "none identified"
+    plan = fused["recommendations"][0] if fused["recommendations"] else "Continue current plan."
+    return f"{fused['summary']} Key concerns: {concerns}. Risk: {fused['risk_level'].lower()}. Plan: {plan}"
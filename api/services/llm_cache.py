@@ -0,0 +1,202 @@
+"""
+Content-addressed cache for LLM responses.
+
+Entries are keyed on model, temperature and a SHA-256 of the exact messages, so
+only byte-identical prompts hit. A local SQLite file is the first tier; when
+LLM_CACHE_REDIS_URL is set, Redis is a shared second tier for other workers.
+Entries expire after a TTL and the local tier evicts least recently used rows
+beyond a size limit.
+
+Cached answers describe patients, so the cache is off unless LLM_CACHE_ENABLED
+is set, and then LLM_CACHE_PATH must name a file on storage approved for PHI
+(encrypted at rest, not a shared temp directory). The file is created owner-only.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Sequence
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 10000
+# Evict in batches so inserts near the limit don't each pay for a DELETE
+_EVICTION_SLACK = 0.1
+
+
+@dataclass
+class CachedLLMResponse:
+    """Stands in for the chat model's message on a cache hit; callers only read `.content`."""
+    content: str
+    response_metadata: Dict = field(default_factory=lambda: {"cache_hit": True})
+
+
+def cache_key(model: str, temperature: Optional[float], messages: Sequence) -> str:
+    payload = json.dumps(
+        {
+            "model": model,
+            "temperature": temperature,
+            "messages": [
+                [getattr(message, "type", type(message).__name__), getattr(message, "content", str(message))]
+                for message in messages
+            ],
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class LLMResponseCache:
+    def __init__(
+        self,
+        path: str,
+        ttl_seconds: int = DEFAULT_TTL_SECONDS,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        redis_url: Optional[str] = None,
+    ):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._stats = {"local_hits": 0, "redis_hits": 0, "misses": 0, "stores": 0, "evictions": 0, "errors": 0}
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+        # Owner-only from the start; sqlite3 would create it with the process umask
+        os.close(os.open(path, os.O_CREAT | os.O_RDWR, 0o600))
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_responses ("
+            " key TEXT PRIMARY KEY, response TEXT NOT NULL,"
+            " expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_llm_responses_last_access ON llm_responses (last_access)")
+        # Upper bound on the row count (replacements are counted as inserts); recounted before evicting
+        self._approx_entries = self._conn.execute("SELECT COUNT(*) FROM llm_responses").fetchone()[0]
+
+        self._redis = None
+        if redis_url and REDIS_AVAILABLE:
+            try:
+                self._redis = redis.Redis.from_url(redis_url, socket_timeout=0.5, socket_connect_timeout=0.5)
+            except Exception as e:
+                print(f"⚠️ LLM cache Redis tier disabled: {e}")
+
+    def get(self, key: str, now: Optional[float] = None) -> Optional[str]:
+        now = now or time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, expires_at FROM llm_responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row and row[1] > now:
+                self._conn.execute("UPDATE llm_responses SET last_access = ? WHERE key = ?", (now, key))
+                self._stats["local_hits"] += 1
+                return row[0]
+            if row:
+                self._conn.execute("DELETE FROM llm_responses WHERE key = ?", (key,))
+
+        if self._redis is not None:
+            try:
+                value = self._redis.get(f"llm:{key}")
+            except Exception:
+                value = None
+                self._count("errors")
+            if value is not None:
+                response = value.decode() if isinstance(value, bytes) else value
+                self._store_local(key, response, now)
+                self._count("redis_hits")
+                return response
+
+        self._count("misses")
+        return None
+
+    def put(self, key: str, response: str, now: Optional[float] = None):
+        now = now or time.time()
+        self._store_local(key, response, now)
+        self._count("stores")
+        if self._redis is not None:
+            try:
+                self._redis.set(f"llm:{key}", response, ex=self.ttl_seconds)
+            except Exception:
+                self._count("errors")
+
+    def _store_local(self, key: str, response: str, now: float):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_responses (key, response, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, response, now + self.ttl_seconds, now),
+            )
+            self._approx_entries += 1
+            if self._approx_entries > self.max_entries:
+                count = self._conn.execute("SELECT COUNT(*) FROM llm_responses").fetchone()[0]
+                self._approx_entries = self._evict(now, count) if count > self.max_entries else count
+
+    def _evict(self, now: float, count: int) -> int:
+        expired = self._conn.execute("DELETE FROM llm_responses WHERE expires_at <= ?", (now,)).rowcount
+        count -= expired
+        target = int(self.max_entries * (1 - _EVICTION_SLACK))
+        evicted = 0
+        if count > target:
+            evicted = self._conn.execute(
+                "DELETE FROM llm_responses WHERE key IN ("
+                " SELECT key FROM llm_responses ORDER BY last_access ASC LIMIT ?)",
+                (count - target,),
+            ).rowcount
+        self._stats["evictions"] += expired + evicted
+        return count - evicted
+
+    def _count(self, stat: str):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = self._conn.execute("SELECT COUNT(*) FROM llm_responses").fetchone()[0]
+        lookups = stats["local_hits"] + stats["redis_hits"] + stats["misses"]
+        stats["hit_ratio"] = round((stats["local_hits"] + stats["redis_hits"]) / lookups, 3) if lookups else None
+        stats["redis_enabled"] = self._redis is not None
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_responses")
+            self._approx_entries = 0
+            for stat in self._stats:
+                self._stats[stat] = 0
+
+
+_cache: Optional[LLMResponseCache] = None
+_cache_pid: Optional[int] = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> Optional[LLMResponseCache]:
+    """Process-wide cache configured from the environment; None unless LLM_CACHE_ENABLED=true."""
+    global _cache, _cache_pid
+    if os.getenv("LLM_CACHE_ENABLED", "false").lower() not in ("1", "true", "yes"):
+        return None
+    path = os.getenv("LLM_CACHE_PATH")
+    if not path:
+        raise ValueError("LLM_CACHE_ENABLED requires LLM_CACHE_PATH")
+    with _cache_lock:
+        # A forked worker opens its own connection rather than sharing the parent's
+        if _cache is None or _cache_pid != os.getpid():
+            _cache_pid = os.getpid()
+            _cache = LLMResponseCache(
+                path,
+                ttl_seconds=int(os.getenv("LLM_CACHE_TTL_SECONDS", str(DEFAULT_TTL_SECONDS))),
+                max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", str(DEFAULT_MAX_ENTRIES))),
+                redis_url=os.getenv("LLM_CACHE_REDIS_URL"),
+            )
+        return _cache
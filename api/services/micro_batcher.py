@@ -0,0 +1,94 @@
+"""
+Micro-batching of small LLM requests.
+
+Callers submit a payload with an estimated token count and get a Future. A
+collector thread gathers submissions for a few milliseconds, or until a token
+budget or item limit is reached, and hands each group to `process_batch` on a
+worker pool. `process_batch` returns one result per payload, in order; the
+results are scattered back to the waiting Futures.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+class MicroBatcher:
+    def __init__(
+        self,
+        process_batch: Callable[[List[Any]], List[Any]],
+        max_wait_seconds: float = 0.02,
+        token_budget: int = 3000,
+        max_items: int = 16,
+        max_concurrent_batches: int = 4,
+    ):
+        self.process_batch = process_batch
+        self.max_wait_seconds = max_wait_seconds
+        self.token_budget = token_budget
+        self.max_items = max_items
+        self.max_concurrent_batches = max_concurrent_batches
+        self._queue: "queue.Queue[Tuple[Any, int, Future]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._stats = {"items": 0, "batches": 0}
+
+    def submit(self, payload: Any, tokens: int) -> Future:
+        future: Future = Future()
+        self._ensure_started()
+        self._queue.put((payload, tokens, future))
+        return future
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["avg_batch_size"] = round(stats["items"] / stats["batches"], 2) if stats["batches"] else None
+        return stats
+
+    def _ensure_started(self):
+        # Started on first use so idle service instances don't hold threads
+        with self._lock:
+            if self._thread is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_concurrent_batches, thread_name_prefix="micro-batch"
+                )
+                self._thread = threading.Thread(target=self._collect, name="micro-batch-collector", daemon=True)
+                self._thread.start()
+
+    def _collect(self):
+        carry = None
+        while True:
+            first = carry or self._queue.get()
+            carry = None
+            batch = [first]
+            tokens = first[1]
+            deadline = time.monotonic() + self.max_wait_seconds
+            while len(batch) < self.max_items:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if tokens + item[1] > self.token_budget:
+                    # Starts the next batch instead
+                    carry = item
+                    break
+                batch.append(item)
+                tokens += item[1]
+            self._executor.submit(self._dispatch, batch)
+
+    def _dispatch(self, batch: List[Tuple[Any, int, Future]]):
+        with self._lock:
+            self._stats["items"] += len(batch)
+            self._stats["batches"] += 1
+        try:
+            results = self.process_batch([payload for payload, _, _ in batch])
+        except Exception as e:
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+        for index, (_, _, future) in enumerate(batch):
+            future.set_result(results[index] if index < len(results) else None)
@@ -77,11 +77,9 @@ class NotificationService:
                 "message": f"SMS sending failed: {str(e)}"
             }
     
-    def send_appointment_reminder(self, patient_email: str, patient_phone: str, 
-                                 appointment_date: str, doctor_name: str) -> Dict:
-        """Send appointment reminder via email and SMS"""
-        
-        subject = "Appointment Reminder"
+    @staticmethod
+    def build_appointment_reminder(appointment_date: str, doctor_name: str) -> Dict[str, str]:
+        """Subject and bodies for an appointment reminder"""
         email_body = f"""
         Dear Patient,
         
@@ -98,15 +96,25 @@ class NotificationService:
         Medical Notes Team
         """
         
-        sms_body = f"Appointment Reminder: {appointment_date} with Dr. {doctor_name}. Please arrive 15 min early."
+        return {
+            "subject": "Appointment Reminder",
+            "email_body": email_body,
+            "sms_body": f"Appointment Reminder: {appointment_date} with Dr. {doctor_name}. Please arrive 15 min early."
+        }
+    
+    def send_appointment_reminder(self, patient_email: str, patient_phone: str, 
+                                 appointment_date: str, doctor_name: str) -> Dict:
+        """Send appointment reminder via email and SMS"""
+        
+        reminder = self.build_appointment_reminder(appointment_date, doctor_name)
         
         results = {}
         
         if patient_email:
-            results['email'] = self.send_email(patient_email, subject, email_body)
+            results['email'] = self.send_email(patient_email, reminder["subject"], reminder["email_body"])
         
         if patient_phone:
-            results['sms'] = self.send_sms(patient_phone, sms_body)
+            results['sms'] = self.send_sms(patient_phone, reminder["sms_body"])
         
         return results
     
@@ -0,0 +1,236 @@
+"""
+Rolling per-patient AI summaries.
+
+Each PatientSummary records which notes, at which version, it covers. After a
+note is created or changed a background job folds only the notes it doesn't
+cover yet into the previous summary, so reading a summary never waits on the LLM
+and keeping it current costs one short prompt per change rather than a re-read
+of the chart. If a covered note is archived, the summary is rebuilt from the
+recent notes instead. Nothing is stored when the LLM gives no answer, so the
+notes stay pending and the next refresh tries again.
+"""
+import hashlib
+import json
+import threading
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional
+
+from sqlalchemy import or_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+
+from api.db.database import SessionLocal
+from api.models.note import Note, NoteStatus
+from api.models.patient import Patient
+from api.models.patient_summary import PatientSummary
+from api.services.ai_service import PATIENT_SUMMARY_NOTES
+
+# Notes read when building from scratch, and the most folded in at once
+RECENT_NOTES = PATIENT_SUMMARY_NOTES
+# Optimistic write retries when another worker updates the same summary
+MAX_WRITE_ATTEMPTS = 3
+
+
+def _eligible_notes(db: Session, patient_id: int):
+    return db.query(Note).filter(
+        Note.patient_id == patient_id,
+        or_(Note.status.is_(None), Note.status != NoteStatus.ARCHIVED)
+    )
+
+
+def note_versions(db: Session, patient_id: int) -> Dict[str, str]:
+    """
+    Note id -> version stamp for every note a summary of this patient should cover.
+    The stamp hashes what the summary reads, so writing a note's own AI analysis
+    back to it doesn't make it pending again.
+    """
+    rows = _eligible_notes(db, patient_id).with_entities(Note.id, Note.status, Note.content)
+    return {
+        str(note_id): hashlib.sha256(
+            f"{getattr(status, 'value', status) or ''}|{content or ''}".encode()
+        ).hexdigest()[:16]
+        for note_id, status, content in rows
+    }
+
+
+def summary_state(db: Session, patient_id: int) -> Optional[Dict]:
+    """The stored summary and how far behind the chart it is; None if there is none yet."""
+    record = db.query(PatientSummary).filter(PatientSummary.patient_id == patient_id).first()
+    if record is None:
+        return None
+    covered = json.loads(record.covered_notes or "{}")
+    versions = note_versions(db, patient_id)
+    pending = [note_id for note_id, version in versions.items() if covered.get(note_id) != version]
+    removed = [note_id for note_id in covered if note_id not in versions]
+    return {
+        "summary": record.summary,
+        "generated_at": record.updated_at.isoformat() if record.updated_at else None,
+        "covered_notes": len(covered),
+        "pending_notes": len(pending),
+        "stale": bool(pending or removed),
+    }
+
+
+@dataclass
+class _Batch:
+    """The next summary to write: the record it replaces, the note texts it reads and what it will cover."""
+    record: Optional[PatientSummary]
+    rebuild: bool
+    texts: List[str]
+    covers: Dict[str, str]
+
+
+def _next_batch(db: Session, patient_id: int) -> Optional[_Batch]:
+    """What the summary still lacks; None when it covers every note at its current version."""
+    record = db.query(PatientSummary).filter(PatientSummary.patient_id == patient_id).first()
+    covered = json.loads(record.covered_notes) if record else {}
+    versions = note_versions(db, patient_id)
+    pending = [int(note_id) for note_id, version in versions.items() if covered.get(note_id) != version]
+    rebuild = record is None or any(note_id not in versions for note_id in covered)
+    if not rebuild and not pending:
+        return None
+
+    query = _eligible_notes(db, patient_id)
+    if rebuild:
+        notes = query.order_by(Note.created_at.desc(), Note.id.desc()).limit(RECENT_NOTES).all()
+        # A rebuild is an overview of the recent chart; older notes are left out on purpose
+        return _Batch(record, True, [note.content for note in notes if note.content], versions)
+    # Oldest pending first, so a later batch of newer notes supersedes it
+    notes = (
+        query.filter(Note.id.in_(pending))
+        .order_by(Note.created_at.asc(), Note.id.asc()).limit(RECENT_NOTES).all()
+    )
+    covers = {note_id: version for note_id, version in covered.items() if note_id in versions}
+    covers.update({str(note.id): versions[str(note.id)] for note in notes})
+    return _Batch(record, False, [note.content for note in reversed(notes) if note.content], covers)
+
+
+def _store(db: Session, patient_id: int, batch: _Batch, summary: str) -> bool:
+    """Write the batch's summary; False if another worker changed the summary first."""
+    # Versions were read before the LLM call: a note edited meanwhile shows as pending again
+    try:
+        if batch.record is None:
+            db.add(PatientSummary(patient_id=patient_id, summary=summary, covered_notes=json.dumps(batch.covers)))
+            db.commit()
+        else:
+            written = db.execute(
+                update(PatientSummary)
+                .where(PatientSummary.id == batch.record.id, PatientSummary.version == batch.record.version)
+                .values(
+                    summary=summary,
+                    covered_notes=json.dumps(batch.covers),
+                    version=batch.record.version + 1,
+                    updated_at=func.now()
+                )
+            ).rowcount
+            db.commit()
+            if not written:
+                return False
+    except IntegrityError:
+        db.rollback()
+        return False
+    finally:
+        db.expire_all()
+    return True
+
+
+def update_patient_summary(db: Session, ai_service, patient_id: int) -> Optional[PatientSummary]:
+    """
+    Bring the patient's summary up to date with their notes; returns it, as it
+    was if the LLM gave no answer, or None for an unknown patient or no summary yet.
+    """
+    patient = db.query(Patient).filter(Patient.id == patient_id).first()
+    if not patient:
+        return None
+    patient_name = f"{patient.first_name} {patient.last_name}"
+
+    conflicts = 0
+    while conflicts < MAX_WRITE_ATTEMPTS:
+        batch = _next_batch(db, patient_id)
+        if batch is None:
+            return db.query(PatientSummary).filter(PatientSummary.patient_id == patient_id).first()
+        if batch.rebuild:
+            summary = ai_service.generate_patient_summary(patient_name=patient_name, notes=batch.texts)
+        else:
+            summary = ai_service.fold_patient_summary(patient_name, batch.record.summary, batch.texts)
+        if summary is None:
+            return batch.record
+        # On a conflict start over from the other worker's summary; otherwise go
+        # round again for pending notes beyond this batch
+        if not _store(db, patient_id, batch, summary):
+            conflicts += 1
+    return None
+
+
+def stream_patient_summary_update(db: Session, ai_service, patient_id: int) -> Iterator[str]:
+    """
+    update_patient_summary, yielding the text of its first LLM call as it is
+    generated. Once exhausted, the stored summary is as current as
+    update_patient_summary would have left it.
+    """
+    patient = db.query(Patient).filter(Patient.id == patient_id).first()
+    batch = _next_batch(db, patient_id) if patient else None
+    if batch is None:
+        return
+    patient_name = f"{patient.first_name} {patient.last_name}"
+    if batch.rebuild:
+        stream = ai_service.stream_patient_summary(patient_name, batch.texts)
+    else:
+        stream = ai_service.stream_fold_patient_summary(patient_name, batch.record.summary, batch.texts)
+    parts = []
+    for text in stream:
+        parts.append(text)
+        yield text
+    summary = "".join(parts).strip()
+    if summary:
+        _store(db, patient_id, batch, summary)
+        # Later batches, or a redo if another worker wrote first
+        update_patient_summary(db, ai_service, patient_id)
+
+
+class _RefreshTracker:
+    """One refresh per patient at a time; a request arriving mid-run makes that run go again."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._running = set()
+        self._requested = set()
+
+    def claim(self, patient_id: int) -> bool:
+        with self._lock:
+            if patient_id in self._running:
+                self._requested.add(patient_id)
+                return False
+            self._running.add(patient_id)
+            return True
+
+    def finish(self, patient_id: int) -> bool:
+        """Release the claim, or keep it and return True if another run was requested."""
+        with self._lock:
+            if patient_id in self._requested:
+                self._requested.discard(patient_id)
+                return True
+            self._running.discard(patient_id)
+            return False
+
+
+_refreshes = _RefreshTracker()
+
+
+def refresh_patient_summary(ai_service, patient_id: int):
+    """Background job: fold new or changed notes into the patient's summary."""
+    if not _refreshes.claim(patient_id):
+        return
+    db = SessionLocal()
+    try:
+        while True:
+            try:
+                update_patient_summary(db, ai_service, patient_id)
+            except Exception as e:
+                db.rollback()
+                print(f"Error updating patient summary for patient {patient_id}: {e}")
+            if not _refreshes.finish(patient_id):
+                break
+    finally:
+        db.close()
@@ -0,0 +1,126 @@
+"""
+Lazy expansion of recurring appointment rules.
+
+Expansion jumps straight to the first period that can intersect the requested
+window, so the cost depends on the window size and not on how long ago the
+series started.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Iterator, List, Optional, Tuple
+
+FREQUENCIES = ("daily", "weekly")
+
+
+def parse_weekdays(by_weekday: Optional[str], default: int) -> List[int]:
+    if not by_weekday:
+        return [default]
+    days = sorted({int(day) for day in by_weekday.split(",") if day.strip() != ""})
+    if not days or any(day < 0 or day > 6 for day in days):
+        raise ValueError("by_weekday must list weekdays between 0 (Mon) and 6 (Sun)")
+    return days
+
+
+def align_datetime(value: datetime, reference: datetime) -> datetime:
+    """Match value's tz-awareness to reference so they can be compared."""
+    if reference.tzinfo is None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    if reference.tzinfo is not None and value.tzinfo is None:
+        return value.replace(tzinfo=reference.tzinfo)
+    return value
+
+
+def iter_occurrences(
+    start_time: datetime,
+    frequency: str,
+    interval: int = 1,
+    by_weekday: Optional[str] = None,
+    count: Optional[int] = None,
+    until: Optional[datetime] = None,
+    window_start: Optional[datetime] = None,
+) -> Iterator[Tuple[int, datetime]]:
+    """
+    Yield (occurrence_index, start) pairs in order, beginning at the first
+    occurrence on or after window_start. Unbounded series yield forever.
+    """
+    if frequency not in FREQUENCIES:
+        raise ValueError(f"Unsupported frequency: {frequency}")
+    if interval < 1:
+        raise ValueError("interval must be at least 1")
+
+    if until is not None:
+        until = align_datetime(until, start_time)
+    if window_start is not None:
+        window_start = align_datetime(window_start, start_time)
+
+    if frequency == "daily":
+        period = timedelta(days=interval)
+        first_period = 0
+        if window_start is not None and window_start > start_time:
+            first_period = (window_start - start_time) // period
+        index = first_period
+        while True:
+            occurrence = start_time + index * period
+            if (count is not None and index >= count) or (until is not None and occurrence > until):
+                return
+            if window_start is None or occurrence >= window_start:
+                yield index, occurrence
+            index += 1
+
+    # Weekly: occurrences on the listed weekdays of every `interval`-th week,
+    # counted from the week containing the first occurrence.
+    weekdays = parse_weekdays(by_weekday, start_time.weekday())
+    week_anchor = start_time - timedelta(days=start_time.weekday())
+    period = timedelta(weeks=interval)
+    first_week_days = [day for day in weekdays if day >= start_time.weekday()]
+    per_week = len(weekdays)
+
+    week = 0
+    if window_start is not None and window_start > start_time:
+        week = max(0, (window_start - week_anchor) // period)
+
+    while True:
+        days = first_week_days if week == 0 else weekdays
+        for position, day in enumerate(days):
+            index = position if week == 0 else len(first_week_days) + (week - 1) * per_week + position
+            occurrence = week_anchor + week * period + timedelta(days=day)
+            if (count is not None and index >= count) or (until is not None and occurrence > until):
+                return
+            if window_start is None or occurrence >= window_start:
+                yield index, occurrence
+        week += 1
+
+
+def expand_in_window(series, window_start: datetime, window_end: datetime) -> List[Tuple[int, datetime, datetime]]:
+    """Occurrences of an AppointmentSeries whose start falls within [window_start, window_end]."""
+    duration = timedelta(minutes=series.duration_minutes)
+    window_end = align_datetime(window_end, series.start_time)
+    occurrences = []
+    for index, start in iter_occurrences(
+        series.start_time,
+        series.frequency,
+        interval=series.interval or 1,
+        by_weekday=series.by_weekday,
+        count=series.count,
+        until=series.until,
+        window_start=window_start,
+    ):
+        if start > window_end:
+            break
+        occurrences.append((index, start, start + duration))
+    return occurrences
+
+
+def last_occurrence(
+    start_time: datetime,
+    frequency: str,
+    interval: int,
+    by_weekday: Optional[str],
+    count: int,
+) -> datetime:
+    """Start of the final occurrence of a count-limited series."""
+    if frequency == "daily":
+        return start_time + (count - 1) * timedelta(days=interval)
+    last = start_time
+    for _, occurrence in iter_occurrences(start_time, frequency, interval, by_weekday, count=count):
+        last = occurrence
+    return last
@@ -0,0 +1,52 @@
+"""
+Process-wide AI service and agents.
+
+Building a MedicalAIService creates chat and embedding clients (each with its
+own HTTP connection pool), a text splitter and a handle on the persistent note
+index, so every caller shares one instance per process instead. Instances are
+created on first use and rebuilt in a forked child (Celery prefork workers),
+which must not reuse the parent's sockets, cache connection or batching threads.
+"""
+import os
+import threading
+from typing import Callable, Dict
+
+from api.services.ai_service import MedicalAIService
+
+_instances: Dict[str, object] = {}
+_owner_pid = None
+_lock = threading.RLock()
+
+
+def _get(name: str, factory: Callable[[], object]):
+    global _owner_pid
+    instance = _instances.get(name)
+    if instance is not None and _owner_pid == os.getpid():
+        return instance
+    with _lock:
+        if _owner_pid != os.getpid():
+            _instances.clear()
+            _owner_pid = os.getpid()
+        if name not in _instances:
+            _instances[name] = factory()
+        return _instances[name]
+
+
+def get_ai_service() -> MedicalAIService:
+    return _get("ai_service", MedicalAIService)
+
+
+def get_summarization_agent():
+    from api.agents.summarization_agent import SummarizationAgent
+    return _get("summarization_agent", lambda: SummarizationAgent(get_ai_service()))
+
+
+def get_risk_agent():
+    from api.agents.risk_agent import RiskAssessmentAgent
+    return _get("risk_agent", lambda: RiskAssessmentAgent(get_ai_service()))
+
+
+def reset_registry():
+    """Drop shared instances so the next call builds fresh ones (tests, config reloads)."""
+    with _lock:
+        _instances.clear()
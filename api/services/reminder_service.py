@@ -0,0 +1,257 @@
+"""
+Batched appointment reminder dispatch.
+
+A scheduled job scans the next N hours of appointments with an indexed window
+query, skips reminders already recorded in the ledger, and hands the rest to a
+transport in concurrent batches.
+
+Each batch is claimed before it is sent: its ledger rows are inserted as
+"pending" with ON CONFLICT DO NOTHING, and only the rows this run inserted are
+sent, so overlapping runs never deliver the same reminder twice. Rows are then
+marked "sent" or "failed". Failed rows, and pending rows whose run died
+(claimed more than REMINDER_CLAIM_TTL_MINUTES ago), can be claimed again.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import and_, bindparam, or_, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from api.models.appointment import Appointment
+from api.models.patient import Patient
+from api.models.reminder import ReminderLedger
+from api.models.user import User
+from api.services.appointment_conflicts import INACTIVE_STATUSES
+from api.services.notification_service import NotificationService
+from api.tasks import TASK_TIME_LIMIT
+
+# A pending claim older than this belongs to a run that died. A run that is still
+# alive can hold one up to the task time limit, so the default leaves twice that.
+REMINDER_CLAIM_TTL = timedelta(
+    minutes=int(os.getenv("REMINDER_CLAIM_TTL_MINUTES", str(2 * TASK_TIME_LIMIT // 60)))
+)
+if REMINDER_CLAIM_TTL <= timedelta(seconds=TASK_TIME_LIMIT):
+    raise ValueError(
+        f"REMINDER_CLAIM_TTL_MINUTES must exceed the {TASK_TIME_LIMIT // 60} minute task time limit"
+    )
+
+
+@dataclass
+class ReminderMessage:
+    appointment_id: int
+    channel: str  # "email" or "sms"
+    recipient: str
+    scheduled_start: datetime
+    subject: str
+    body: str
+
+
+class ReminderTransport:
+    """Delivers one reminder; implementations must be safe to call from worker threads."""
+
+    def send(self, message: ReminderMessage) -> Dict:
+        raise NotImplementedError
+
+
+class NotificationServiceTransport(ReminderTransport):
+    """Sends through NotificationService (SendGrid email, Twilio SMS)."""
+
+    def __init__(self, notification_service: Optional[NotificationService] = None):
+        self.notification_service = notification_service or NotificationService()
+
+    def send(self, message: ReminderMessage) -> Dict:
+        if message.channel == "email":
+            return self.notification_service.send_email(message.recipient, message.subject, message.body)
+        return self.notification_service.send_sms(message.recipient, message.body)
+
+
+class StubTransport(ReminderTransport):
+    """Local transport that records messages in memory instead of sending them."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.sent: List[ReminderMessage] = []
+
+    def send(self, message: ReminderMessage) -> Dict:
+        with self._lock:
+            self.sent.append(message)
+        return {"success": True, "message": "Recorded by stub transport"}
+
+
+def get_reminder_transport() -> ReminderTransport:
+    """REMINDER_TRANSPORT=notification sends for real; anything else uses the stub."""
+    if os.getenv("REMINDER_TRANSPORT", "stub").lower() == "notification":
+        return NotificationServiceTransport()
+    return StubTransport()
+
+
+def _due_messages(db: Session, window_start: datetime, window_end: datetime) -> List[ReminderMessage]:
+    rows = db.query(
+        Appointment.id,
+        Appointment.start_time,
+        Appointment.location,
+        Patient.email,
+        Patient.phone,
+        User.full_name,
+    ).join(
+        Patient, Patient.id == Appointment.patient_id
+    ).join(
+        User, User.id == Appointment.created_by
+    ).filter(
+        Appointment.start_time >= window_start,
+        Appointment.start_time < window_end,
+        Appointment.status.notin_(INACTIVE_STATUSES),
+    ).order_by(Appointment.start_time.asc()).all()
+
+    # Failed and pending rows still go through _claim, which decides whether they may be retried
+    already_sent = {
+        (appointment_id, channel, scheduled_start)
+        for appointment_id, channel, scheduled_start in db.query(
+            ReminderLedger.appointment_id, ReminderLedger.channel, ReminderLedger.scheduled_start
+        ).filter(
+            ReminderLedger.scheduled_start >= window_start,
+            ReminderLedger.scheduled_start < window_end,
+            or_(ReminderLedger.status.is_(None), ReminderLedger.status == "sent"),
+        )
+    }
+
+    messages = []
+    for appointment_id, start_time, location, email, phone, doctor_name in rows:
+        content = NotificationService.build_appointment_reminder(
+            f"{start_time.strftime('%Y-%m-%d %H:%M')} ({location})", doctor_name
+        )
+        for channel, recipient, body in (
+            ("email", email, content["email_body"]),
+            ("sms", phone, content["sms_body"]),
+        ):
+            if recipient and (appointment_id, channel, start_time) not in already_sent:
+                messages.append(ReminderMessage(
+                    appointment_id=appointment_id,
+                    channel=channel,
+                    recipient=recipient,
+                    scheduled_start=start_time,
+                    subject=content["subject"],
+                    body=body,
+                ))
+    return messages
+
+
+Key = Tuple[int, str, datetime]
+
+
+def _key(message: ReminderMessage) -> Key:
+    return (message.appointment_id, message.channel, message.scheduled_start)
+
+
+_LEDGER_KEY = (ReminderLedger.appointment_id, ReminderLedger.channel, ReminderLedger.scheduled_start)
+
+
+def _claim(db: Session, batch: List[ReminderMessage], now: datetime) -> List[ReminderMessage]:
+    """Mark the batch's ledger rows pending for this run; returns the messages this run may send."""
+    dialect = db.get_bind().dialect.name
+    insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    statement = insert(ReminderLedger).values([
+        {
+            "appointment_id": message.appointment_id,
+            "channel": message.channel,
+            "recipient": message.recipient,
+            "scheduled_start": message.scheduled_start,
+            "status": "pending",
+            "claimed_at": now,
+            "sent_at": None,
+        }
+        for message in batch
+    ]).on_conflict_do_nothing(
+        index_elements=["appointment_id", "channel", "scheduled_start"]
+    ).returning(*_LEDGER_KEY)
+    claimed: Set[Key] = {tuple(row) for row in db.execute(statement)}
+
+    # Rows that already existed: retry failed sends and take over abandoned claims
+    retry = [_key(message) for message in batch if _key(message) not in claimed]
+    if retry:
+        statement = update(ReminderLedger).where(
+            tuple_(*_LEDGER_KEY).in_(retry),
+            or_(
+                ReminderLedger.status == "failed",
+                and_(ReminderLedger.status == "pending", ReminderLedger.claimed_at < now - REMINDER_CLAIM_TTL),
+            ),
+        ).values(status="pending", claimed_at=now).returning(*_LEDGER_KEY)
+        claimed |= {tuple(row) for row in db.execute(statement)}
+    db.commit()
+    return [message for message in batch if _key(message) in claimed]
+
+
+def _record(db: Session, messages: List[ReminderMessage], results: List[Dict], now: datetime):
+    """Mark claimed rows sent or failed."""
+    rows = [
+        {
+            "b_appointment_id": message.appointment_id,
+            "b_channel": message.channel,
+            "b_scheduled_start": message.scheduled_start,
+            "b_status": "sent" if result.get("success") else "failed",
+            "b_message": result.get("message"),
+            "b_sent_at": now if result.get("success") else None,
+        }
+        for message, result in zip(messages, results)
+    ]
+    statement = update(ReminderLedger.__table__).where(
+        ReminderLedger.appointment_id == bindparam("b_appointment_id"),
+        ReminderLedger.channel == bindparam("b_channel"),
+        ReminderLedger.scheduled_start == bindparam("b_scheduled_start"),
+    ).values(
+        status=bindparam("b_status"),
+        provider_message=bindparam("b_message"),
+        sent_at=bindparam("b_sent_at"),
+    )
+    db.execute(statement, rows)
+    db.commit()
+
+
+def dispatch_due_reminders(
+    db: Session,
+    hours_ahead: int = 24,
+    transport: Optional[ReminderTransport] = None,
+    batch_size: int = 500,
+    max_workers: int = 16,
+    now: Optional[datetime] = None,
+) -> Dict:
+    """Send reminders for appointments starting in the next `hours_ahead` hours."""
+    transport = transport or get_reminder_transport()
+    window_start = now or datetime.now()
+    window_end = window_start + timedelta(hours=hours_ahead)
+
+    messages = _due_messages(db, window_start, window_end)
+    stats = {
+        "due": len(messages), "sent": 0, "failed": 0, "skipped": 0,
+        "window_start": window_start, "window_end": window_end,
+    }
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for offset in range(0, len(messages), batch_size):
+            batch = messages[offset:offset + batch_size]
+            claimed = _claim(db, batch, window_start)
+            # Claimed by an overlapping run
+            stats["skipped"] += len(batch) - len(claimed)
+            if not claimed:
+                continue
+            results = list(executor.map(_safe_send(transport), claimed))
+            sent = sum(1 for result in results if result.get("success"))
+            stats["sent"] += sent
+            stats["failed"] += len(claimed) - sent
+            _record(db, claimed, results, window_start)
+
+    return stats
+
+
+def _safe_send(transport: ReminderTransport):
+    def send(message: ReminderMessage) -> Dict:
+        try:
+            return transport.send(message)
+        except Exception as e:
+            return {"success": False, "message": str(e)}
+    return send
@@ -0,0 +1,129 @@
+"""
+Instance startup off the request path.
+
+The lifespan only starts a background thread for Cloud Tasks queue provisioning
+and warm-up, so the server accepts traffic immediately even when Cloud Tasks is
+unreachable. /health is liveness, /ready reports whether the database and schema
+are usable, and /warmup pre-opens DB connections, builds the shared AI service,
+loads the note index and primes caches so the first real request doesn't pay for them.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from api.db.database import engine
+from api.db.migrate import schema_problems
+
+# schema_ok: a migrated schema stays migrated for this process, so /ready stops
+# inspecting it once it has passed
+_state = {"queue": "pending", "queue_error": None, "warmup": None, "schema_ok": False}
+_warmup_lock = threading.Lock()
+
+
+def _enabled(name: str) -> bool:
+    return os.getenv(name, "true").lower() not in ("0", "false", "no")
+
+
+def provision_queue():
+    if not _enabled("CLOUD_TASKS_PROVISION_QUEUE"):
+        _state["queue"] = "skipped"
+        return
+    try:
+        from api.services.cloud_tasks_service import ensure_queue_exists
+        ensure_queue_exists()
+        _state["queue"] = "ready"
+    except Exception as e:
+        _state["queue"] = "failed"
+        _state["queue_error"] = str(e)
+        print(f"Warning: Could not ensure Cloud Tasks queue exists: {e}")
+
+
+def _open_connection(_):
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+
+
+def warm_up() -> Dict:
+    """Idempotent; concurrent callers wait for the first run and share its result."""
+    with _warmup_lock:
+        if _state["warmup"] is not None:
+            return _state["warmup"]
+
+        timings = {}
+        started = time.perf_counter()
+        # Checking connections out together leaves that many open in the pool
+        pool_size = getattr(engine.pool, "size", lambda: 1)()
+        with ThreadPoolExecutor(max_workers=pool_size) as executor:
+            list(executor.map(_open_connection, range(pool_size)))
+        timings["db_pool_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+        step = time.perf_counter()
+        from api.services.registry import get_ai_service, get_risk_agent, get_summarization_agent
+        ai_service = get_ai_service()
+        get_summarization_agent()
+        get_risk_agent()
+        timings["ai_service_ms"] = round((time.perf_counter() - step) * 1000, 1)
+
+        step = time.perf_counter()
+        index = getattr(ai_service, "note_index", None)
+        if index is not None:
+            try:
+                index.ensure_loaded()
+            except Exception as e:
+                print(f"Warning: could not load the note index: {e}")
+        timings["vector_index_ms"] = round((time.perf_counter() - step) * 1000, 1)
+
+        step = time.perf_counter()
+        cache = getattr(ai_service, "response_cache", None)
+        if cache is not None:
+            cache.stats()
+        timings["caches_ms"] = round((time.perf_counter() - step) * 1000, 1)
+
+        _state["warmup"] = {
+            "ai_enabled": ai_service.enabled,
+            "timings_ms": timings,
+            "total_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+        return _state["warmup"]
+
+
+def _background_startup():
+    provision_queue()
+    if _enabled("WARMUP_ON_STARTUP"):
+        try:
+            warm_up()
+        except Exception as e:
+            print(f"Warning: warm-up failed: {e}")
+
+
+def start_background_startup() -> threading.Thread:
+    thread = threading.Thread(target=_background_startup, name="startup", daemon=True)
+    thread.start()
+    return thread
+
+
+def readiness(db: Session) -> Dict:
+    """Whether this instance can serve requests: database reachable and schema migrated."""
+    checks = {"database": "ok", "schema": "ok"}
+    try:
+        db.execute(text("SELECT 1"))
+        if not _state["schema_ok"]:
+            problems = schema_problems(db.get_bind())
+            if problems:
+                checks["schema"] = "; ".join(problems)
+            else:
+                _state["schema_ok"] = True
+    except Exception as e:
+        checks["database"] = f"unavailable: {e}"
+        checks["schema"] = "unknown"
+    return {
+        "ready": checks["database"] == "ok" and checks["schema"] == "ok",
+        "checks": checks,
+        "queue": _state["queue"],
+        "warmed_up": _state["warmup"] is not None,
+    }
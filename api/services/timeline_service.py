@@ -0,0 +1,232 @@
+"""
+Patient timeline: keyset-paginated history merged in SQL, plus a cached AI journey summary
+"""
+import base64
+import json
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import String, Text, and_, cast, func, literal, null, or_, select, union_all
+from sqlalchemy.orm import Session
+
+from api.db.database import SessionLocal
+from api.models.appointment import Appointment
+from api.models.note import Note
+from api.models.patient import Patient
+from api.models.user import User
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(occurred_at: datetime, kind: str, item_id: int) -> str:
+    raw = json.dumps([occurred_at.isoformat(), kind, item_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str, int]:
+    try:
+        occurred_at, kind, item_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(occurred_at), str(kind), int(item_id)
+    except Exception:
+        raise InvalidCursor("Invalid timeline cursor")
+
+
+def _time_key(expr, dialect_name: str):
+    # SQLite keeps datetimes as text and server defaults use a different format from
+    # bound parameters, so compare on julianday() to keep keyset ties exact.
+    if dialect_name == "sqlite":
+        return func.julianday(expr)
+    return expr
+
+
+def _timeline_union(patient_id: int):
+    notes = (
+        select(
+            literal("note", String).label("kind"),
+            Note.id.label("id"),
+            Note.created_at.label("occurred_at"),
+            Note.title.label("title"),
+            Note.content.label("content"),
+            Note.summary.label("summary"),
+            Note.risk_level.label("risk_level"),
+            User.full_name.label("author"),
+            cast(null(), String).label("reason"),
+            func.lower(cast(Note.status, String)).label("status"),
+        )
+        .join(User, User.id == Note.author_id)
+        .where(Note.patient_id == patient_id)
+    )
+    appointments = select(
+        literal("appointment", String).label("kind"),
+        Appointment.id.label("id"),
+        Appointment.start_time.label("occurred_at"),
+        Appointment.title.label("title"),
+        Appointment.notes.label("content"),
+        cast(null(), Text).label("summary"),
+        cast(null(), String).label("risk_level"),
+        cast(null(), String).label("author"),
+        Appointment.appointment_type.label("reason"),
+        Appointment.status.label("status"),
+    ).where(Appointment.patient_id == patient_id)
+    return union_all(notes, appointments).subquery("timeline")
+
+
+def get_timeline_page(
+    db: Session,
+    patient_id: int,
+    limit: int = 50,
+    cursor: Optional[str] = None
+) -> Tuple[List[Dict], Optional[str]]:
+    """
+    Return one page of the patient's notes and appointments, newest first,
+    and the cursor for the next page (None when exhausted).
+    """
+    dialect_name = db.get_bind().dialect.name
+    timeline = _timeline_union(patient_id)
+    occurred = _time_key(timeline.c.occurred_at, dialect_name)
+
+    query = select(timeline)
+    if cursor:
+        c_at, c_kind, c_id = decode_cursor(cursor)
+        c_occurred = _time_key(literal(c_at, timeline.c.occurred_at.type), dialect_name)
+        query = query.where(or_(
+            occurred < c_occurred,
+            and_(occurred == c_occurred, timeline.c.kind < c_kind),
+            and_(occurred == c_occurred, timeline.c.kind == c_kind, timeline.c.id < c_id),
+        ))
+    query = query.order_by(occurred.desc(), timeline.c.kind.desc(), timeline.c.id.desc()).limit(limit + 1)
+
+    rows = db.execute(query).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    items = []
+    for row in rows:
+        item = {
+            "type": row.kind,
+            "id": row.id,
+            "date": row.occurred_at.isoformat() if row.occurred_at else None,
+            "title": row.title,
+            "status": row.status,
+        }
+        if row.kind == "note":
+            item.update({
+                "content": row.content,
+                "summary": row.summary,
+                "risk_level": row.risk_level,
+                "author": row.author,
+            })
+        else:
+            item.update({"reason": row.reason, "notes": row.content})
+        items.append(item)
+
+    next_cursor = None
+    if has_more and rows:
+        last = rows[-1]
+        next_cursor = encode_cursor(last.occurred_at, last.kind, last.id)
+    return items, next_cursor
+
+
+def get_timeline_statistics(db: Session, patient_id: int) -> Dict:
+    total_visits, last_visit, last_note_update = db.query(
+        func.count(Note.id),
+        func.max(Note.created_at),
+        func.max(func.coalesce(Note.updated_at, Note.created_at)),
+    ).filter(Note.patient_id == patient_id).one()
+    total_appointments, last_appointment_update = db.query(
+        func.count(Appointment.id),
+        func.max(func.coalesce(Appointment.updated_at, Appointment.created_at)),
+    ).filter(Appointment.patient_id == patient_id).one()
+    risk_distribution = dict(
+        db.query(Note.risk_level, func.count(Note.id))
+        .filter(Note.patient_id == patient_id, Note.risk_level.isnot(None))
+        .group_by(Note.risk_level)
+        .all()
+    )
+    return {
+        "total_visits": total_visits,
+        "total_appointments": total_appointments,
+        "risk_distribution": risk_distribution,
+        "last_visit": last_visit.isoformat() if last_visit else None,
+        # Changes whenever the underlying chart changes; used to invalidate the AI summary
+        "fingerprint": f"{total_visits}:{last_note_update}:{total_appointments}:{last_appointment_update}",
+    }
+
+
+class JourneySummaryCache:
+    """
+    In-process cache of AI journey summaries keyed by patient and chart fingerprint.
+    Summaries are generated in the background; readers never wait on the LLM.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[int, Dict] = {}
+        self._in_flight = set()
+
+    def get(self, patient_id: int) -> Optional[Dict]:
+        with self._lock:
+            return self._entries.get(patient_id)
+
+    def put(self, patient_id: int, fingerprint: str, summary: str):
+        with self._lock:
+            self._entries[patient_id] = {
+                "fingerprint": fingerprint,
+                "summary": summary,
+                "generated_at": datetime.now().isoformat(),
+            }
+
+    def claim(self, patient_id: int) -> bool:
+        """Mark a refresh as running; False if one is already in flight."""
+        with self._lock:
+            if patient_id in self._in_flight:
+                return False
+            self._in_flight.add(patient_id)
+            return True
+
+    def release(self, patient_id: int):
+        with self._lock:
+            self._in_flight.discard(patient_id)
+
+
+journey_summary_cache = JourneySummaryCache()
+
+
+def journey_summary_inputs(db: Session, patient: Patient) -> Tuple[str, List[str]]:
+    """Patient header and recent visit excerpts the journey summary is generated from."""
+    recent_notes = db.query(Note).filter(
+        Note.patient_id == patient.id
+    ).order_by(Note.created_at.desc()).limit(10).all()
+
+    patient_info = (
+        f"Patient: {patient.first_name} {patient.last_name}\n"
+        f"DOB: {patient.date_of_birth}\n"
+        f"Allergies: {patient.allergies or 'None'}\n"
+        f"Medical History: {patient.medical_history or 'None'}"
+    )
+    note_texts = [
+        f"{note.created_at.strftime('%Y-%m-%d') if note.created_at else 'N/A'}: {note.title}\n{(note.content or '')[:300]}"
+        for note in recent_notes
+    ]
+    return patient_info, note_texts
+
+
+def refresh_journey_summary(ai_service, patient_id: int):
+    """Background job: rebuild the journey summary for a patient and store it in the cache."""
+    db = SessionLocal()
+    try:
+        patient = db.query(Patient).filter(Patient.id == patient_id).first()
+        if not patient:
+            return
+        fingerprint = get_timeline_statistics(db, patient_id)["fingerprint"]
+        patient_info, note_texts = journey_summary_inputs(db, patient)
+        summary = ai_service.generate_journey_summary(patient_info, note_texts)
+        journey_summary_cache.put(patient_id, fingerprint, summary)
+    except Exception as e:
+        print(f"Error refreshing journey summary for patient {patient_id}: {e}")
+    finally:
+        journey_summary_cache.release(patient_id)
+        db.close()
@@ -0,0 +1,155 @@
+"""
+Room and clinician utilization per day.
+
+Booked minutes, visit counts and no-shows are aggregated in SQL with one
+GROUP BY per resource type over the indexed start_time window; recurring series
+are expanded for the same window and folded into the same buckets.
+"""
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy import Date, case, cast, extract, func, or_
+from sqlalchemy.orm import Session
+
+from api.models.appointment import Appointment, AppointmentSeries
+from api.services.appointment_conflicts import INACTIVE_STATUSES, comparable_key
+from api.services.recurrence import expand_in_window
+
+NO_SHOW_STATUS = "no_show"
+
+_COLUMNS = {
+    "location": (Appointment.location, AppointmentSeries.location),
+    "clinician": (Appointment.created_by, AppointmentSeries.created_by),
+}
+
+
+def _minutes(start, end, dialect_name: str):
+    if dialect_name == "sqlite":
+        return (func.julianday(end) - func.julianday(start)) * 1440.0
+    return extract("epoch", end - start) / 60.0
+
+
+def _day(value, dialect_name: str):
+    if dialect_name == "sqlite":
+        return func.date(value)
+    return cast(value, Date)
+
+
+def _as_date(value) -> date:
+    return value if isinstance(value, date) else date.fromisoformat(str(value))
+
+
+def _bucket():
+    return {"booked_minutes": 0.0, "appointments": 0, "no_shows": 0, "cancelled": 0}
+
+
+def _open_days(start: datetime, end: datetime, open_weekdays: Sequence[int]) -> List[date]:
+    days = []
+    day = start.date()
+    while datetime.combine(day, datetime.min.time()) < end:
+        if day.weekday() in open_weekdays:
+            days.append(day)
+        day += timedelta(days=1)
+    return days
+
+
+def _pct(booked: float, available: float) -> Optional[float]:
+    return round(100.0 * booked / available, 1) if available else None
+
+
+def utilization_report(
+    db: Session,
+    start: datetime,
+    end: datetime,
+    resource_types: Sequence[str] = ("location", "clinician"),
+    locations: Optional[Sequence[str]] = None,
+    clinician_ids: Optional[Sequence[int]] = None,
+    day_start: int = 8,
+    day_end: int = 18,
+    open_weekdays: Sequence[int] = (0, 1, 2, 3, 4),
+) -> List[Dict]:
+    """
+    Per-resource utilization over [start, end), with a row per day that has bookings.
+    Utilization is booked minutes over opening minutes; no-shows still hold the slot.
+    """
+    dialect_name = db.get_bind().dialect.name
+    key = comparable_key(dialect_name)
+    start, end = key(start), key(end)
+    minutes = _minutes(Appointment.start_time, Appointment.end_time, dialect_name)
+    day = _day(Appointment.start_time, dialect_name)
+    active = Appointment.status.notin_(INACTIVE_STATUSES)
+    filters = {"location": locations, "clinician": clinician_ids}
+
+    buckets: Dict[tuple, Dict[date, Dict]] = defaultdict(lambda: defaultdict(_bucket))
+    for resource in resource_types:
+        column, series_column = _COLUMNS[resource]
+        query = db.query(
+            column,
+            day.label("day"),
+            func.sum(case((active, minutes), else_=0)),
+            func.sum(case((active, 1), else_=0)),
+            func.sum(case((Appointment.status == NO_SHOW_STATUS, 1), else_=0)),
+            func.sum(case((Appointment.status.in_(INACTIVE_STATUSES), 1), else_=0)),
+        ).filter(
+            Appointment.start_time >= start,
+            Appointment.start_time < end,
+        )
+        if filters[resource]:
+            query = query.filter(column.in_(filters[resource]))
+        for value, row_day, booked, visits, no_shows, cancelled in query.group_by(column, day).all():
+            bucket = buckets[(resource, value)][_as_date(row_day)]
+            bucket["booked_minutes"] += float(booked or 0)
+            bucket["appointments"] += int(visits or 0)
+            bucket["no_shows"] += int(no_shows or 0)
+            bucket["cancelled"] += int(cancelled or 0)
+
+        series_query = db.query(AppointmentSeries).filter(
+            AppointmentSeries.start_time < end,
+            or_(AppointmentSeries.until.is_(None), AppointmentSeries.until >= start),
+        )
+        if filters[resource]:
+            series_query = series_query.filter(series_column.in_(filters[resource]))
+        for series in series_query.all():
+            value = series.location if resource == "location" else series.created_by
+            for _, occurrence_start, _ in expand_in_window(series, start, end):
+                if key(occurrence_start) >= end:
+                    continue
+                bucket = buckets[(resource, value)][occurrence_start.date()]
+                if series.status in INACTIVE_STATUSES:
+                    bucket["cancelled"] += 1
+                    continue
+                bucket["booked_minutes"] += series.duration_minutes
+                bucket["appointments"] += 1
+                if series.status == NO_SHOW_STATUS:
+                    bucket["no_shows"] += 1
+
+    open_minutes_per_day = (day_end - day_start) * 60
+    open_days = set(_open_days(start, end, open_weekdays))
+    available = len(open_days) * open_minutes_per_day
+
+    results = []
+    for (resource, value), days in sorted(buckets.items(), key=lambda item: (item[0][0], str(item[0][1]))):
+        totals = _bucket()
+        rows = []
+        for row_day in sorted(days):
+            bucket = days[row_day]
+            for field in totals:
+                totals[field] += bucket[field]
+            day_available = open_minutes_per_day if row_day in open_days else 0
+            rows.append({
+                "date": row_day,
+                **bucket,
+                "booked_minutes": round(bucket["booked_minutes"], 1),
+                "utilization_pct": _pct(bucket["booked_minutes"], day_available),
+            })
+        results.append({
+            "resource": resource,
+            "key": value,
+            **totals,
+            "booked_minutes": round(totals["booked_minutes"], 1),
+            "open_minutes": available,
+            "utilization_pct": _pct(totals["booked_minutes"], available),
+            "days": rows,
+        })
+    return results
@@ -0,0 +1,396 @@
+"""
+On-disk FAISS index of finalized note chunks, updated incrementally.
+
+Vectors live in an IndexIDMap2 whose ids encode (note id, chunk number), so a
+note's chunks can be replaced or removed without touching the rest. Chunk text,
+patient ids and the sync watermark sit next to it in a small SQLite file. Both
+hold note text, so the directory is created owner-only and must be named
+explicitly (VECTOR_INDEX_DIR); it has to be storage that the API and the worker
+running the sync both mount, since the API only ever reads it.
+Readers memory-map the index and reload it when a sync replaces the file;
+`sync_note_index` streams notes changed since the watermark out of the database
+in batches, so neither memory nor embedding cost grows with the corpus.
+
+Searches for one patient score only that patient's vectors, reconstructed from
+the index by id, so their cost follows the chart rather than the corpus and
+other patients' notes can never be returned.
+"""
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import DateTime, func, literal
+from sqlalchemy.orm import Session
+
+from api.models.note import Note, NoteStatus
+
+INDEX_FILE = "notes.faiss"
+META_FILE = "meta.sqlite3"
+# Vector id = note id << CHUNK_BITS | chunk number
+CHUNK_BITS = 10
+MAX_CHUNKS_PER_NOTE = 1 << CHUNK_BITS
+SYNC_BATCH_SIZE = 256
+# Per-patient vector matrices kept between searches
+PATIENT_CACHE_SIZE = 256
+
+
+def vector_id(note_id: int, chunk: int) -> int:
+    return (note_id << CHUNK_BITS) | chunk
+
+
+def _normalize(vectors) -> np.ndarray:
+    # Inner product on unit vectors is cosine similarity
+    array = np.asarray(vectors, dtype="float32")
+    if array.ndim == 1:
+        array = array.reshape(1, -1)
+    norms = np.linalg.norm(array, axis=1, keepdims=True)
+    return array / np.where(norms == 0, 1, norms)
+
+
+class NoteVectorIndex:
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.index_path = os.path.join(directory, INDEX_FILE)
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        os.chmod(directory, 0o700)
+        self._lock = threading.RLock()
+        self._index = None
+        self._writable = False
+        self._loaded_mtime = None
+        # Metadata changes made since the last save(), committed with the index file
+        self._pending_rows = []
+        self._pending_deletes = []
+        # patient id -> (note ids array, chunk texts, vector matrix), valid for the loaded file
+        self._patients: "OrderedDict[int, tuple]" = OrderedDict()
+
+        meta_path = os.path.join(directory, META_FILE)
+        os.close(os.open(meta_path, os.O_CREAT | os.O_WRONLY, 0o600))
+        self._conn = sqlite3.connect(meta_path, timeout=5, check_same_thread=False, isolation_level=None)
+        # Rollback journal, not WAL: WAL needs shared memory on one host, and the
+        # directory is shared between the API and worker containers
+        self._conn.execute("PRAGMA journal_mode=DELETE")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " vector_id INTEGER PRIMARY KEY, note_id INTEGER NOT NULL,"
+            " patient_id INTEGER NOT NULL, text TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_chunks_note ON chunks (note_id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_chunks_patient ON chunks (patient_id)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT)")
+
+    # --- loading ---
+
+    def _file_mtime(self) -> Optional[float]:
+        try:
+            return os.stat(self.index_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _load(self, writable: bool = False):
+        """Map the current file for reading, or read it fully before modifying it."""
+        import faiss
+
+        with self._lock:
+            mtime = self._file_mtime()
+            if self._index is not None and mtime == self._loaded_mtime and (self._writable or not writable):
+                return self._index
+            if mtime is None:
+                self._index = None
+            elif writable:
+                self._index = faiss.read_index(self.index_path)
+            else:
+                try:
+                    self._index = faiss.read_index(self.index_path, faiss.IO_FLAG_MMAP | getattr(faiss, "IO_FLAG_READ_ONLY", 0))
+                except RuntimeError:
+                    # Index types without mmap support are read into memory
+                    self._index = faiss.read_index(self.index_path)
+            self._writable = writable or self._index is None
+            self._loaded_mtime = mtime
+            self._patients.clear()
+            return self._index
+
+    def ensure_loaded(self):
+        self._load()
+
+    # --- reads ---
+
+    def search(self, vector: Sequence[float], k: int = 3, patient_id: Optional[int] = None,
+               exclude_note_id: Optional[int] = None) -> List[Dict]:
+        """
+        Nearest chunks by cosine similarity; with `patient_id`, only that patient's
+        chunks, leaving out those of `exclude_note_id`.
+        """
+        if patient_id is not None:
+            return self._search_patient(_normalize(vector)[0], k, patient_id, exclude_note_id)
+        with self._lock:
+            index = self._load()
+            if index is None or index.ntotal == 0:
+                return []
+            scores, ids = index.search(_normalize(vector), k)
+        return self._rows([int(i) for i in ids[0] if i >= 0], scores[0])
+
+    def _search_patient(self, query: np.ndarray, k: int, patient_id: int,
+                        exclude_note_id: Optional[int] = None) -> List[Dict]:
+        with self._lock:
+            index = self._load()
+            if index is None:
+                return []
+            entry = self._patients.get(patient_id)
+            if entry is None:
+                rows = self._conn.execute(
+                    "SELECT vector_id, note_id, text FROM chunks WHERE patient_id = ? ORDER BY vector_id", (patient_id,)
+                ).fetchall()
+                matrix = (
+                    np.vstack([index.reconstruct(row[0]) for row in rows])
+                    if rows else np.zeros((0, index.d), dtype="float32")
+                )
+                entry = (np.asarray([row[1] for row in rows], dtype="int64"), [row[2] for row in rows], matrix)
+                self._patients[patient_id] = entry
+                if len(self._patients) > PATIENT_CACHE_SIZE:
+                    self._patients.popitem(last=False)
+            else:
+                self._patients.move_to_end(patient_id)
+        note_ids, texts, matrix = entry
+        if not len(note_ids):
+            return []
+        scores = matrix @ query
+        candidates = np.argsort(-scores, kind="stable")
+        if exclude_note_id is not None:
+            candidates = candidates[note_ids[candidates] != exclude_note_id]
+        return [
+            {"note_id": int(note_ids[i]), "patient_id": patient_id, "text": texts[i], "score": float(scores[i])}
+            for i in candidates[:k]
+        ]
+
+    def _rows(self, ids: List[int], scores) -> List[Dict]:
+        if not ids:
+            return []
+        placeholders = ",".join("?" * len(ids))
+        rows = {
+            row[0]: row for row in self._conn.execute(
+                f"SELECT vector_id, note_id, patient_id, text FROM chunks WHERE vector_id IN ({placeholders})", ids
+            )
+        }
+        # A concurrent sync may have dropped a chunk between search and lookup
+        return [
+            {"note_id": rows[i][1], "patient_id": rows[i][2], "text": rows[i][3], "score": float(score)}
+            for i, score in zip(ids, scores) if i in rows
+        ]
+
+    def watermark(self) -> Optional[datetime]:
+        row = self._conn.execute("SELECT value FROM state WHERE key = 'watermark'").fetchone()
+        return datetime.fromisoformat(row[0]) if row and row[0] else None
+
+    def has_patient(self, patient_id: int) -> bool:
+        """Whether any chunk of this patient is indexed; one lookup on the patient index."""
+        return self._conn.execute("SELECT 1 FROM chunks WHERE patient_id = ? LIMIT 1", (patient_id,)).fetchone() is not None
+
+    def indexed_note_count(self) -> int:
+        return self._conn.execute("SELECT COUNT(DISTINCT note_id) FROM chunks").fetchone()[0]
+
+    def indexed_note_ids(self) -> List[int]:
+        return [row[0] for row in self._conn.execute("SELECT DISTINCT note_id FROM chunks")]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            index = self._load()
+            vectors = index.ntotal if index is not None else 0
+        watermark = self.watermark()
+        return {
+            "vectors": vectors,
+            "notes": self.indexed_note_count(),
+            "watermark": watermark.isoformat() if watermark else None,
+            "memory_mapped": index is not None and not self._writable,
+        }
+
+    # --- writes (one writer at a time; callers hold `writer()`) ---
+
+    def writer(self):
+        return self._lock
+
+    def upsert(self, notes: List[Dict], vectors) -> int:
+        """
+        Replace the chunks of `notes` ({"note_id", "patient_id", "chunks"}) with
+        `vectors`, one row per chunk in order. Returns the number of vectors added.
+        """
+        import faiss
+
+        vectors = _normalize(vectors) if len(vectors) else np.zeros((0, 0), dtype="float32")
+        ids, rows = [], []
+        for note in notes:
+            for chunk, text in enumerate(note["chunks"][:MAX_CHUNKS_PER_NOTE]):
+                ids.append(vector_id(note["note_id"], chunk))
+                rows.append((ids[-1], note["note_id"], note["patient_id"], text))
+        with self._lock:
+            self.remove_notes([note["note_id"] for note in notes])
+            if not ids:
+                return 0
+            index = self._load(writable=True)
+            if index is None:
+                index = faiss.IndexIDMap2(faiss.IndexFlatIP(vectors.shape[1]))
+                self._index, self._writable = index, True
+            index.add_with_ids(vectors[:len(ids)], np.asarray(ids, dtype="int64"))
+            self._pending_rows += rows
+            self._patients.clear()
+        return len(ids)
+
+    def remove_notes(self, note_ids: Sequence[int]):
+        if not note_ids:
+            return
+        removed = set(note_ids)
+        with self._lock:
+            ids = [row[0] for row in self._pending_rows if row[1] in removed]
+            note_list = list(removed)
+            for start in range(0, len(note_list), 500):
+                part = note_list[start:start + 500]
+                ids += [row[0] for row in self._conn.execute(
+                    f"SELECT vector_id FROM chunks WHERE note_id IN ({','.join('?' * len(part))})", part
+                )]
+            index = self._load(writable=True)
+            if index is not None and ids:
+                # One pass over the id map for the whole batch
+                index.remove_ids(np.asarray(ids, dtype="int64"))
+            self._pending_deletes += note_list
+            # Rows queued earlier in this sync are superseded
+            self._pending_rows = [row for row in self._pending_rows if row[1] not in removed]
+
+    def save(self, watermark: Optional[datetime]):
+        """Publish pending changes: replace the index file, then commit metadata and watermark."""
+        import faiss
+
+        with self._lock:
+            if self._index is not None and self._writable:
+                tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+                faiss.write_index(self._index, tmp_path)
+                os.chmod(tmp_path, 0o600)
+                os.replace(tmp_path, self.index_path)
+                self._loaded_mtime = self._file_mtime()
+            self._patients.clear()
+            deletes, rows = self._pending_deletes, self._pending_rows
+            self._conn.execute("BEGIN")
+            try:
+                for start in range(0, len(deletes), 500):
+                    part = deletes[start:start + 500]
+                    self._conn.execute(
+                        f"DELETE FROM chunks WHERE note_id IN ({','.join('?' * len(part))})", part
+                    )
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO chunks (vector_id, note_id, patient_id, text) VALUES (?, ?, ?, ?)", rows
+                )
+                if watermark is not None:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO state (key, value) VALUES ('watermark', ?)", (watermark.isoformat(),)
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._pending_deletes, self._pending_rows = [], []
+
+
+def _change_key(expr, dialect_name: str):
+    # Compare SQLite text timestamps on julianday(), as the calendar sync does
+    if dialect_name == "sqlite":
+        return func.julianday(expr)
+    return expr
+
+
+def sync_note_index(
+    db: Session,
+    index: NoteVectorIndex,
+    embed_documents: Callable[[List[str]], List[List[float]]],
+    split_text: Callable[[str], List[str]],
+    batch_size: int = SYNC_BATCH_SIZE,
+) -> Dict:
+    """
+    Bring the index up to date with notes changed since its watermark. Finalized
+    notes are (re-)embedded, other notes are dropped, and notes deleted from the
+    database are removed. Rows are streamed `batch_size` at a time.
+    """
+    dialect_name = db.get_bind().dialect.name
+    changed_at = func.coalesce(Note.updated_at, Note.created_at)
+    key = _change_key(changed_at, dialect_name)
+    since = index.watermark()
+
+    query = db.query(
+        Note.id, Note.patient_id, Note.title, Note.content, Note.status, changed_at.label("changed_at")
+    )
+    if since is not None:
+        # Inclusive: rows changed within the watermark's own tick are re-applied, which is idempotent
+        query = query.filter(key >= _change_key(literal(since, DateTime(timezone=True)), dialect_name))
+    rows = query.order_by(key.asc(), Note.id.asc()).yield_per(batch_size)
+
+    stats = {"embedded_notes": 0, "vectors_added": 0, "removed_notes": 0}
+    watermark = since
+
+    def flush(batch):
+        nonlocal watermark
+        finalized, dropped = [], []
+        for row in batch:
+            if row.status == NoteStatus.FINALIZED:
+                chunks = split_text(f"{row.title}: {row.content}") or [row.title]
+                finalized.append({"note_id": row.id, "patient_id": row.patient_id, "chunks": chunks})
+            else:
+                dropped.append(row.id)
+        texts = [text for note in finalized for text in note["chunks"][:MAX_CHUNKS_PER_NOTE]]
+        with index.writer():
+            index.remove_notes(dropped)
+            stats["vectors_added"] += index.upsert(finalized, embed_documents(texts) if texts else [])
+        stats["embedded_notes"] += len(finalized)
+        watermark = max(watermark, batch[-1].changed_at) if watermark else batch[-1].changed_at
+
+    batch = []
+    with index.writer():
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+
+        index.save(watermark)
+
+        # Hard deletes leave no updated_at behind; only scan ids when the counts disagree
+        finalized = db.query(func.count(Note.id)).filter(Note.status == NoteStatus.FINALIZED).scalar()
+        if index.indexed_note_count() != finalized:
+            existing = {
+                note_id for (note_id,) in
+                db.query(Note.id).filter(Note.status == NoteStatus.FINALIZED).yield_per(5000)
+            }
+            gone = [note_id for note_id in index.indexed_note_ids() if note_id not in existing]
+            if gone:
+                index.remove_notes(gone)
+                index.save(watermark)
+            stats["removed_notes"] = len(gone)
+    stats.update(index.stats())
+    return stats
+
+
+_indexes: Dict[str, NoteVectorIndex] = {}
+_index_pid: Optional[int] = None
+_index_lock = threading.Lock()
+
+
+def get_note_index(model: str) -> Optional[NoteVectorIndex]:
+    """
+    Process-wide index for one embedding model under VECTOR_INDEX_DIR; vectors
+    from different models never share an index. A forked worker opens its own.
+    None when VECTOR_INDEX_DIR is unset: there is no default location for note text.
+    """
+    global _index_pid
+    base = os.getenv("VECTOR_INDEX_DIR")
+    if not base:
+        return None
+    with _index_lock:
+        if _index_pid != os.getpid():
+            _indexes.clear()
+            _index_pid = os.getpid()
+        directory = os.path.join(base, "".join(c if c.isalnum() or c in "-_." else "_" for c in model))
+        if directory not in _indexes:
+            _indexes[directory] = NoteVectorIndex(directory)
+        return _indexes[directory]
@@ -1 +1,5 @@
 # Tasks package
+
+# Hard time limit for every celery task, in seconds (see celery_app); kept here so
+# code that reasons about task lifetimes can read it without importing celery
+TASK_TIME_LIMIT = 30 * 60
@@ -3,8 +3,7 @@ Background AI processing tasks using Celery
 """
 from celery import current_task
 from api.tasks.celery_app import celery_app
-from api.agents.summarization_agent import SummarizationAgent
-from api.agents.risk_agent import RiskAssessmentAgent
+from api.services.registry import get_ai_service, get_risk_agent, get_summarization_agent
 from api.db.database import SessionLocal
 from api.models.note import Note
 from api.models.patient import Patient
@@ -38,7 +37,7 @@ def process_note_ai(self, note_id: int, user_id: int):
             raise Exception(f"Patient for note {note_id} not found")
         
         # Process with AI
-        summarization_agent = SummarizationAgent()
+        summarization_agent = get_summarization_agent()
         result = summarization_agent.process_note(note, patient, db)
         
         # Log audit trail
@@ -85,7 +84,7 @@ def generate_patient_risk_report(self, patient_id: int, user_id: int):
             meta={"status": "Generating risk report", "patient_id": patient_id}
         )
         
-        risk_agent = RiskAssessmentAgent()
+        risk_agent = get_risk_agent()
         risk_report = risk_agent.generate_patient_risk_report(patient_id, db)
         
         # Log audit trail
@@ -127,7 +126,7 @@ def batch_process_notes(self, note_ids: list, user_id: int):
             meta={"status": f"Processing {len(note_ids)} notes", "total": len(note_ids)}
         )
         
-        summarization_agent = SummarizationAgent()
+        summarization_agent = get_summarization_agent()
         results = []
         
         for i, note_id in enumerate(note_ids):
@@ -184,24 +183,13 @@ def batch_process_notes(self, note_ids: list, user_id: int):
 @celery_app.task
 def update_vector_store():
     """
-    Background task to update vector store with new notes
+    Background task to bring the persistent note index up to date
     """
     db = SessionLocal()
     try:
-        from api.services.ai_service import MedicalAIService
-        ai_service = MedicalAIService()
-        
-        # Get all notes for vector store
-        notes = db.query(Note).filter(Note.status == "finalized").all()
-        note_contents = [f"{note.title}: {note.content}" for note in notes]
-        
-        # Update vector store
-        ai_service.add_documents_to_vector_store(note_contents)
-        
-        return {
-            "status": "completed",
-            "notes_processed": len(note_contents)
-        }
+        # Only notes changed since the last run are embedded; deletions are removed
+        stats = get_ai_service().sync_vector_index(db)
+        return {"status": "completed", **stats}
     
     except Exception as e:
         logger.error(f"Error updating vector store: {str(e)}")
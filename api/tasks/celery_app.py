@@ -5,6 +5,8 @@ from celery import Celery
 import os
 from dotenv import load_dotenv
 
+from api.tasks import TASK_TIME_LIMIT
+
 load_dotenv()
 
 # Celery configuration
@@ -14,7 +16,7 @@ celery_app = Celery(
     "medical_notes_ai",
     broker=REDIS_URL,
     backend=REDIS_URL,
-    include=["api.tasks.ai_tasks"]
+    include=["api.tasks.ai_tasks", "api.tasks.reminder_tasks"]
 )
 
 # Celery configuration
@@ -25,8 +27,21 @@ celery_app.conf.update(
     timezone="UTC",
     enable_utc=True,
     task_track_started=True,
-    task_time_limit=30 * 60,  # 30 minutes
+    task_time_limit=TASK_TIME_LIMIT,  # 30 minutes
     task_soft_time_limit=25 * 60,  # 25 minutes
     worker_prefetch_multiplier=1,
     worker_max_tasks_per_child=1000,
+    beat_schedule={
+        # Each run claims ledger rows before sending, so an overlapping run skips them
+        "appointment-reminders": {
+            "task": "api.tasks.reminder_tasks.send_appointment_reminders",
+            "schedule": 15 * 60,
+            "kwargs": {"hours_ahead": 24},
+        },
+        # Incremental: each run embeds only notes changed since the index watermark
+        "update-vector-store": {
+            "task": "api.tasks.ai_tasks.update_vector_store",
+            "schedule": 10 * 60,
+        },
+    },
 )
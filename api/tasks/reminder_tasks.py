@@ -0,0 +1,27 @@
+"""
+Scheduled appointment reminders using Celery
+"""
+from api.tasks.celery_app import celery_app
+from api.db.database import SessionLocal
+from api.services.reminder_service import dispatch_due_reminders
+import logging
+
+logger = logging.getLogger(__name__)
+
+@celery_app.task
+def send_appointment_reminders(hours_ahead: int = 24):
+    """
+    Periodic task that reminds patients of appointments in the next `hours_ahead` hours
+    """
+    db = SessionLocal()
+    try:
+        stats = dispatch_due_reminders(db, hours_ahead=hours_ahead)
+        logger.info(f"Appointment reminders: {stats['sent']} sent, {stats['failed']} failed of {stats['due']} due")
+        return {
+            "status": "completed",
+            "due": stats["due"],
+            "sent": stats["sent"],
+            "failed": stats["failed"]
+        }
+    finally:
+        db.close()
@@ -129,3 +129,65 @@ class ReadOnlyUser(HttpUser):
         if self.token:
             self.client.get("/appointments/", headers=self.headers)
 
+
+
+class AIUser(HttpUser):
+    """Exercises the AI endpoints. Run the API with LLM_BACKEND=fake (or replay) so the
+    load goes through the real pipeline without calling or paying for the LLM API."""
+    wait_time = between(1, 3)
+    weight = 1
+
+    def on_start(self):
+        """Login as existing user and pick notes to summarize"""
+        login_response = self.client.post(
+            "/auth/login",
+            json={
+                "email": "dr.williams@hospital.com",
+                "password": "password123"
+            }
+        )
+
+        self.notes = []
+        if login_response.status_code == 200:
+            self.token = login_response.json()["access_token"]
+            self.headers = {"Authorization": f"Bearer {self.token}"}
+            notes_response = self.client.get("/notes/", headers=self.headers)
+            if notes_response.status_code == 200:
+                self.notes = notes_response.json()
+        else:
+            self.token = None
+            self.headers = {}
+
+    @task(3)
+    def summarize_note(self):
+        """Synchronous note analysis"""
+        if self.notes:
+            note = random.choice(self.notes)
+            self.client.post(f"/ai/summarize/{note['id']}/sync", headers=self.headers,
+                             name="/ai/summarize/[id]/sync")
+
+    @task(2)
+    def stream_note_summary(self):
+        """Streamed note analysis, read to the end"""
+        if self.notes:
+            note = random.choice(self.notes)
+            with self.client.post(f"/ai/summarize/{note['id']}/stream", headers=self.headers, stream=True,
+                                  name="/ai/summarize/[id]/stream", catch_response=True) as response:
+                for _ in response.iter_lines():
+                    pass
+
+    @task(2)
+    def patient_summary(self):
+        """Stored rolling patient summary"""
+        if self.notes:
+            note = random.choice(self.notes)
+            self.client.post(f"/ai/patient-summary/{note['patient_id']}", headers=self.headers,
+                             name="/ai/patient-summary/[id]")
+
+    @task(1)
+    def risk_report(self):
+        """Whole-chart risk report"""
+        if self.notes:
+            note = random.choice(self.notes)
+            self.client.get(f"/ai/risk-report/{note['patient_id']}", headers=self.headers,
+                            name="/ai/risk-report/[id]")
@@ -71,7 +71,9 @@ interface PatientTimeline {
     reason?: string;
     status?: string;
   }>;
-  ai_summary: string;
+  ai_summary: string | null;
+  ai_summary_status?: 'ready' | 'pending' | 'stale';
+  next_cursor?: string | null;
   statistics: {
     total_visits: number;
     total_appointments: number;
@@ -129,10 +131,14 @@ export function AIAnalyticsTab({ darkMode, tasks, setActiveTab, onViewTasks, onA
   const fetchAllData = async () => {
     try {
       setLoading(true);
+      // The appointments API only serves bounded windows; analytics look 90 days either side of today
+      const now = new Date();
+      const windowStart = new Date(now.getTime() - 90 * 24 * 60 * 60 * 1000);
+      const windowEnd = new Date(now.getTime() + 90 * 24 * 60 * 60 * 1000);
       const [patientsData, notesData, appointmentsData] = await Promise.all([
         api.getPatients(),
         api.getNotes(),
-        api.getAppointments(),
+        api.getAppointments({ start: windowStart.toISOString(), end: windowEnd.toISOString() }),
       ]);
       setPatients(patientsData);
       setNotes(notesData);
@@ -741,7 +747,7 @@ export function AIAnalyticsTab({ darkMode, tasks, setActiveTab, onViewTasks, onA
                   <h3 className={`text-lg font-semibold ${textClass}`}>AI-Generated Patient Summary</h3>
                 </div>
                 <div className={`p-4 ${darkMode ? 'bg-slate-700/50' : 'bg-white/60'} rounded-xl`}>
-                  <p className={`${textClass} whitespace-pre-wrap leading-relaxed`}>{patientTimeline.ai_summary}</p>
+                  <p className={`${textClass} whitespace-pre-wrap leading-relaxed`}>{patientTimeline.ai_summary ?? 'AI summary is being generated. Refresh in a few moments.'}</p>
                 </div>
               </div>
 
@@ -273,6 +273,7 @@ export function CalendarTab({ darkMode }: CalendarTabProps) {
     'pending': 'bg-orange-500',
     'hold': 'bg-yellow-500',
     'cancelled': 'bg-red-500',
+    'no_show': 'bg-gray-400',
   };
 
   const daysOfWeek = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun'];
@@ -542,6 +543,7 @@ export function CalendarTab({ darkMode }: CalendarTabProps) {
                     <option value="pending">Pending</option>
                     <option value="hold">Hold</option>
                     <option value="cancelled">Cancelled</option>
+                    <option value="no_show">No-show</option>
                   </select>
                   <ChevronDown className="absolute right-3 top-1/2 -translate-y-1/2 w-4 h-4 text-slate-400 pointer-events-none" />
                 </div>
@@ -141,6 +141,53 @@ class APIService {
     }
   }
 
+  // Reads a server-sent-event response, calling onToken for each "token" event;
+  // resolves with the "result" event's data
+  private async stream<T>(
+    endpoint: string,
+    onToken: (text: string) => void,
+    options: RequestInit = {}
+  ): Promise<T> {
+    const headers: HeadersInit = { Accept: 'text/event-stream', ...options.headers };
+    if (this.token) {
+      headers['Authorization'] = `Bearer ${this.token}`;
+    }
+
+    const response = await fetch(`${API_BASE_URL}${endpoint}`, { ...options, headers });
+    if (!response.ok || !response.body) {
+      if (response.status === 401) {
+        this.clearToken();
+        throw new Error('Unauthorized - please login again');
+      }
+      const errorData = await response.json().catch(() => ({}));
+      throw new Error(typeof errorData.detail === 'string' ? errorData.detail : `HTTP Error: ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let result: T | undefined;
+    for (;;) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      let boundary;
+      while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+        const block = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+        const event = /^event: (.*)$/m.exec(block)?.[1];
+        const data = JSON.parse(/^data: (.*)$/m.exec(block)?.[1] ?? '{}');
+        if (event === 'token') onToken(data.text);
+        else if (event === 'result') result = data as T;
+        else if (event === 'error') throw new Error(data.detail);
+      }
+    }
+    if (result === undefined) {
+      throw new Error('Stream ended without a result');
+    }
+    return result;
+  }
+
   // Authentication
   async login(email: string, password: string): Promise<LoginResponse> {
     const response = await this.request<LoginResponse>('/auth/login', {
@@ -228,12 +275,30 @@ class APIService {
     });
   }
 
-  async getPatientSummary(patientId: number): Promise<{ summary: string }> {
-    return this.request<{ summary: string }>(`/ai/patient-summary/${patientId}`, {
+  // Stored rolling summary; `stale` means notes written since are still being folded in
+  async getPatientSummary(
+    patientId: number
+  ): Promise<{ summary: string; generated_at: string | null; pending_notes: number; stale: boolean }> {
+    return this.request(`/ai/patient-summary/${patientId}`, {
       method: 'POST',
     });
   }
 
+  streamNoteSummary(
+    noteId: number,
+    onToken: (text: string) => void
+  ): Promise<{ summary: string; risk_level: string; recommendations: string }> {
+    return this.stream(`/ai/summarize/${noteId}/stream`, onToken, { method: 'POST' });
+  }
+
+  streamPatientSummary(patientId: number, onToken: (text: string) => void): Promise<{ summary: string }> {
+    return this.stream(`/ai/patient-summary/${patientId}/stream`, onToken, { method: 'POST' });
+  }
+
+  streamJourneySummary(patientId: number, onToken: (text: string) => void): Promise<{ summary: string }> {
+    return this.stream(`/ai/patient-timeline/${patientId}/summary/stream`, onToken);
+  }
+
   async getPatientRiskReport(patientId: number): Promise<RiskReport> {
     return this.request<RiskReport>(`/ai/risk-report/${patientId}`);
   }
@@ -247,10 +312,8 @@ class APIService {
   }
 
   // Appointments
-  async getAppointments(params?: { start?: string; end?: string }): Promise<Appointment[]> {
-    const queryString = params
-      ? `?${new URLSearchParams(params as Record<string, string>).toString()}`
-      : '';
+  async getAppointments(params: { start: string; end: string }): Promise<Appointment[]> {
+    const queryString = `?${new URLSearchParams(params).toString()}`;
     return this.request<Appointment[]>(`/appointments/${queryString}`);
   }
 
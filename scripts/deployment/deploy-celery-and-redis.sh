@@ -5,6 +5,13 @@
 
 set -e
 
+# The worker writes the note index that the API reads; both mount the same
+# Filestore share (created by deploy-gcp.sh) at VECTOR_INDEX_DIR
+INDEX_IP=$(gcloud filestore instances describe mednotes-index \
+  --zone us-central1-a \
+  --format 'value(networks[0].ipAddresses[0])' \
+  --project securemed-ai)
+
 echo "🚀 Deploying Celery Worker to Cloud Run..."
 gcloud run deploy mednotes-worker \
   --image gcr.io/securemed-ai/mednotes-worker \
@@ -12,7 +19,13 @@ gcloud run deploy mednotes-worker \
   --region us-central1 \
   --no-allow-unauthenticated \
   --set-secrets=DATABASE_URL=database-url:latest,REDIS_URL=redis-url:latest,OPENAI_API_KEY=openai-api-key:latest,SECRET_KEY=secret-key:latest \
-  --set-env-vars=ENVIRONMENT=production \
+  --execution-environment gen2 \
+  --network default \
+  --subnet default \
+  --vpc-egress private-ranges-only \
+  --add-volume name=vector-index,type=nfs,location=$INDEX_IP:/vector_index \
+  --add-volume-mount volume=vector-index,mount-path=/mnt/vector-index \
+  --set-env-vars=ENVIRONMENT=production,VECTOR_INDEX_DIR=/mnt/vector-index \
   --memory 1Gi \
   --cpu 1 \
   --min-instances 0 \
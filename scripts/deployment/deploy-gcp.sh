@@ -13,6 +13,11 @@ FRONTEND_SERVICE="mednotes-frontend"
 DB_INSTANCE="mednotes-db"
 DB_NAME="mednotes"
 DB_USER="mednotes_user"
+# Note index (VECTOR_INDEX_DIR): written by the worker, read by the API, so both mount this share
+INDEX_FILESTORE="mednotes-index"
+INDEX_ZONE="us-central1-a"
+INDEX_SHARE="vector_index"
+INDEX_MOUNT="/mnt/vector-index"
 
 # Colors for output
 RED='\033[0;31m'
@@ -35,7 +40,8 @@ gcloud services enable \
     run.googleapis.com \
     sqladmin.googleapis.com \
     secretmanager.googleapis.com \
-    artifactregistry.googleapis.com
+    artifactregistry.googleapis.com \
+    file.googleapis.com
 
 # Step 3: Create Cloud SQL instance (if not exists)
 echo -e "\n${YELLOW}Step 3: Checking Cloud SQL instance...${NC}"
@@ -78,20 +84,60 @@ if ! gcloud secrets describe secret-key --project=$PROJECT_ID 2>/dev/null; then
     openssl rand -base64 32 | gcloud secrets create secret-key --data-file=-
 fi
 
-# Step 5: Build and deploy backend
-echo -e "\n${YELLOW}Step 5: Building and deploying backend API...${NC}"
+# Step 4b: Shared storage for the note index
+# The index holds note text, so it lives on a private Filestore share rather than
+# in the container's /tmp, which the worker's writes would never reach anyway
+echo -e "\n${YELLOW}Step 4b: Checking note index share...${NC}"
+if ! gcloud filestore instances describe $INDEX_FILESTORE --zone=$INDEX_ZONE --project=$PROJECT_ID 2>/dev/null; then
+    echo "Creating Filestore instance for the note index..."
+    gcloud filestore instances create $INDEX_FILESTORE \
+        --zone=$INDEX_ZONE \
+        --tier=BASIC_HDD \
+        --file-share=name=$INDEX_SHARE,capacity=1TB \
+        --network=name=default \
+        --project=$PROJECT_ID
+fi
+INDEX_IP=$(gcloud filestore instances describe $INDEX_FILESTORE \
+    --zone=$INDEX_ZONE \
+    --format 'value(networks[0].ipAddresses[0])' \
+    --project=$PROJECT_ID)
+
+# Step 5: Build backend
+echo -e "\n${YELLOW}Step 5: Building backend API image...${NC}"
 gcloud builds submit --tag gcr.io/$PROJECT_ID/$BACKEND_SERVICE \
     --project=$PROJECT_ID \
     -f config/Dockerfile.backend .
 
-echo "Deploying backend to Cloud Run..."
+# Step 6: Run database migrations
+echo -e "\n${YELLOW}Step 6: Running database migrations...${NC}"
+# The API no longer creates tables on startup; the schema step runs as a Cloud Run job
+# from the new image before the new revision starts serving (as in config/cloudbuild.yaml)
+gcloud run jobs deploy mednotes-migrate \
+    --image gcr.io/$PROJECT_ID/$BACKEND_SERVICE \
+    --region $REGION \
+    --set-cloudsql-instances $PROJECT_ID:$REGION:$DB_INSTANCE \
+    --set-secrets "DATABASE_URL=database-url:latest,SECRET_KEY=secret-key:latest" \
+    --command python \
+    --args="-m,api.db.migrate" \
+    --execute-now \
+    --wait \
+    --project=$PROJECT_ID
+
+# Step 7: Deploy backend
+echo -e "\n${YELLOW}Step 7: Deploying backend API to Cloud Run...${NC}"
 gcloud run deploy $BACKEND_SERVICE \
     --image gcr.io/$PROJECT_ID/$BACKEND_SERVICE \
     --platform managed \
     --region $REGION \
     --allow-unauthenticated \
     --add-cloudsql-instances $PROJECT_ID:$REGION:$DB_INSTANCE \
-    --set-env-vars "ENVIRONMENT=production,PORT=8080" \
+    --execution-environment gen2 \
+    --network default \
+    --subnet default \
+    --vpc-egress private-ranges-only \
+    --add-volume name=vector-index,type=nfs,location=$INDEX_IP:/$INDEX_SHARE \
+    --add-volume-mount volume=vector-index,mount-path=$INDEX_MOUNT \
+    --set-env-vars "ENVIRONMENT=production,PORT=8080,VECTOR_INDEX_DIR=$INDEX_MOUNT" \
     --set-secrets "DATABASE_URL=database-url:latest,SECRET_KEY=secret-key:latest" \
     --memory 512Mi \
     --cpu 1 \
@@ -106,14 +152,14 @@ BACKEND_URL=$(gcloud run services describe $BACKEND_SERVICE \
 
 echo -e "${GREEN}Backend deployed at: $BACKEND_URL${NC}"
 
-# Step 6: Update frontend environment variable
-echo -e "\n${YELLOW}Step 6: Updating frontend API URL...${NC}"
+# Step 8: Update frontend environment variable
+echo -e "\n${YELLOW}Step 8: Updating frontend API URL...${NC}"
 cat > frontend/.env.production << EOF
 VITE_API_URL=$BACKEND_URL
 EOF
 
-# Step 7: Build and deploy frontend
-echo -e "\n${YELLOW}Step 7: Building and deploying frontend...${NC}"
+# Step 9: Build and deploy frontend
+echo -e "\n${YELLOW}Step 9: Building and deploying frontend...${NC}"
 cd frontend
 gcloud builds submit --tag gcr.io/$PROJECT_ID/$FRONTEND_SERVICE \
     --project=$PROJECT_ID
@@ -146,8 +192,3 @@ echo "Frontend App: $FRONTEND_URL"
 echo ""
 echo "API Docs: $BACKEND_URL/docs"
 echo "=====================================${NC}"
-
-# Step 8: Run database migrations
-echo -e "\n${YELLOW}Step 8: Running database migrations...${NC}"
-echo "Note: You may need to run migrations manually using Cloud SQL Proxy"
-echo "Command: gcloud sql connect $DB_INSTANCE --user=$DB_USER"
@@ -17,8 +17,9 @@ TEST_DB_FILE.close()
 os.environ["DATABASE_URL"] = f"sqlite:///{TEST_DB_FILE.name}"
 
 from api.main import app
-from api.db.database import Base, get_db, engine
-from api.models import user, patient, note, appointment, audit
+from api.db.database import Base, get_db, get_session_factory, engine
+from api.db.migrate import migrate, schema_migrations
+from api.models import user, patient, note, appointment, audit, reminder, patient_summary
 from api.deps import get_password_hash
 
 # Override the engine with test database
@@ -30,6 +31,24 @@ test_engine = create_engine(
     echo=False
 )
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=test_engine)
+# Handlers that open their own sessions (one per thread) get pooled connections to the test database
+concurrent_engine = create_engine(TEST_DATABASE_URL, connect_args={"check_same_thread": False})
+ConcurrentSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=concurrent_engine)
+
+
+def pytest_configure(config):
+    # Also registered in config/pytest.ini; this covers runs without that file
+    config.addinivalue_line("markers", "slow: wall-clock benchmarks, skipped unless -m slow or RUN_SLOW_TESTS=1")
+
+
+def pytest_collection_modifyitems(config, items):
+    """Benchmarks assert on wall-clock time, so they only run when asked for."""
+    if "slow" in (config.getoption("markexpr") or "") or os.getenv("RUN_SLOW_TESTS", "").lower() in ("1", "true", "yes"):
+        return
+    skip = pytest.mark.skip(reason="benchmark; run with -m slow or RUN_SLOW_TESTS=1")
+    for item in items:
+        if "slow" in item.keywords:
+            item.add_marker(skip)
 
 
 @pytest.fixture(scope="function")
@@ -37,8 +56,9 @@ def db():
     """Create a fresh database for each test"""
     # Drop all tables first to ensure clean state
     Base.metadata.drop_all(bind=test_engine)
-    # Create all tables
-    Base.metadata.create_all(bind=test_engine)
+    schema_migrations.drop(bind=test_engine, checkfirst=True)
+    # Create all tables the way a deploy does
+    migrate(bind=test_engine)
     db = TestingSessionLocal()
     try:
         yield db
@@ -63,6 +83,7 @@ def client(db):
     
     # Override database dependency to use test database
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_session_factory] = lambda: ConcurrentSessionLocal
     
     # Store current user for auth override (will be set by auth_headers fixture)
     current_test_user = [None]  # Use list to allow modification
@@ -0,0 +1,443 @@
+"""
+Unit tests for appointment endpoints
+"""
+import pytest
+from fastapi import status
+
+
+def _appointment(title, start, minutes=30, location="Clinic 4A"):
+    from datetime import timedelta
+    return {
+        "title": title,
+        "patient_name": "John Doe",
+        "appointment_type": "Follow-up",
+        "location": location,
+        "start_time": start.isoformat(),
+        "end_time": (start + timedelta(minutes=minutes)).isoformat(),
+    }
+
+
+def test_list_appointments_requires_window(client, auth_headers):
+    """Test listing appointments without a bounded window is rejected"""
+    response = client.get("/appointments/", headers=auth_headers)
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    response = client.get(
+        "/appointments/",
+        headers=auth_headers,
+        params={"start": "2024-01-01T00:00:00", "end": "2026-01-01T00:00:00"}
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_list_appointments_does_not_seed(client, auth_headers):
+    """Test an empty calendar stays empty on read"""
+    response = client.get(
+        "/appointments/",
+        headers=auth_headers,
+        params={"start": "2024-03-01T00:00:00", "end": "2024-03-31T23:59:59"}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == []
+
+
+def test_recurring_series_expands_inside_window(client, auth_headers):
+    """Test recurring series occurrences are merged with one-off appointments in the window"""
+    from datetime import datetime
+
+    client.post(
+        "/appointments/",
+        headers=auth_headers,
+        json=_appointment("One-off", datetime(2024, 3, 5, 10, 0))
+    )
+    response = client.post(
+        "/appointments/series",
+        headers=auth_headers,
+        json={
+            "title": "Physio",
+            "patient_name": "John Doe",
+            "appointment_type": "Therapy",
+            "location": "Rehab Gym",
+            "start_time": "2024-01-01T09:00:00",
+            "duration_minutes": 45,
+            "frequency": "weekly",
+            "by_weekday": "0,3",
+            "count": 20
+        }
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+
+    # Mondays and Thursdays from Jan 1; the 20th and last occurrence is Thursday Mar 7
+    response = client.get(
+        "/appointments/",
+        headers=auth_headers,
+        params={"start": "2024-03-04T00:00:00", "end": "2024-03-17T23:59:59"}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    items = [(item["title"], item["start_time"][:16], item["occurrence_index"]) for item in response.json()]
+    assert items == [
+        ("Physio", "2024-03-04T09:00", 18),
+        ("One-off", "2024-03-05T10:00", None),
+        ("Physio", "2024-03-07T09:00", 19),
+    ]
+
+
+def test_create_appointment_rejects_double_booking(client, auth_headers):
+    """Test overlapping bookings in the same room are rejected and back-to-back ones allowed"""
+    from datetime import datetime
+
+    first = client.post("/appointments/", headers=auth_headers, json=_appointment("First", datetime(2024, 4, 1, 9, 0), 60))
+    assert first.status_code == status.HTTP_201_CREATED
+
+    overlap = client.post("/appointments/", headers=auth_headers, json=_appointment("Overlap", datetime(2024, 4, 1, 9, 30), 60))
+    assert overlap.status_code == status.HTTP_409_CONFLICT
+    conflicts = overlap.json()["detail"]["conflicts"]
+    assert {c["appointment_id"] for c in conflicts} == {first.json()["id"]}
+
+    back_to_back = client.post(
+        "/appointments/", headers=auth_headers, json=_appointment("Next", datetime(2024, 4, 1, 10, 0), 30, location="Clinic 2C")
+    )
+    assert back_to_back.status_code == status.HTTP_201_CREATED
+
+
+def test_update_appointment_checks_conflicts(client, auth_headers):
+    """Test moving an appointment onto another booking is rejected, but cancelling frees the slot"""
+    from datetime import datetime
+
+    first = client.post("/appointments/", headers=auth_headers, json=_appointment("First", datetime(2024, 4, 2, 9, 0), 60)).json()
+    second = client.post(
+        "/appointments/", headers=auth_headers, json=_appointment("Second", datetime(2024, 4, 2, 11, 0), 60, location="Clinic 2C")
+    ).json()
+
+    response = client.put(
+        f"/appointments/{second['id']}",
+        headers=auth_headers,
+        json={"start_time": "2024-04-02T09:30:00", "end_time": "2024-04-02T10:30:00"}
+    )
+    assert response.status_code == status.HTTP_409_CONFLICT
+
+    client.put(f"/appointments/{first['id']}", headers=auth_headers, json={"status": "cancelled"})
+    response = client.put(
+        f"/appointments/{second['id']}",
+        headers=auth_headers,
+        json={"start_time": "2024-04-02T09:30:00", "end_time": "2024-04-02T10:30:00"}
+    )
+    assert response.status_code == status.HTTP_200_OK
+
+
+def test_interval_tree_matches_brute_force():
+    """Test interval tree overlap queries against a linear scan"""
+    import random
+    from datetime import datetime, timedelta
+    from api.services.appointment_conflicts import IntervalTree
+
+    rng = random.Random(7)
+    base = datetime(2024, 1, 1)
+    intervals = {}
+    tree = IntervalTree()
+    for item_id in range(2000):
+        start = base + timedelta(minutes=rng.randrange(0, 60 * 24 * 30))
+        end = start + timedelta(minutes=rng.randrange(5, 240))
+        intervals[item_id] = (start, end)
+        tree.insert(start, end, item_id)
+    for item_id in range(0, 2000, 3):
+        tree.remove(item_id)
+        del intervals[item_id]
+
+    for _ in range(200):
+        start = base + timedelta(minutes=rng.randrange(0, 60 * 24 * 30))
+        end = start + timedelta(minutes=rng.randrange(1, 300))
+        expected = {i for i, (s, e) in intervals.items() if s < end and e > start}
+        assert {hit[0] for hit in tree.overlapping(start, end)} == expected
+
+
+def test_availability_returns_gaps_within_opening_hours(client, auth_headers):
+    """Test free windows skip bookings and closed hours"""
+    from datetime import datetime
+
+    client.post("/appointments/", headers=auth_headers, json=_appointment("Morning", datetime(2024, 5, 6, 9, 0), 60))
+    client.post("/appointments/", headers=auth_headers, json=_appointment("Afternoon", datetime(2024, 5, 6, 13, 0), 120))
+
+    response = client.get(
+        "/appointments/availability",
+        headers=auth_headers,
+        params={
+            "start": "2024-05-06T00:00:00",
+            "end": "2024-05-07T00:00:00",
+            "duration_minutes": 60,
+            "locations": ["Clinic 4A", "Clinic 2C"],
+        }
+    )
+    assert response.status_code == status.HTTP_200_OK
+    by_key = {item["key"]: item["free"] for item in response.json()}
+    assert [(w["start"][11:16], w["end"][11:16], w["slots"]) for w in by_key["Clinic 4A"]] == [
+        ("08:00", "09:00", 1), ("10:00", "13:00", 3), ("15:00", "18:00", 3)
+    ]
+    assert [(w["start"][11:16], w["end"][11:16]) for w in by_key["Clinic 2C"]] == [("08:00", "18:00")]
+
+
+def test_reminder_dispatch_is_deduplicated(db, test_user, test_patient):
+    """Test due reminders are sent once per channel and recorded in the ledger"""
+    from datetime import datetime, timedelta
+    from api.models.appointment import Appointment
+    from api.models.reminder import ReminderLedger
+    from api.services.reminder_service import StubTransport, dispatch_due_reminders
+
+    now = datetime(2024, 3, 4, 9, 0)
+    test_patient.email = "john@example.com"
+    test_patient.phone = "+15550100"
+    for offset_hours, status_value in ((2, "scheduled"), (5, "cancelled"), (30, "scheduled")):
+        start = now + timedelta(hours=offset_hours)
+        db.add(Appointment(
+            title="Visit",
+            patient_name="John Doe",
+            patient_id=test_patient.id,
+            appointment_type="Follow-up",
+            status=status_value,
+            location="Clinic 4A",
+            start_time=start,
+            end_time=start + timedelta(minutes=30),
+            created_by=test_user.id,
+        ))
+    db.commit()
+
+    transport = StubTransport()
+    stats = dispatch_due_reminders(db, hours_ahead=24, transport=transport, batch_size=1, now=now)
+    assert stats["sent"] == 2
+    assert sorted(message.channel for message in transport.sent) == ["email", "sms"]
+    assert db.query(ReminderLedger).count() == 2
+
+    rerun = StubTransport()
+    stats = dispatch_due_reminders(db, hours_ahead=24, transport=rerun, now=now)
+    assert stats["due"] == 0
+    assert rerun.sent == []
+
+
+def test_reminder_dispatch_skips_rows_claimed_by_another_run(db, test_user, test_patient):
+    """Test an overlapping run's claims are not sent again, while failed and abandoned claims are retried"""
+    from datetime import datetime, timedelta
+    from api.models.appointment import Appointment
+    from api.models.reminder import ReminderLedger
+    from api.services.reminder_service import (
+        REMINDER_CLAIM_TTL, StubTransport, _claim, _due_messages, dispatch_due_reminders,
+    )
+
+    class FailingTransport(StubTransport):
+        def send(self, message):
+            return {"success": False, "message": "provider down"}
+
+    now = datetime(2024, 3, 4, 9, 0)
+    test_patient.email = "john@example.com"
+    test_patient.phone = "+15550100"
+    start = now + timedelta(hours=2)
+    db.add(Appointment(
+        title="Visit", patient_name="John Doe", patient_id=test_patient.id, appointment_type="Follow-up",
+        status="scheduled", location="Clinic 4A", start_time=start, end_time=start + timedelta(minutes=30),
+        created_by=test_user.id,
+    ))
+    db.commit()
+
+    # Another run claims the email and is still sending it
+    email = [m for m in _due_messages(db, now, now + timedelta(hours=24)) if m.channel == "email"]
+    assert len(_claim(db, email, now)) == 1
+
+    transport = FailingTransport()
+    stats = dispatch_due_reminders(db, hours_ahead=24, transport=transport, now=now)
+    assert (stats["skipped"], stats["failed"]) == (1, 1)
+    assert [m.channel for m in transport.sent] == []
+    statuses = dict(db.query(ReminderLedger.channel, ReminderLedger.status).all())
+    assert statuses == {"email": "pending", "sms": "failed"}
+
+    # Later: the failed SMS is retried, and the email claim has expired with its run
+    later = now + REMINDER_CLAIM_TTL + timedelta(minutes=1)
+    transport = StubTransport()
+    stats = dispatch_due_reminders(db, hours_ahead=24, transport=transport, now=later)
+    assert sorted(m.channel for m in transport.sent) == ["email", "sms"]
+    db.expire_all()
+    assert set(status for (status,) in db.query(ReminderLedger.status)) == {"sent"}
+
+
+def test_calendar_sync_returns_only_changes(client, auth_headers):
+    """Test sync tokens return later updates and deletions but not unchanged appointments"""
+    import time
+    from datetime import datetime
+
+    first = client.post(
+        "/appointments/", headers=auth_headers, json=_appointment("Keep", datetime(2024, 3, 5, 9, 0))
+    ).json()
+    second = client.post(
+        "/appointments/", headers=auth_headers, json=_appointment("Drop", datetime(2024, 3, 5, 11, 0))
+    ).json()
+    # Changes made within the current clock tick are held back until the next sync
+    time.sleep(1.1)
+
+    full = client.get("/appointments/sync", headers=auth_headers).json()
+    assert sorted(item["id"] for item in full["appointments"]) == [first["id"], second["id"]]
+    assert full["deleted"] == []
+
+    unchanged = client.get("/appointments/sync", headers=auth_headers, params={"token": full["next_token"]}).json()
+    assert unchanged["appointments"] == [] and unchanged["deleted"] == []
+
+    client.put(f"/appointments/{first['id']}", headers=auth_headers, json={"title": "Kept"})
+    client.delete(f"/appointments/{second['id']}", headers=auth_headers)
+    time.sleep(1.1)
+
+    delta = client.get("/appointments/sync", headers=auth_headers, params={"token": unchanged["next_token"]}).json()
+    assert [item["title"] for item in delta["appointments"]] == ["Kept"]
+    assert delta["deleted"][0]["kind"] == "appointment"
+    assert delta["deleted"][0]["id"] == second["id"]
+
+    response = client.get("/appointments/sync", headers=auth_headers, params={"token": "not-a-token"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_calendar_feed_requires_signature_and_supports_etag(client, auth_headers, test_user):
+    """Test the iCalendar feed is signed, lists the user's events and honours If-None-Match"""
+    from datetime import datetime, timedelta
+
+    start = datetime.now().replace(microsecond=0) + timedelta(days=2)
+    client.post("/appointments/", headers=auth_headers, json=_appointment("Consult, room 2", start))
+    url = client.get("/appointments/feed-url", headers=auth_headers).json()["url"]
+
+    response = client.get(url)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"].startswith("text/calendar")
+    body = response.text
+    assert body.startswith("BEGIN:VCALENDAR\r\n")
+    assert "SUMMARY:Consult\\, room 2 (Follow-up)" in body
+    assert f"DTSTART:{start.strftime('%Y%m%dT%H%M%S')}" in body
+    assert "John Doe" not in body
+
+    cached = client.get(url, headers={"If-None-Match": response.headers["etag"]})
+    assert cached.status_code == status.HTTP_304_NOT_MODIFIED
+
+    forged = client.get(f"/appointments/feed/{test_user.id}.ics", params={"sig": "0" * 64})
+    assert forged.status_code == status.HTTP_403_FORBIDDEN
+
+
+def test_calendar_feed_url_rotation_and_inactive_user(client, db, auth_headers, test_user):
+    """Test rotating revokes the old feed URL and an inactive user's feed is refused"""
+    old_url = client.get("/appointments/feed-url", headers=auth_headers).json()["url"]
+    assert client.get(old_url).status_code == status.HTTP_200_OK
+
+    response = client.post("/appointments/feed-url/rotate", headers=auth_headers)
+    assert response.status_code == status.HTTP_200_OK
+    new_url = response.json()["url"]
+    assert new_url != old_url
+    assert client.get(old_url).status_code == status.HTTP_403_FORBIDDEN
+    assert client.get(new_url).status_code == status.HTTP_200_OK
+    assert client.get("/appointments/feed-url", headers=auth_headers).json()["url"] == new_url
+
+    test_user.is_active = False
+    db.commit()
+    assert client.get(new_url).status_code == status.HTTP_403_FORBIDDEN
+    assert client.get("/appointments/feed/999999.ics", params={"sig": "0" * 64}).status_code == status.HTTP_403_FORBIDDEN
+
+
+def test_utilization_per_location_and_day(client, auth_headers, test_user):
+    """Test utilization sums booked minutes per day and counts no-shows and cancellations"""
+    from datetime import datetime
+
+    bookings = [
+        ("A", datetime(2024, 3, 4, 9, 0), 60, "confirmed"),
+        ("B", datetime(2024, 3, 4, 11, 0), 30, "no_show"),
+        ("C", datetime(2024, 3, 4, 13, 0), 30, "cancelled"),
+        ("D", datetime(2024, 3, 5, 9, 0), 120, "confirmed"),
+    ]
+    for title, start, minutes, status_value in bookings:
+        payload = _appointment(title, start, minutes=minutes)
+        payload["status"] = status_value
+        assert client.post("/appointments/", headers=auth_headers, json=payload).status_code == 201
+
+    response = client.get(
+        "/appointments/utilization",
+        headers=auth_headers,
+        params={"start": "2024-03-04T00:00:00", "end": "2024-03-09T00:00:00", "resource": "location"},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    [room] = response.json()
+    assert room["key"] == "Clinic 4A"
+    assert room["booked_minutes"] == 210
+    assert room["no_shows"] == 1
+    assert room["cancelled"] == 1
+    # Five open weekdays of ten hours
+    assert room["open_minutes"] == 5 * 600
+    assert room["utilization_pct"] == 7.0
+    assert [(day["date"], day["booked_minutes"], day["appointments"]) for day in room["days"]] == [
+        ("2024-03-04", 90, 2),
+        ("2024-03-05", 120, 1),
+    ]
+    assert room["days"][0]["utilization_pct"] == 15.0
+
+
+def test_create_series_rejects_overlapping_series(client, auth_headers):
+    """Test a recurring series that collides with another series in the same room is rejected"""
+    def series(title, start, location="Rehab Gym"):
+        return {
+            "title": title,
+            "patient_name": "John Doe",
+            "appointment_type": "Therapy",
+            "location": location,
+            "start_time": start,
+            "duration_minutes": 45,
+            "frequency": "weekly",
+            "count": 6,
+        }
+
+    first = client.post("/appointments/series", headers=auth_headers, json=series("Physio", "2024-05-06T09:00:00"))
+    assert first.status_code == status.HTTP_201_CREATED
+
+    # Starts two weeks later at 09:30 on the same weekday: its first occurrence hits Physio's third
+    clash = client.post("/appointments/series", headers=auth_headers, json=series("Rehab", "2024-05-20T09:30:00"))
+    assert clash.status_code == status.HTTP_409_CONFLICT
+    assert {c["series_id"] for c in clash.json()["detail"]["conflicts"]} == {first.json()["id"]}
+
+    later = client.post("/appointments/series", headers=auth_headers, json=series("Rehab", "2024-05-20T10:00:00"))
+    assert later.status_code == status.HTTP_201_CREATED
+
+
+def test_conflict_trees_see_writes_from_other_processes(client, auth_headers, db):
+    """Test a booking written outside this process's sessions still blocks an overlapping one"""
+    import os
+    from datetime import datetime
+    from sqlalchemy import create_engine, text
+
+    first = client.post("/appointments/", headers=auth_headers, json=_appointment("First", datetime(2024, 6, 3, 9, 0), 30))
+    assert first.status_code == status.HTTP_201_CREATED
+
+    # Another worker: its own engine, no ORM session events in this process
+    other = create_engine(os.environ["DATABASE_URL"])
+    with other.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO appointments (title, patient_name, appointment_type, status, location,"
+            " start_time, end_time, created_by)"
+            " VALUES ('Elsewhere', 'Jane Roe', 'Follow-up', 'confirmed', 'Clinic 4A',"
+            " '2024-06-03 10:00:00.000000', '2024-06-03 11:00:00.000000', 999)"
+        ))
+    other.dispose()
+
+    overlap = client.post("/appointments/", headers=auth_headers, json=_appointment("Overlap", datetime(2024, 6, 3, 10, 15), 30))
+    assert overlap.status_code == status.HTTP_409_CONFLICT
+
+
+def test_closed_hours_follow_clinic_timezone():
+    """Test opening hours are clinic-local on a UTC timeline, including across a DST change"""
+    from datetime import datetime
+    from zoneinfo import ZoneInfo
+    import numpy as np
+    from api.services.availability import _closed_hours, _timeline
+
+    to_local, to_timeline = _timeline("postgresql", ZoneInfo("America/New_York"))
+
+    def opening_hours(day):
+        # Open stretches are the gaps between consecutive closed blocks
+        closed = _closed_hours(day, day, 8, 18, to_local, to_timeline)
+        opens = [
+            (np.datetime64(int(close), "s").astype(datetime), np.datetime64(int(reopen), "s").astype(datetime))
+            for (_, close), (reopen, _) in zip(closed[:-1], closed[1:]) if reopen > close
+        ]
+        return [(s, e) for s, e in opens if s.date() == day.date()]
+
+    # 08:00-18:00 EDT is 12:00-22:00 UTC; EST is an hour later
+    assert opening_hours(datetime(2024, 5, 6, 12)) == [(datetime(2024, 5, 6, 12), datetime(2024, 5, 6, 22))]
+    assert opening_hours(datetime(2024, 11, 4, 12)) == [(datetime(2024, 11, 4, 13), datetime(2024, 11, 4, 23))]
@@ -96,3 +96,63 @@ def test_update_patient_success(client, auth_headers, test_patient):
     assert data["last_name"] == "Updated"
     assert data["allergies"] == "Updated allergies"
 
+
+def test_patient_dashboard_aggregates_sections(client, auth_headers, test_patient, test_user, db):
+    """Test the dashboard returns demographics, notes, appointments and cached AI state together"""
+    from datetime import datetime, timedelta
+    from api.models.note import Note
+    from api.models.appointment import Appointment
+
+    db.add(Note(
+        patient_id=test_patient.id,
+        author_id=test_user.id,
+        note_type="doctor_note",
+        title="Dashboard Note",
+        content="Stable, routine follow-up",
+        summary="Routine follow-up, stable.",
+        risk_level="low"
+    ))
+    start = datetime.now() + timedelta(days=2)
+    db.add(Appointment(
+        title="Follow-up",
+        patient_name="John Doe",
+        patient_id=test_patient.id,
+        appointment_type="Follow-up",
+        location="Clinic 4A",
+        start_time=start,
+        end_time=start + timedelta(minutes=30),
+        created_by=test_user.id
+    ))
+    db.commit()
+
+    response = client.get(f"/patients/{test_patient.id}/dashboard", headers=auth_headers)
+    assert response.status_code == status.HTTP_200_OK
+    data = response.json()
+    assert data["partial"] is False
+    assert data["patient"]["medical_record_number"] == "MRN-TEST-001"
+    assert [n["title"] for n in data["recent_notes"]] == ["Dashboard Note"]
+    assert len(data["upcoming_appointments"]) == 1
+    assert data["risk"]["risk_level"] == "low"
+    assert data["summary"]["summary"] == "Routine follow-up, stable."
+
+
+def test_patient_dashboard_not_found(client, auth_headers):
+    """Test the dashboard returns 404 for an unknown patient"""
+    response = client.get("/patients/99999/dashboard", headers=auth_headers)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_patient_dashboard_hides_section_errors(client, auth_headers, test_patient, monkeypatch):
+    """Test a failing section is reported by code without leaking the exception text"""
+    from api.routes import patients
+
+    def broken(db, patient_id):
+        raise RuntimeError("SELECT * FROM notes -- /srv/app/secret.py")
+
+    monkeypatch.setattr(patients, "_load_cached_summary", broken)
+    response = client.get(f"/patients/{test_patient.id}/dashboard", headers=auth_headers)
+    assert response.status_code == status.HTTP_200_OK
+    data = response.json()
+    assert data["partial"] is True
+    assert data["errors"] == {"summary": "unavailable"}
+    assert data["patient"]["medical_record_number"] == "MRN-TEST-001"
@@ -0,0 +1,102 @@
+"""
+Cold-start tests: what importing the API process pulls in and how long it takes
+"""
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Wall-clock budget for `import api.main`, several times a local import so the test
+# runs in the default suite without flaking; override on slower CI machines
+IMPORT_BUDGET_MS = float(os.getenv("STARTUP_IMPORT_BUDGET_MS", "3000"))
+
+# Loaded on first use only; none of these may be imported by app startup
+LAZY_MODULES = ("langchain_openai", "langchain_core", "langchain_community", "faiss", "google.cloud.tasks_v2")
+
+
+def _import_app(*args):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    return subprocess.run(
+        [sys.executable, *args, "-c", "import sys, api.main; print(' '.join(sorted(sys.modules)))"],
+        cwd=ROOT, env=env, capture_output=True, text=True, timeout=120, check=True,
+    )
+
+
+def test_app_import_leaves_ai_and_gcp_sdks_unloaded():
+    """Test importing the app does not import LangChain, FAISS or the Cloud Tasks SDK"""
+    loaded = set(_import_app().stdout.split())
+    assert not [name for name in LAZY_MODULES if name in loaded]
+
+
+def test_app_import_time_within_budget():
+    """Test `python -X importtime` reports api.main under the startup budget"""
+    # Warm the bytecode cache so the measurement is of imports, not compilation
+    _import_app()
+    stderr = _import_app("-X", "importtime").stderr
+    cumulative_us = {
+        line.split("|")[2].strip(): int(line.split("|")[1])
+        for line in stderr.splitlines()
+        if line.startswith("import time:") and line.split("|")[1].strip().isdigit()
+    }
+    total_ms = cumulative_us["api.main"] / 1000
+    slowest = sorted(cumulative_us.items(), key=lambda item: -item[1])[:10]
+    assert total_ms <= IMPORT_BUDGET_MS, f"import api.main took {total_ms:.0f}ms; slowest: {slowest}"
+
+
+def test_readiness_reports_missing_schema(client, db, monkeypatch):
+    """Test /ready is 503 while a table is missing, 200 once migrated, and then stops inspecting the schema"""
+    from sqlalchemy import text
+    from api.db.migrate import migrate
+    from api.services import startup
+
+    monkeypatch.setitem(startup._state, "schema_ok", False)
+    db.execute(text("DROP TABLE reminder_ledger"))
+    db.commit()
+    response = client.get("/ready")
+    assert response.status_code == 503
+    assert "reminder_ledger" in response.json()["checks"]["schema"]
+
+    migrate(bind=db.get_bind())
+    response = client.get("/ready")
+    assert response.status_code == 200
+    assert response.json()["checks"] == {"database": "ok", "schema": "ok"}
+
+    def inspected(bind):
+        raise AssertionError("schema inspected after it passed")
+
+    monkeypatch.setattr(startup, "schema_problems", inspected)
+    assert client.get("/ready").status_code == 200
+
+
+def test_warmup_is_idempotent(client):
+    """Test /warmup builds shared state once and reports its timings"""
+    first = client.get("/warmup")
+    assert first.status_code == 200
+    assert "db_pool_ms" in first.json()["timings_ms"]
+    assert client.get("/warmup").json() == first.json()
+
+
+def test_migrate_upgrades_existing_tables(tmp_path):
+    """Test migrate adds new columns and indexes to tables that already exist, and --check sees them"""
+    from sqlalchemy import create_engine, inspect, text
+    from api.db.migrate import migrate, pending_migrations, schema_problems
+
+    old = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    migrate(old)
+    # A database from before the contact columns and appointment indexes
+    with old.begin() as connection:
+        connection.execute(text("DROP INDEX ix_appointments_location_start"))
+        connection.execute(text("ALTER TABLE patients DROP COLUMN email"))
+        connection.execute(text("DELETE FROM schema_migrations"))
+
+    problems = schema_problems(old)
+    assert "missing columns on patients: email" in problems
+    assert "missing indexes on appointments: ix_appointments_location_start" in problems
+    assert any(problem.startswith("pending migrations:") for problem in problems)
+
+    done = migrate(old)
+    assert "applied 0001_patient_contact_columns" in done
+    assert schema_problems(old) == [] and pending_migrations(old) == []
+    assert "email" in {column["name"] for column in inspect(old).get_columns("patients")}
+    assert migrate(old) == []